@@ -1,6 +1,7 @@
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 import os
+import tempfile
 
 # Import our service modules
 from services.date_converter import DateConverterService
@@ -14,6 +15,13 @@ CORS(app)  # Enable CORS for all routes
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
 OUTPUT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'downloads')
 DOWNLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'downloads')
+# Parse cache outside the source tree unless PARSE_CACHE_FOLDER points elsewhere;
+# the temp folder is shared between users on POSIX systems, so the default
+# folder is per user (the parse cache refuses folders owned by someone else)
+CACHE_FOLDER = os.environ.get('PARSE_CACHE_FOLDER') or os.path.join(
+    tempfile.gettempdir(),
+    f"unified-backend-parse-cache-{os.getuid()}" if hasattr(os, 'getuid') else 'unified-backend-parse-cache'
+)
 
 # Create folders if they don't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -22,7 +30,7 @@ os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
 
 # Initialize services
 date_converter_service = DateConverterService(UPLOAD_FOLDER, OUTPUT_FOLDER)
-file_difference_service = FileDifferenceService(UPLOAD_FOLDER)
+file_difference_service = FileDifferenceService(UPLOAD_FOLDER, CACHE_FOLDER)
 test_generator_service = TestGeneratorService(DOWNLOAD_FOLDER)
 
 # API Routes
@@ -37,10 +45,42 @@ def update_dates():
 def upload_files():
     return file_difference_service.upload_files(request)
 
+@app.route('/api/file-difference/batch', methods=['POST'])
+def batch_compare():
+    return file_difference_service.batch_compare(request)
+
 @app.route('/api/file-difference/preview', methods=['POST'])
 def preview_file():
     return file_difference_service.preview_file(request)
 
+@app.route('/api/file-difference/results/<result_id>', methods=['GET'])
+def get_comparison_result(result_id):
+    return file_difference_service.get_result(result_id)
+
+@app.route('/api/file-difference/results/<result_id>/differences', methods=['GET'])
+def get_comparison_differences(result_id):
+    return file_difference_service.get_result_differences(result_id, request)
+
+@app.route('/api/file-difference/results/<result_id>/rows', methods=['GET'])
+def get_comparison_rows(result_id):
+    return file_difference_service.get_result_rows(result_id, request)
+
+@app.route('/api/file-difference/jobs', methods=['POST'])
+def submit_comparison_job():
+    return file_difference_service.submit_job(request)
+
+@app.route('/api/file-difference/jobs/<job_id>', methods=['GET'])
+def get_comparison_job(job_id):
+    return file_difference_service.get_job(job_id)
+
+@app.route('/api/file-difference/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_comparison_job(job_id):
+    return file_difference_service.cancel_job(job_id)
+
+@app.route('/api/file-difference/jobs/<job_id>/result', methods=['GET'])
+def get_comparison_job_result(job_id):
+    return file_difference_service.get_job_result(job_id)
+
 @app.route('/api/file-difference/health', methods=['GET'])
 def health_check():
     return file_difference_service.health_check()
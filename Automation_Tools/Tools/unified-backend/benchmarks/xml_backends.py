@@ -0,0 +1,89 @@
+"""
+Compare the XML parser backends of services.xml_flatten on a generated document
+
+Writes a filing-like document with the given number of records (attributes,
+text, empty and repeated elements, one record per line), then times both the
+bare parse and flatten_xml with every installed backend and checks that they
+produce the same flattened paths, values and empty flags.
+
+Usage (from the unified-backend directory):
+    python benchmarks/xml_backends.py --records 300000 --repeat 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import xml_flatten  # noqa: E402
+
+
+def write_document(file_path, record_count):
+    """Write a document with record_count records and return its size in bytes"""
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<filing xmlns:x="urn:example">\n  <header><id>1</id><period>2024-01</period></header>\n  <rows>\n')
+        for index in range(record_count):
+            f.write(f'    <row n="{index}" x:type="{"AB"[index % 2]}"><amount currency="EUR">{index * 1.5:.2f}</amount>'
+                    f'<name>Entity {index} &amp; Co</name><note/><tag>t{index % 7}</tag><tag>u{index % 5}</tag></row>\n')
+        f.write('  </rows>\n</filing>\n')
+    return os.path.getsize(file_path)
+
+
+def best_time(function, repeat):
+    """Return the best wall time of repeat calls and the last call's result"""
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def parse_only(file_path, backend):
+    """Run the backend's iterparse over the document, discarding the elements"""
+    events = 0
+    for event, element in xml_flatten._iterparse(file_path, backend):
+        events += 1
+        if event == 'end':
+            element.clear()
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=200000, help='Records in the generated document')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per backend (the best time is reported)')
+    args = parser.parse_args()
+
+    backends = ['etree'] + (['lxml'] if xml_flatten.lxml_etree is not None else [])
+    if len(backends) == 1:
+        print("lxml is not installed; only the ElementTree backend is measured")
+
+    with tempfile.TemporaryDirectory() as folder:
+        file_path = os.path.join(folder, 'benchmark.xml')
+        size = write_document(file_path, args.records)
+        print(f"Document: {args.records} records, {size / (1024 * 1024):.1f} MB")
+
+        reference = None
+        for backend in backends:
+            parse_seconds, _ = best_time(lambda: parse_only(file_path, backend), args.repeat)
+            flatten_seconds, trie = best_time(lambda: xml_flatten.flatten_xml(file_path, backend=backend), args.repeat)
+            output = (trie.paths(), trie.values, bytes(trie.empty))
+            if reference is None:
+                reference = output
+            elif output != reference:
+                raise SystemExit(f"{backend} produced a different flattened document than {backends[0]}")
+            lines = sum(1 for line in trie.lines if line)
+            print(f"{backend:>6}: parse {parse_seconds:6.2f} s, flatten {flatten_seconds:6.2f} s "
+                  f"({len(trie) / flatten_seconds:,.0f} paths/s), {len(trie)} paths, "
+                  f"{lines} of {trie.node_count} nodes with source lines")
+        if len(backends) > 1:
+            print("Flattened output is identical for all backends")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Measure how the XML path comparison scales with the document size
+
+For every size, writes a source document of about that many nodes and a
+target with one record inserted at the top (shifting every following path)
+and every 100th value changed, then times flattening, the comparison
+(FileDifferenceService.compare_xml_files), counting the differences and
+serializing the full result. The exponent column is the slope of the
+comparison time against the node count on a log-log scale between
+consecutive sizes; 1.0 is linear.
+
+Usage (from the unified-backend directory):
+    python benchmarks/xml_scaling.py --nodes 10000 100000 1000000
+"""
+import argparse
+import contextlib
+import io
+import math
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.file_difference import FileDifferenceService  # noqa: E402
+from services.xml_flatten import flatten_xml  # noqa: E402
+
+# Nodes per record: the row element, its n attribute and the a / b children
+NODES_PER_RECORD = 4
+
+
+def write_document(file_path, record_count, changed):
+    """Write a document of record_count records, the target version when changed is set"""
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write('<filing>\n<header><id>1</id></header>\n<rows>\n')
+        if changed:
+            f.write('<row n="new"><a>inserted</a><b>record</b></row>\n')
+        for index in range(record_count):
+            text = f"changed {index}" if changed and index % 100 == 0 else f"text {index}"
+            f.write(f'<row n="{index}"><a>{index}</a><b>{text}</b></row>\n')
+        f.write('</rows>\n</filing>\n')
+
+
+def timed(function):
+    """Return the wall time of one call and its result"""
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='Approximate node counts of the source documents')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        service = FileDifferenceService(os.path.join(folder, 'uploads'), os.path.join(folder, 'cache'))
+        print(f"{'nodes':>9} {'paths':>9} {'flatten':>8} {'compare':>8} {'count':>7} {'serialize':>9} "
+              f"{'us/node':>8} {'exponent':>8}")
+        previous = None
+        for node_count in sorted(args.nodes):
+            record_count = max(node_count // NODES_PER_RECORD, 1)
+            source_path = os.path.join(folder, 'source.xml')
+            target_path = os.path.join(folder, 'target.xml')
+            write_document(source_path, record_count, changed=False)
+            write_document(target_path, record_count, changed=True)
+
+            flatten_seconds, (source, target) = timed(lambda: (flatten_xml(source_path), flatten_xml(target_path)))
+            with contextlib.redirect_stdout(io.StringIO()):
+                compare_seconds, result = timed(
+                    lambda: service.compare_xml_files({'tree': source}, {'tree': target}))
+            count_seconds, _ = timed(lambda: service._result_overview(result))
+            serialize_seconds, _ = timed(lambda: service.to_json_ready(result))
+
+            nodes = source.node_count
+            exponent = ''
+            if previous is not None:
+                exponent = f"{math.log(compare_seconds / previous[1]) / math.log(nodes / previous[0]):.2f}"
+            previous = (nodes, compare_seconds)
+            print(f"{nodes:>9} {len(source):>9} {flatten_seconds:>7.2f}s {compare_seconds:>7.2f}s "
+                  f"{count_seconds:>6.3f}s {serialize_seconds:>8.2f}s {compare_seconds / nodes * 1e6:>8.2f} "
+                  f"{exponent:>8}")
+
+
+if __name__ == '__main__':
+    main()
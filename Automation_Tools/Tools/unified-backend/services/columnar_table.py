@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+
+# Columns whose distinct values make up at most this share of the rows are
+# dictionary-encoded (stored as a Categorical: small integer codes + one copy
+# of each distinct string)
+DICTIONARY_ENCODING_RATIO = 0.5
+
+
+def _cell_text(value):
+    """Convert a parsed cell to its string form, with NaN and '' as None"""
+    if value is None or value != value or value == '':
+        return None
+    return str(value)
+
+
+def _is_numeric(values):
+    """True for integer, float, boolean and datetime numpy arrays"""
+    return isinstance(values, np.ndarray) and values.dtype.kind in 'biufM'
+
+
+def encode_column(series):
+    """
+    Convert a parsed column into a compact array
+
+    Integer, float, boolean and (time zone naive) datetime columns are kept
+    as numpy arrays (NaN / NaT marks empty cells) so they can be compared by
+    value, and are only turned into strings when rows are materialized.
+    Other columns are converted to strings / None, converting each distinct
+    value once; repetitive ones are returned as a Categorical and the rest
+    as an object array.
+    """
+    if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufM':
+        return series.to_numpy()
+
+    codes, uniques = pd.factorize(series.astype(object).to_numpy())
+    # Missing values have code -1, which picks the trailing None entry
+    labels = np.array([_cell_text(value) for value in uniques] + [None], dtype=object)
+    # Different raw values may share a string form (1 and '1'), so factorize again
+    label_codes, categories = pd.factorize(labels)
+    codes = label_codes[codes]
+
+    if len(categories) <= len(codes) * DICTIONARY_ENCODING_RATIO:
+        return pd.Categorical.from_codes(codes, categories=pd.Index(categories, dtype=object))
+
+    values = np.append(np.asarray(categories, dtype=object), None)
+    return values[codes]
+
+
+def text_values(values):
+    """Return a stored column as an object array of strings, with missing cells as None"""
+    if isinstance(values, pd.Categorical):
+        categories = np.append(values.categories.to_numpy(dtype=object), None)
+        return categories[values.codes]
+    if _is_numeric(values):
+        # Datetimes go through pandas so they format as Timestamps, not as integers
+        cells = pd.Series(values).tolist() if values.dtype.kind == 'M' else values.tolist()
+        return np.array([_cell_text(value) for value in cells], dtype=object)
+    return values
+
+
+class ColumnarTable:
+    """
+    Compact in-memory table produced by the CSV / Excel parsers: an ordered
+    column name list plus one array per column (see encode_column). Rows
+    are only materialized as dictionaries by to_rows.
+    """
+
+    def __init__(self, columns, data, row_count):
+        self.columns = list(columns)
+        self._data = data
+        self._row_count = row_count
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build a table from a parsed DataFrame"""
+        columns = df.columns.tolist()
+        data = {col: encode_column(df[col]) for col in columns}
+        return cls(columns, data, len(df))
+
+    @classmethod
+    def from_rows(cls, columns, rows):
+        """Build a table from a list of row dictionaries"""
+        if not rows:
+            return cls(columns, {col: np.empty(0, dtype=object) for col in columns}, 0)
+        return cls.from_frame(pd.DataFrame.from_records(rows, columns=columns))
+
+    def __len__(self):
+        return self._row_count
+
+    def column(self, col):
+        """Return the values of a column, or all None if the column is absent"""
+        if col in self._data:
+            return self._data[col]
+        return np.full(self._row_count, None, dtype=object)
+
+    def head(self, count):
+        """Return a new table with the first count rows"""
+        count = min(count, self._row_count)
+        data = {col: values[:count] for col, values in self._data.items()}
+        return ColumnarTable(self.columns, data, count)
+
+    def take(self, positions):
+        """Return a new table with the rows at the given positions"""
+        positions = np.asarray(positions, dtype=np.int64)
+        data = {col: values[positions] for col, values in self._data.items()}
+        return ColumnarTable(self.columns, data, len(positions))
+
+    def to_frame(self, columns=None, length=None):
+        """
+        Return the table as a DataFrame, optionally re-aligned to the given
+        columns and truncated or padded with empty rows to length rows
+        """
+        columns = self.columns if columns is None else columns
+        length = self._row_count if length is None else length
+        data = {}
+        for col in columns:
+            values = self.column(col)[:length]
+            if len(values) < length:
+                # Pad as text so numeric columns are not turned into floats by NaN
+                padding = np.full(length - len(values), None, dtype=object)
+                values = np.concatenate([text_values(values), padding])
+            data[col] = values
+        return pd.DataFrame(data, index=pd.RangeIndex(length), columns=columns)
+
+    def to_rows(self):
+        """Materialize the table as a list of row dictionaries for JSON responses"""
+        if not self.columns:
+            return [{} for _ in range(self._row_count)]
+        column_values = [text_values(self._data[col]).tolist() for col in self.columns]
+        return [dict(zip(self.columns, values)) for values in zip(*column_values)]
+
+    def memory_usage(self):
+        """Approximate number of bytes held by the column arrays"""
+        total = 0
+        for values in self._data.values():
+            if isinstance(values, pd.Categorical):
+                total += values.codes.nbytes + int(values.categories.memory_usage(deep=True))
+            elif _is_numeric(values):
+                total += values.nbytes
+            else:
+                total += int(pd.Series(values, dtype=object).memory_usage(index=False, deep=True))
+        return total
@@ -0,0 +1,749 @@
+import datetime
+import difflib
+import re
+
+import numpy as np
+import pandas as pd
+from pandas.util import hash_array
+
+# Multiplier used to fold per-column hashes into a row fingerprint (FNV-1 64-bit prime)
+FINGERPRINT_PRIME = np.uint64(1099511628211)
+# Hash given to missing cells so they fingerprint like empty strings
+EMPTY_HASH = hash_array(np.array([''], dtype=object))[0]
+# Largest integer magnitude up to which every integer is exactly representable as a float
+MAX_EXACT_FLOAT_INT = 2 ** 53
+# Text cells taken as dates: ISO 8601 dates, optionally with a time and a
+# UTC offset. Other spellings ('Mar', '1/2', '12:30', 'today') stay text, so
+# they are never compared as equal timestamps.
+ISO_DATE = re.compile(r'\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?(?:Z|[+-]\d{2}(?::?\d{2})?)?)?')
+# pandas 2 infers one date format per column and fails on the other cells
+# unless told they are ISO 8601 in any form; older versions parse every cell alone
+DATE_PARSE_OPTIONS = {'format': 'ISO8601'} if int(pd.__version__.split('.')[0]) >= 2 else {}
+# Edit distance above which align_sequences falls back from Myers' algorithm
+# to difflib's matching-block alignment
+MAX_ALIGNMENT_EDITS = 2000
+
+
+def ordered_union(source_columns, target_columns):
+    """
+    Merge two column lists, keeping source order first and appending
+    target-only columns in their own order
+    """
+    seen = set(source_columns)
+    merged = list(source_columns)
+    for col in target_columns:
+        if col not in seen:
+            seen.add(col)
+            merged.append(col)
+    return merged
+
+
+def _is_missing(value):
+    """True for None and NaN cells"""
+    return value is None or value != value
+
+
+def _normalize_value(value):
+    """Normalize a single cell: stripped string, with None / NaN / blanks as ''"""
+    if _is_missing(value):
+        return ''
+    return str(value).strip()
+
+
+def normalize_values(values):
+    """
+    Normalize a 1D array of cell values (see _normalize_value). Values are
+    factorized first so each distinct value is only normalized once.
+    """
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    # Missing values have code -1, which picks the trailing '' entry
+    normalized = np.array([_normalize_value(value) for value in uniques] + [''], dtype=object)
+    return normalized[codes]
+
+
+def _normalized_unequal(source_values, target_values):
+    """Compare two equally sized 1D arrays cell by cell after normalization"""
+    codes, _ = pd.factorize(np.concatenate([
+        normalize_values(source_values), normalize_values(target_values)
+    ]))
+    return codes[:len(source_values)] != codes[len(source_values):]
+
+
+def _value_kind(dtype):
+    """
+    Classify a column dtype as integer ('i'), float ('f'), boolean ('b'),
+    datetime ('M') or other ('O')
+    """
+    if not isinstance(dtype, np.dtype):
+        return 'O'
+    if dtype.kind == 'u':
+        return 'i'
+    return dtype.kind if dtype.kind in 'bifM' else 'O'
+
+
+def _to_numbers(values):
+    """Convert an object array to floats, with missing and non-numeric cells as NaN"""
+    return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+
+
+def _is_date_cell(value):
+    """True for datetime values and ISO 8601 date strings (see ISO_DATE)"""
+    if isinstance(value, str):
+        return ISO_DATE.fullmatch(value.strip()) is not None
+    return isinstance(value, (datetime.date, np.datetime64))
+
+
+def _to_datetimes(values, is_date=None):
+    """
+    Convert an object array to datetime64 values, with missing cells and
+    cells that are not ISO 8601 dates as NaT. The cells that are dates may
+    be passed as the boolean array is_date.
+    """
+    dates = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[ns]')
+    if is_date is None:
+        is_date = np.array([_is_date_cell(value) for value in values.tolist()], dtype=bool)
+    if not is_date.any():
+        return dates
+    cells = [value.strip() if isinstance(value, str) else value for value in values[is_date].tolist()]
+    try:
+        dates[is_date] = pd.to_datetime(pd.Series(cells, dtype=object), errors='coerce',
+                                        **DATE_PARSE_OPTIONS).to_numpy(dtype='datetime64[ns]')
+    except (TypeError, ValueError):
+        # Mixed time zones cannot be converted; the cells are compared as text
+        pass
+    return dates
+
+
+def _is_number_cell(values):
+    """Flag the cells of an object array holding parsed numbers (not strings or booleans)"""
+    return np.array([isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+                     for value in values.tolist()], dtype=bool)
+
+
+def _column_numbers(series):
+    """
+    Parse an object column as numbers, as for a CSV column read as strings
+
+    Returns:
+        ndarray: The cells as floats (blank cells as NaN), or None unless
+                 every non-blank cell is a number. Parsing stops at the
+                 first non-numeric cell, so text columns are rejected quickly.
+    """
+    categorical = isinstance(series.dtype, pd.CategoricalDtype)
+    values = series.cat.categories.to_numpy(dtype=object) if categorical else series.to_numpy(dtype=object)
+    try:
+        numbers = np.asarray(pd.to_numeric(values, errors='raise'), dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+    if categorical:
+        # Missing values have code -1, which picks the trailing NaN entry
+        numbers = np.append(numbers, np.nan)[series.cat.codes.to_numpy()]
+    return numbers
+
+
+def _column_datetimes(series):
+    """
+    Parse an object column as dates, as for a CSV column read as strings
+
+    Returns:
+        ndarray: The cells as datetime64 values (blank cells as NaT), or None
+                 unless every non-blank cell is an ISO 8601 date (see
+                 ISO_DATE). Each distinct value is checked once and the scan
+                 stops at the first other value, so text columns are
+                 rejected quickly.
+    """
+    # Most text columns are rejected by their first non-blank cell, before
+    # the column is factorized
+    for value in series:
+        if _normalize_value(value) != '':
+            if not _is_date_cell(value):
+                return None
+            break
+    codes, uniques = _factorize_column(series)
+    blank = np.zeros(len(uniques), dtype=bool)
+    for position, value in enumerate(uniques.tolist()):
+        if _is_date_cell(value):
+            continue
+        if _normalize_value(value) != '':
+            return None
+        blank[position] = True
+    dates = _to_datetimes(uniques, is_date=~blank)
+    # Dates that do not exist (2020-02-30) leave the column text
+    if blank.all() or np.isnat(dates[~blank]).any():
+        return None
+    # Missing values have code -1, which picks the trailing NaT entry
+    return np.append(dates, np.datetime64('NaT'))[codes]
+
+
+def _column_type(series):
+    """
+    Return the comparison type of a column ('number', 'datetime', 'bool' or
+    'text') and, for number columns, its cells as floats. Object columns
+    are numbers when every non-blank cell parses as one, else dates when
+    every non-blank cell is an ISO 8601 date, else text.
+    """
+    kind = _value_kind(series.dtype)
+    if kind in 'if':
+        return 'number', series.to_numpy(dtype=np.float64)
+    if kind == 'M':
+        return 'datetime', None
+    if kind == 'b':
+        return 'bool', None
+    numbers = _column_numbers(series)
+    if numbers is not None:
+        return 'number', numbers
+    if _column_datetimes(series) is not None:
+        return 'datetime', None
+    return 'text', None
+
+
+def _numbers_unequal(source_numbers, target_numbers, tolerance=None):
+    """
+    Compare two float arrays, within the absolute / relative tolerance if
+    given (as in math.isclose); two missing cells are equal
+    """
+    unequal = source_numbers != target_numbers
+    if tolerance:
+        with np.errstate(invalid='ignore'):
+            allowed = np.maximum(
+                tolerance.get('absolute', 0.0),
+                tolerance.get('relative', 0.0) * np.maximum(np.abs(source_numbers), np.abs(target_numbers))
+            )
+            unequal &= ~(np.abs(source_numbers - target_numbers) <= allowed)
+    unequal &= ~(np.isnan(source_numbers) & np.isnan(target_numbers))
+    return unequal
+
+
+def _typed_unequal(source_values, target_values, value_type, tolerance=None,
+                   source_numbers=None, target_numbers=None):
+    """
+    Compare two equally sized object arrays of the given value type
+    ('number', 'datetime' or 'text') as numbers or datetimes where both
+    cells convert to one, and as normalized strings otherwise. Cells already
+    parsed as numbers may be passed as source_numbers / target_numbers.
+    """
+    if value_type == 'datetime':
+        source_converted, target_converted = _to_datetimes(source_values), _to_datetimes(target_values)
+        converted = ~np.isnat(source_converted) & ~np.isnat(target_converted)
+    elif value_type == 'number':
+        source_converted = _to_numbers(source_values) if source_numbers is None else source_numbers
+        target_converted = _to_numbers(target_values) if target_numbers is None else target_numbers
+        converted = ~np.isnan(source_converted) & ~np.isnan(target_converted)
+    else:
+        # Text columns keep '007' and '7' apart; only cells that were parsed
+        # as numbers on both sides (mixed Excel columns) compare as numbers
+        converted = _is_number_cell(source_values) & _is_number_cell(target_values)
+        source_converted = np.full(len(source_values), np.nan)
+        target_converted = np.full(len(target_values), np.nan)
+        if converted.any():
+            source_converted[converted] = _to_numbers(source_values[converted])
+            target_converted[converted] = _to_numbers(target_values[converted])
+
+    unequal = np.empty(len(source_values), dtype=bool)
+    if value_type == 'datetime':
+        unequal[converted] = source_converted[converted] != target_converted[converted]
+    else:
+        unequal[converted] = _numbers_unequal(source_converted[converted], target_converted[converted], tolerance)
+    unequal[~converted] = _normalized_unequal(source_values[~converted], target_values[~converted])
+    return unequal
+
+
+def _pair_type(source_series, target_series):
+    """
+    Return the value type ('number', 'datetime' or 'text') the cells of two
+    columns are compared as, and for number columns their cells as floats
+    """
+    source_type, source_numbers = _column_type(source_series)
+    target_type, target_numbers = _column_type(target_series)
+    types = {source_type, target_type}
+    if 'datetime' in types:
+        return 'datetime', None, None
+    if 'number' in types and types <= {'number', 'text'}:
+        return 'number', source_numbers, target_numbers
+    return 'text', None, None
+
+
+def column_types(source_frame, target_frame):
+    """
+    Return the value type of every column pair of two frames with the same
+    column order, as mismatch_mask infers it. Comparing parts of two files
+    (chunks, differing rows) with the types of the whole files gives the
+    same result as comparing the whole files.
+    """
+    return [_pair_type(source_frame.iloc[:, position], target_frame.iloc[:, position])[0]
+            for position in range(source_frame.shape[1])]
+
+
+def _column_mismatches(source_series, target_series, tolerance=None, value_type=None, type_series=None):
+    """
+    Compare one column of two aligned frames by value type
+
+    Numeric and datetime columns are compared as native arrays without
+    converting a single cell to a string (integers and floats compare by
+    value, so 1 equals 1.0). Other columns are compared as raw objects
+    first; only the cells that differ are converted to the value type, or
+    normalized as strings. The value type is inferred from type_series (the
+    whole source / target columns the cells were taken from) when it is
+    not given, and from the compared cells without either.
+    """
+    source_kind = _value_kind(source_series.dtype)
+    target_kind = _value_kind(target_series.dtype)
+
+    if source_kind in 'if' and target_kind in 'if':
+        if tolerance or source_kind != target_kind:
+            return _numbers_unequal(source_series.to_numpy(dtype=np.float64),
+                                    target_series.to_numpy(dtype=np.float64), tolerance)
+        unequal = source_series.to_numpy() != target_series.to_numpy()
+        if source_kind == 'f':
+            unequal &= ~(source_series.isna().to_numpy() & target_series.isna().to_numpy())
+        return unequal
+    if source_kind == target_kind and source_kind in 'bM':
+        unequal = source_series.to_numpy() != target_series.to_numpy()
+        if source_kind == 'M':
+            unequal &= ~(source_series.isna().to_numpy() & target_series.isna().to_numpy())
+        return unequal
+
+    source_values = source_series.to_numpy(dtype=object)
+    target_values = target_series.to_numpy(dtype=object)
+    if source_kind == target_kind:
+        unequal = np.asarray(source_values != target_values, dtype=bool)
+        # None / NaN on both sides
+        positions = np.flatnonzero(unequal)
+        unequal[positions[pd.isna(source_values[positions]) & pd.isna(target_values[positions])]] = False
+    else:
+        # True == 1 although 'True' != '1': columns holding different kinds
+        # of values always go through the typed comparison
+        unequal = np.ones(len(source_values), dtype=bool)
+
+    positions = np.flatnonzero(unequal)
+    if len(positions) == 0:
+        return unequal
+
+    source_numbers = target_numbers = None
+    if value_type is None and type_series is None:
+        value_type, source_numbers, target_numbers = _pair_type(source_series, target_series)
+    elif value_type is None:
+        value_type = _pair_type(*type_series)[0]
+    unequal[positions] = _typed_unequal(
+        source_values[positions], target_values[positions], value_type, tolerance,
+        source_numbers=None if source_numbers is None else source_numbers[positions],
+        target_numbers=None if target_numbers is None else target_numbers[positions]
+    )
+    return unequal
+
+
+def mismatch_mask(source_frame, target_frame, tolerance=None, column_types=None, type_frames=None):
+    """
+    Return a 2D boolean array (rows x columns) that is True wherever the
+    source and target cells differ. Both frames must share the same shape
+    and column order.
+
+    Every column pair is compared by value type (see _column_mismatches):
+    numbers as numbers, within the optional tolerance, datetimes as
+    datetimes and everything else as stripped strings with missing cells
+    as ''.
+
+    Args:
+        source_frame (DataFrame): Source cells
+        target_frame (DataFrame): Target cells
+        tolerance (dict): Optional 'absolute' / 'relative' tolerance for numbers
+        column_types (list): Optional value type per column (see column_types)
+        type_frames (tuple): Optional (source, target) frames the compared rows
+                             were taken from, to infer the value types from
+                             when column_types is not given
+
+    Returns:
+        ndarray: Boolean mismatch mask
+    """
+    mask = np.zeros(source_frame.shape, dtype=bool)
+    if source_frame.size == 0:
+        return mask
+    for position in range(source_frame.shape[1]):
+        type_series = None
+        if type_frames is not None:
+            type_series = (type_frames[0].iloc[:, position], type_frames[1].iloc[:, position])
+        mask[:, position] = _column_mismatches(
+            source_frame.iloc[:, position], target_frame.iloc[:, position], tolerance,
+            value_type=None if column_types is None else column_types[position], type_series=type_series
+        )
+    return mask
+
+
+def _factorize_column(series):
+    """
+    Return (codes, distinct values) for a column, reusing the dictionary
+    encoding of categorical columns. Missing values get code -1.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy(), series.cat.categories.to_numpy(dtype=object)
+    return pd.factorize(series.to_numpy())
+
+
+def _column_hashes(series):
+    """
+    Hash every cell of a column by its value. Numeric and datetime columns
+    are hashed by value directly, integers exactly representable as floats
+    like the equal float (so 1 and 1.0 hash alike); other columns are hashed
+    by their normalized text. Missing cells hash like the empty string.
+    """
+    values = series.to_numpy() if _value_kind(series.dtype) != 'O' else None
+    if values is not None and values.dtype.kind in 'iu':
+        column_hashes = hash_array(values.astype(np.float64))
+        inexact = np.abs(values) > MAX_EXACT_FLOAT_INT
+        if inexact.any():
+            column_hashes[inexact] = hash_array(values[inexact])
+        return column_hashes
+    if values is not None and values.dtype.kind in 'bfM':
+        column_hashes = hash_array(values)
+        if values.dtype.kind == 'f':
+            column_hashes[np.isnan(values)] = EMPTY_HASH
+        elif values.dtype.kind == 'M':
+            column_hashes[np.isnat(values)] = EMPTY_HASH
+        return column_hashes
+
+    codes, uniques = _factorize_column(series)
+    # Missing values have code -1, which picks the trailing '' entry
+    normalized = np.array(
+        [value.strip() if isinstance(value, str) else _normalize_value(value) for value in uniques] + [''],
+        dtype=object
+    )
+    return hash_array(normalized)[codes]
+
+
+def row_fingerprints(frame):
+    """
+    Return a 64-bit digest per row computed over the normalized cell values
+
+    Each column is factorized (or its dictionary encoding reused) so that
+    only its distinct values are normalized and hashed; the per-column
+    hashes are then folded together in column order with vectorized
+    integer arithmetic.
+    """
+    fingerprints = np.zeros(len(frame), dtype=np.uint64)
+    for col in frame.columns:
+        fingerprints = (fingerprints * FINGERPRINT_PRIME) ^ _column_hashes(frame[col])
+    return fingerprints
+
+
+def _key_text(value):
+    """
+    Normalize a key cell like _normalize_value, writing integral floats as
+    integers (1.0 as '1')
+    """
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    return _normalize_value(value)
+
+
+def key_tuples(frame, key_columns):
+    """
+    Return one tuple of normalized key values per row of the frame. Keys are
+    normalized by value, so a key column read as floats (one blank cell is
+    enough) matches the same keys read as integers. Each distinct value is
+    only normalized once.
+    """
+    normalized = []
+    for col in key_columns:
+        codes, uniques = pd.factorize(frame[col].to_numpy(dtype=object))
+        # Missing values have code -1, which picks the trailing '' entry
+        keys = np.array([_key_text(value) for value in uniques] + [''], dtype=object)
+        normalized.append(keys[codes])
+    return list(zip(*normalized))
+
+
+def match_rows_by_key(source_keys, target_keys):
+    """
+    Pair source and target rows by key using a hash index built on the target
+
+    Rows sharing a duplicated key are paired in order of occurrence (first
+    with first, second with second, ...); any surplus occurrences are left
+    unmatched.
+
+    Args:
+        source_keys (list): Key tuple for each source row
+        target_keys (list): Key tuple for each target row
+
+    Returns:
+        dict: 'sourcePositions' / 'targetPositions' (paired row positions),
+              'sourceOnly' / 'targetOnly' (unmatched row positions) and
+              'duplicateKeys' (key -> [source count, target count])
+    """
+    target_index = {}
+    for position, key in enumerate(target_keys):
+        target_index.setdefault(key, []).append(position)
+
+    source_counts = {}
+    source_positions = []
+    target_positions = []
+    source_only = []
+    target_matched = np.zeros(len(target_keys), dtype=bool)
+
+    for position, key in enumerate(source_keys):
+        occurrence = source_counts.get(key, 0)
+        source_counts[key] = occurrence + 1
+        candidates = target_index.get(key)
+        if candidates is not None and occurrence < len(candidates):
+            source_positions.append(position)
+            target_positions.append(candidates[occurrence])
+            target_matched[candidates[occurrence]] = True
+        else:
+            source_only.append(position)
+
+    duplicate_keys = {}
+    for key, count in source_counts.items():
+        if count > 1:
+            duplicate_keys[key] = [count, len(target_index.get(key, []))]
+    for key, positions in target_index.items():
+        if len(positions) > 1 and key not in duplicate_keys:
+            duplicate_keys[key] = [source_counts.get(key, 0), len(positions)]
+
+    return {
+        'sourcePositions': np.array(source_positions, dtype=np.int64),
+        'targetPositions': np.array(target_positions, dtype=np.int64),
+        'sourceOnly': source_only,
+        'targetOnly': np.flatnonzero(~target_matched).tolist(),
+        'duplicateKeys': duplicate_keys
+    }
+
+
+def count_by_column(mask, columns, counts=None):
+    """
+    Add the number of differing cells per column of a mismatch mask to
+    counts (column -> count, only columns with differences) and return it
+    """
+    counts = {} if counts is None else counts
+    if mask.size == 0:
+        return counts
+    for column, count in zip(columns, mask.sum(axis=0).tolist()):
+        if count:
+            counts[column] = counts.get(column, 0) + count
+    return counts
+
+
+def _pick_cells(frame, row_positions, col_positions):
+    """Gather the cells at the given positions column by column, without converting the whole frame"""
+    values = np.empty(len(row_positions), dtype=object)
+    for position in np.unique(col_positions):
+        selected = col_positions == position
+        values[selected] = frame.iloc[:, position].to_numpy(dtype=object)[row_positions[selected]]
+    return values
+
+
+def _text_values(values):
+    """Return cell values as strings, with missing cells as None"""
+    return [None if _is_missing(value) else str(value) for value in values.tolist()]
+
+
+def collect_differences(mask, source_frame, target_frame, columns, row_labels=None, target_row_labels=None,
+                        limit=None):
+    """
+    Turn a mismatch mask into the list of difference entries used in the
+    comparison result, in row-major order
+
+    Args:
+        mask (ndarray): Boolean mismatch mask (rows x columns)
+        source_frame (DataFrame): Raw (un-normalized) source values
+        target_frame (DataFrame): Raw (un-normalized) target values
+        columns (list): Column names matching the mask's columns
+        row_labels (sequence): Optional row index to report for each mask row
+        target_row_labels (sequence): Optional target row index to report as
+            'targetRowIndex' for each mask row
+        limit (int): Optional maximum number of differences to return
+
+    Returns:
+        list: Difference dictionaries with rowIndex, column, sourceValue and targetValue
+    """
+    row_positions, col_positions = np.nonzero(mask)
+    if limit is not None:
+        row_positions, col_positions = row_positions[:limit], col_positions[:limit]
+    if len(row_positions) == 0:
+        return []
+
+    # Only the differing cells are pulled out of the raw frames
+    source_values = _pick_cells(source_frame, row_positions, col_positions)
+    target_values = _pick_cells(target_frame, row_positions, col_positions)
+
+    if row_labels is None:
+        row_indexes = row_positions.tolist()
+    else:
+        row_indexes = np.asarray(row_labels)[row_positions].tolist()
+    column_names = np.array(columns, dtype=object)[col_positions].tolist()
+
+    differences = [
+        {
+            'rowIndex': row_index,
+            'column': column,
+            'sourceValue': source_value,
+            'targetValue': target_value
+        }
+        for row_index, column, source_value, target_value in zip(
+            row_indexes, column_names, _text_values(source_values), _text_values(target_values)
+        )
+    ]
+
+    if target_row_labels is not None:
+        target_indexes = np.asarray(target_row_labels)[row_positions].tolist()
+        for difference, target_index in zip(differences, target_indexes):
+            difference['targetRowIndex'] = target_index
+
+    return differences
+
+
+def _common_run(a, b, x, y):
+    """
+    Return the length of the common run of a[x:] and b[y:], comparing
+    blocks of doubling size so that long runs are scanned vectorially
+    """
+    limit = min(len(a) - x, len(b) - y)
+    length = 0
+    step = 16
+    while length < limit:
+        size = min(step, limit - length)
+        equal = a[x + length:x + length + size] == b[y + length:y + length + size]
+        if not equal.all():
+            return length + int(np.argmin(equal))
+        length += size
+        step = min(step * 2, 65536)
+    return limit
+
+
+def _myers_opcodes(a, b, max_edits):
+    """
+    Align two arrays with Myers' O(ND) greedy algorithm
+
+    Returns:
+        list: (tag, i1, i2, j1, j2) opcodes with tags 'equal', 'delete' and
+              'insert', or None when more than max_edits edits are needed
+    """
+    n, m = len(a), len(b)
+    max_d = min(n + m, max_edits)
+    offset = max_d + 1
+    v = [0] * (2 * max_d + 3)  # furthest x reached on each diagonal k = x - y
+    trace = []
+    for d in range(max_d + 1):
+        trace.append(v[offset - d - 1:offset + d + 2])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            if x < n and y < m and a[x] == b[y]:
+                x += _common_run(a, b, x, y)
+            v[offset + k] = x
+            if x >= n and x - k >= m:
+                return _backtrack(trace, n, m)
+    return None
+
+
+def _backtrack(trace, n, m):
+    """Turn the diagonal trace of _myers_opcodes into merged opcodes"""
+    opcodes = []
+    x, y = n, m
+    for d in range(len(trace) - 1, -1, -1):
+        # trace[d] holds diagonals -d - 1 .. d + 1 as they were before step d
+        v = trace[d]
+        k = x - y
+        if d == 0:
+            previous_x, previous_y = 0, 0
+            middle_x, middle_y = 0, 0
+        else:
+            if k == -d or (k != d and v[k - 1 + d + 1] < v[k + 1 + d + 1]):
+                previous_k = k + 1
+                previous_x = v[previous_k + d + 1]
+                previous_y = previous_x - previous_k
+                middle_x, middle_y = previous_x, previous_y + 1
+                edit = ('insert', previous_x, previous_x, previous_y, previous_y + 1)
+            else:
+                previous_k = k - 1
+                previous_x = v[previous_k + d + 1]
+                previous_y = previous_x - previous_k
+                middle_x, middle_y = previous_x + 1, previous_y
+                edit = ('delete', previous_x, previous_x + 1, previous_y, previous_y)
+        if x > middle_x:
+            opcodes.append(('equal', middle_x, x, middle_y, y))
+        if d > 0:
+            opcodes.append(edit)
+        x, y = previous_x, previous_y
+    opcodes.reverse()
+
+    merged = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if merged and merged[-1][0] == tag:
+            merged[-1] = (tag, merged[-1][1], i2, merged[-1][3], j2)
+        else:
+            merged.append((tag, i1, i2, j1, j2))
+    return merged
+
+
+def align_sequences(source_hashes, target_hashes, max_edits=MAX_ALIGNMENT_EDITS):
+    """
+    Align two sequences of row hashes, detecting inserted and deleted rows
+
+    The common prefix and suffix are stripped vectorially; the rest is
+    aligned with Myers' O(ND) algorithm, which is near-linear when few rows
+    were inserted or deleted. When more than max_edits edits are needed,
+    difflib's matching-block alignment is used instead.
+
+    Returns:
+        list: difflib-style (tag, i1, i2, j1, j2) opcodes, where adjacent
+              deletions and insertions are merged into 'replace' blocks
+    """
+    a = np.asarray(source_hashes)
+    b = np.asarray(target_hashes)
+    prefix = _common_run(a, b, 0, 0)
+    suffix = _common_run(a[prefix:][::-1], b[prefix:][::-1], 0, 0)
+    a_middle = a[prefix:len(a) - suffix]
+    b_middle = b[prefix:len(b) - suffix]
+
+    middle = _myers_opcodes(a_middle, b_middle, max_edits)
+    if middle is None:
+        matcher = difflib.SequenceMatcher(None, a_middle.tolist(), b_middle.tolist(), autojunk=False)
+        middle = matcher.get_opcodes()
+
+    opcodes = []
+    if prefix:
+        opcodes.append(('equal', 0, prefix, 0, prefix))
+    for tag, i1, i2, j1, j2 in middle:
+        if i1 == i2 and j1 == j2:
+            continue
+        if tag != 'equal':
+            tag = 'delete' if j1 == j2 else 'insert' if i1 == i2 else 'replace'
+        opcode = (tag, i1 + prefix, i2 + prefix, j1 + prefix, j2 + prefix)
+        if opcodes and opcodes[-1][0] != 'equal' and tag != 'equal':
+            # Adjacent deletions and insertions form one replace block
+            last = opcodes[-1]
+            opcode = ('replace', last[1], opcode[2], last[3], opcode[4])
+            opcodes[-1] = opcode
+        else:
+            opcodes.append(opcode)
+    if suffix:
+        opcodes.append(('equal', len(a) - suffix, len(a), len(b) - suffix, len(b)))
+    return opcodes
+
+
+def pair_aligned_rows(opcodes):
+    """
+    Pair the rows of an alignment: equal rows, and the rows of replace
+    blocks in order (first with first, ...) as modified pairs; surplus rows
+    of replace blocks and deleted / inserted rows stay unpaired
+
+    Returns:
+        dict: 'equalSource' / 'equalTarget' and 'modifiedSource' /
+              'modifiedTarget' (paired row positions), 'sourceOnly' /
+              'targetOnly' (unpaired row positions)
+    """
+    pairs = {key: [] for key in ('equalSource', 'equalTarget', 'modifiedSource', 'modifiedTarget',
+                                 'sourceOnly', 'targetOnly')}
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal':
+            pairs['equalSource'].append(np.arange(i1, i2))
+            pairs['equalTarget'].append(np.arange(j1, j2))
+            continue
+        paired = min(i2 - i1, j2 - j1)
+        pairs['modifiedSource'].append(np.arange(i1, i1 + paired))
+        pairs['modifiedTarget'].append(np.arange(j1, j1 + paired))
+        pairs['sourceOnly'].append(np.arange(i1 + paired, i2))
+        pairs['targetOnly'].append(np.arange(j1 + paired, j2))
+    return {key: np.concatenate(parts).astype(np.int64) if parts else np.zeros(0, dtype=np.int64)
+            for key, parts in pairs.items()}
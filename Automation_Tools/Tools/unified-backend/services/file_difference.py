@@ -1,15 +1,82 @@
+import io
 import os
+import atexit
+import threading
+import json
+import shutil
+import uuid
+import tempfile
+import zipfile
+import hashlib
+import itertools
+import multiprocessing
+import numpy as np
 import pandas as pd
 import xml.etree.ElementTree as ET
 from flask import jsonify
 from werkzeug.utils import secure_filename
-import difflib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from services import diff_engine, sort_merge, xml_diff
+from services.columnar_table import ColumnarTable
+from services.result_store import ResultStore
+from services.parse_cache import ParseCache
+from services.xml_flatten import default_backend, flatten_xml, iter_xml_paths, resolve_relative_path
+from services.excel_reader import ExcelReader, SheetNotFoundError
+from services.job_queue import JobQueue, JobCancelled
+
+
+class ComparisonRequestError(ValueError):
+    """Raised when the options of a comparison request do not fit the uploaded files"""
+
 
 class FileDifferenceService:
-    def __init__(self, upload_folder):
+    def __init__(self, upload_folder, cache_folder=None):
         self.upload_folder = upload_folder
         os.makedirs(self.upload_folder, exist_ok=True)
+        self.parse_cache = ParseCache(cache_folder or os.path.join(upload_folder, 'parse_cache'))
+        self.copy_block_size = 1024 * 1024
         self.allowed_extensions = {'csv', 'xml', 'xlsx'}
+        self.max_warnings = 100
+        self.default_chunk_size = 100000
+        self.default_max_differences = 100000
+        # Rows from the head of both files that decide the column types of a
+        # streaming comparison, whatever its chunk size
+        self.type_sample_rows = 10000
+        # Example differences kept by summary-only comparisons
+        self.summary_example_count = 10
+        self.sort_memory_budget = 512 * 1024 * 1024
+        # Paginated and job results are kept for paging, up to about 1 GB
+        self.result_store = ResultStore(max_bytes=1024 * 1024 * 1024)
+        # Approximate size of one difference / row entry of a stored result
+        self.result_entry_bytes = 512
+        self.job_queue = JobQueue(max_workers=2)
+        self.default_page_size = 100
+        self.max_page_size = 1000
+        self.preview_row_count = 10
+        self.preview_path_count = 100
+        # Largest XML file whose original lines are kept in the parsed data
+        self.xml_original_lines_max_bytes = 16 * 1024 * 1024
+        # XML parser: 'lxml' when installed (reports source lines), else 'etree'
+        self.xml_backend = default_backend()
+        self.max_workers = os.cpu_count() or 1
+        # Combined input size from which files are parsed / compared in worker
+        # processes; below it sending the work and its result between
+        # processes costs more than it saves
+        self.concurrent_parse_min_bytes = 16 * 1024 * 1024
+        # Pool of worker processes shared by all comparisons, started on first use
+        self._worker_executor = None
+        self._worker_lock = threading.Lock()
+        # Rows an in-memory comparison compares between two progress reports
+        # (a cancelled job stops at the next report)
+        self.progress_block_rows = 100000
+        # Per-entry result list and entry name key of grouped (workbook / batch) results
+        self.group_keys = {'workbook': ('sheets', 'sheet'), 'batch': ('pairs', 'file')}
+        # Result keys left out of paginated responses; XML paths ('columns')
+        # are paged through the differences endpoint like other details
+        self.detail_keys = {'sourceData', 'targetData', 'differences', 'rows', 'sourceOnly', 'targetOnly',
+                            'originalSourceLines', 'columns'}
     
     def allowed_file(self, filename):
         return '.' in filename and filename.rsplit('.', 1)[1].lower() in self.allowed_extensions
@@ -17,53 +84,335 @@ class FileDifferenceService:
     def get_file_type(self, filename):
         return filename.rsplit('.', 1)[1].lower()
     
-    def process_file(self, file_path, file_type):
+    def parse_column_list(self, value):
+        """
+        Parse a list of column names sent as a form field, either as a JSON
+        array or as a comma-separated string
+        """
+        if not value:
+            return []
+        value = value.strip()
+        if value.startswith('['):
+            return [str(col) for col in json.loads(value)]
+        return [col.strip() for col in value.split(',') if col.strip()]
+    
+    def parse_tolerance(self, form):
+        """
+        Read the numeric comparison tolerance from the absTolerance /
+        relTolerance form fields
+        
+        Returns:
+            dict: 'absolute' / 'relative' tolerance, or None when neither is set
+            
+        Raises:
+            ValueError: When a tolerance is not a non-negative number
+        """
+        tolerance = {}
+        for field, name in (('absTolerance', 'absolute'), ('relTolerance', 'relative')):
+            value = form.get(field)
+            if not value:
+                continue
+            try:
+                tolerance[name] = float(value)
+            except ValueError:
+                tolerance[name] = None
+            if tolerance[name] is None or not tolerance[name] >= 0:
+                raise ValueError(f"{field} must be a non-negative number")
+        return tolerance or None
+    
+    def parse_column_selection(self, form, key_columns=None):
+        """
+        Read the columns to compare from the columns / ignoreColumns form
+        fields; key columns are always kept
+        
+        Returns:
+            tuple: (columns, ignore_columns), each a list or None when not given
+            
+        Raises:
+            ValueError: When a key column is ignored
+        """
+        columns = self.parse_column_list(form.get('columns'))
+        ignore_columns = self.parse_column_list(form.get('ignoreColumns'))
+        ignored_keys = [col for col in key_columns or [] if col in ignore_columns]
+        if ignored_keys:
+            raise ValueError(f"Key columns cannot be ignored: {', '.join(ignored_keys)}")
+        if columns:
+            columns.extend(col for col in key_columns or [] if col not in columns)
+        return columns or None, ignore_columns or None
+    
+    def column_selector(self, columns=None, ignore_columns=None):
+        """
+        Build a usecols predicate for the CSV / Excel parsers keeping the
+        listed columns (default all) minus the ignored ones
+        
+        Returns:
+            callable: Predicate on a column name, or None when every column is kept
+        """
+        if not columns and not ignore_columns:
+            return None
+        included = {str(col) for col in columns or []}
+        ignored = {str(col) for col in ignore_columns or []}
+        return lambda col: (not included or str(col) in included) and str(col) not in ignored
+    
+    def save_upload(self, file, file_path):
+        """
+        Save an uploaded file and return the SHA-256 hex digest of its content,
+        computed while the file is written
+        """
+        return self._copy_stream(file.stream, file_path)
+    
+    def _copy_stream(self, stream, file_path):
+        """Copy a binary stream to a file and return the SHA-256 hex digest of its content"""
+        digest = hashlib.sha256()
+        with open(file_path, 'wb') as out:
+            while True:
+                block = stream.read(self.copy_block_size)
+                if not block:
+                    break
+                digest.update(block)
+                out.write(block)
+        return digest.hexdigest()
+    
+    def process_file(self, file_path, file_type, content_hash=None, options=None, progress=None):
         """
         Process a file based on its type and return the data
+        
+        When content_hash (SHA-256 of the file content) is given, the parsed
+        data is looked up in and stored to the parse cache.
+        
+        Args:
+            file_path (str): Path to the file
+            file_type (str): Type of the file ('csv', 'xlsx' or 'xml')
+            content_hash (str): Optional SHA-256 hex digest of the file content
+            options (dict): Optional parser options ('sheet' for XLSX, and
+                            'columns' / 'ignore_columns' selecting the CSV/XLSX
+                            columns to read)
+            progress (callable): Optional progress callback, told the bytes
+                                 (XLSX: rows) parsed so far
+        """
+        options = self._parser_options(file_type, options)
+        if content_hash is None:
+            return self._parse_file(file_path, file_type, options, progress=progress)
+        
+        cache_key = self.parse_cache.make_key(content_hash, file_type, options)
+        data = self.parse_cache.get(cache_key)
+        if data is not None:
+            print(f"Parse cache hit for {file_path}")
+            return data
+        
+        data = self._parse_file(file_path, file_type, options, progress=progress)
+        self.parse_cache.put(cache_key, data)
+        return data
+    
+    def process_pair(self, source_path, target_path, file_type, source_hash=None, target_hash=None,
+                     source_options=None, target_options=None, progress=None):
+        """
+        Process the source and target files of a comparison
+        
+        When neither file is in the parse cache, the files are large enough
+        and more than one CPU is available, the source is parsed in a worker
+        process while this process parses the target. The worker stores its
+        result in the parse cache, from which it is loaded here.
+        
+        Args:
+            source_path (str): Path to the source file
+            target_path (str): Path to the target file
+            file_type (str): Type of both files ('csv', 'xlsx' or 'xml')
+            source_hash (str): Optional SHA-256 hex digest of the source content
+            target_hash (str): Optional SHA-256 hex digest of the target content
+            source_options (dict): Optional parser options of the source
+            target_options (dict): Optional parser options of the target
+            progress (callable): Optional progress callback, told the parsing
+                                 stage and the bytes (XLSX: rows) parsed
+            
+        Returns:
+            tuple: (source data, target data) as returned by process_file
+        """
+        concurrent = (
+            self.max_workers > 1 and source_hash is not None and target_hash is not None
+            and os.path.getsize(source_path) + os.path.getsize(target_path) >= self.concurrent_parse_min_bytes
+            and not self._is_cached(source_hash, file_type, source_options)
+            and not self._is_cached(target_hash, file_type, target_options)
+        )
+        if not concurrent:
+            self._report_parsing(progress, 'parsing source', source_path, file_type)
+            source_data = self.process_file(source_path, file_type, content_hash=source_hash, options=source_options,
+                                            progress=progress)
+            self._report_parsing(progress, 'parsing target', target_path, file_type)
+            target_data = self.process_file(target_path, file_type, content_hash=target_hash, options=target_options,
+                                            progress=progress)
+            return source_data, target_data
+        
+        # Only the target, parsed here, reports its progress
+        self._report_parsing(progress, 'parsing files', target_path, file_type)
+        print(f"Parsing {source_path} and {target_path} concurrently")
+        future = self._submit_to_workers('_parse_to_cache', source_path, file_type, source_hash, source_options)
+        try:
+            target_data = self.process_file(target_path, file_type, content_hash=target_hash, options=target_options,
+                                            progress=progress)
+        except JobCancelled:
+            future.cancel()
+            raise
+        source_data = future.result()
+        if source_data is None:
+            source_data = self.process_file(source_path, file_type, content_hash=source_hash, options=source_options)
+        return source_data, target_data
+    
+    def _report_parsing(self, progress, stage, file_path, file_type):
+        """Report the start of parsing a file: XLSX files count rows, others bytes"""
+        if file_type == 'xlsx':
+            self._report(progress, stage=stage, processed=0, unit='rows')
+        else:
+            self._report(progress, stage=stage, processed=0, total=os.path.getsize(file_path), unit='bytes')
+    
+    def _parser_options(self, file_type, options):
+        """
+        Drop unset parser options; XML files get the parser backend, which
+        is part of the cache key since only lxml reports source lines
+        """
+        options = {key: value for key, value in (options or {}).items() if value is not None}
+        if file_type == 'xml':
+            options.setdefault('backend', self.xml_backend)
+        return options
+    
+    def _worker_pool(self):
+        """
+        Return the pool of comparison worker processes (at most max_workers),
+        starting it on first use. The pool is kept for the lifetime of the
+        service, as starting a worker and importing pandas in it takes longer
+        than many comparisons, and is shut down when the process exits.
+        Workers are spawned rather than forked: the pool is started from job
+        queue and request threads, and a child forked while another thread
+        holds a lock can deadlock.
+        """
+        with self._worker_lock:
+            if self._worker_executor is None:
+                self._worker_executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker, initargs=(self.upload_folder, self.parse_cache.cache_folder)
+                )
+                atexit.register(self.shutdown_workers)
+            return self._worker_executor
+    
+    def _submit_to_workers(self, method_name, *args):
+        """
+        Call a FileDifferenceService method in the worker pool and return its
+        future; a pool broken by a dying worker is replaced by a new one
+        """
+        executor = self._worker_pool()
+        try:
+            return executor.submit(_run_in_worker, method_name, *args)
+        except BrokenProcessPool:
+            print("Worker pool is broken, starting a new one")
+            with self._worker_lock:
+                if self._worker_executor is executor:
+                    self._worker_executor = None
+            executor.shutdown(wait=False)
+            return self._worker_pool().submit(_run_in_worker, method_name, *args)
+    
+    def shutdown_workers(self):
+        """Stop the worker pool, waiting for running comparisons to finish"""
+        with self._worker_lock:
+            executor, self._worker_executor = self._worker_executor, None
+        if executor is not None:
+            atexit.unregister(self.shutdown_workers)
+            executor.shutdown(wait=True)
+    
+    def _is_cached(self, content_hash, file_type, options):
+        """Return True when the parse cache holds an entry for the content and options"""
+        options = self._parser_options(file_type, options)
+        return self.parse_cache.contains(self.parse_cache.make_key(content_hash, file_type, options))
+    
+    def _parse_to_cache(self, file_path, file_type, content_hash, options):
+        """
+        Parse a file into the parse cache (in a worker process); the parsed
+        data is only returned when it could not be cached
         """
+        data = self.process_file(file_path, file_type, content_hash=content_hash, options=options)
+        if self._is_cached(content_hash, file_type, options):
+            return None
+        return data
+    
+    def _parse_file(self, file_path, file_type, options, progress=None):
+        """Parse a file with the parser matching its type"""
+        usecols = self.column_selector(options.get('columns'), options.get('ignore_columns'))
         if file_type == 'csv':
-            return self._process_csv(file_path)
+            return self._process_csv(file_path, usecols=usecols, progress=progress)
         elif file_type == 'xlsx':
-            return self._process_excel(file_path)
+            return self._process_excel(file_path, sheet=options.get('sheet'), usecols=usecols, progress=progress)
         elif file_type == 'xml':
-            return self._process_xml(file_path)
+            return self._process_xml(file_path, backend=options.get('backend'), progress=progress)
         else:
             raise ValueError(f"Unsupported file type: {file_type}")
     
-    def _process_csv(self, file_path):
-        """Process a CSV file and return its data"""
+    def _open_for_parsing(self, file_path, progress=None):
+        """
+        Open a file for a parser in binary mode; with a progress callback the
+        bytes read so far are reported every copy_block_size bytes
+        """
+        if progress is None:
+            return open(file_path, 'rb')
+        return io.BufferedReader(_ProgressReader(open(file_path, 'rb'), self.copy_block_size,
+                                                 lambda count: self._report(progress, processed=count)))
+    
+    def get_table(self, data):
+        """
+        Return parsed CSV/XLSX data as a ColumnarTable, wrapping data that
+        only carries a list of row dictionaries
+        """
+        if 'table' in data:
+            return data['table']
+        return ColumnarTable.from_rows(data.get('columns', []), data.get('rows', []))
+    
+    def to_json_ready(self, result):
+        """
+        Convert ColumnarTable values in a result into lists of row dictionaries
+        (a parsed file's 'table' becomes 'rows') and XML path comparisons into
+        their row of cells, plus the source paths in order as 'columns', so
+        the result can be serialized
+        """
+        ready = {}
+        for key, value in result.items():
+            if isinstance(value, ColumnarTable):
+                ready['rows' if key == 'table' else key] = value.to_rows()
+            elif isinstance(value, xml_diff.XmlPathComparison):
+                # Path strings are only built here, for a full response
+                paths = value.paths()
+                ready['columns'] = paths[:len(value.source)]
+                ready[key] = value.to_rows(paths)
+            elif key in ('sheets', 'pairs'):
+                # Per-sheet / per-file results of a workbook or batch comparison
+                ready[key] = [self.to_json_ready(entry) for entry in value]
+            else:
+                ready[key] = value
+        return ready
+    
+    def _process_csv(self, file_path, usecols=None, progress=None):
+        """
+        Process a CSV file, reading only the columns passing usecols (default
+        all), and return its data; the optional progress callback is told
+        the bytes read
+        """
         try:
             # Read CSV file and handle potential errors
-            df = pd.read_csv(file_path)
+            with self._open_for_parsing(file_path, progress) as f:
+                df = pd.read_csv(f, usecols=usecols)
             
             # Drop unnamed columns (these are often empty columns)
             unnamed_cols = [col for col in df.columns if 'Unnamed:' in str(col)]
             if unnamed_cols:
                 df = df.drop(columns=unnamed_cols)
             
-            # Handle potential NaN values and convert to appropriate types
-            df = df.fillna('')
-            
-            # Convert DataFrame to a standardized format
-            columns = df.columns.tolist()
-            
-            # Convert rows to list of dictionaries
-            rows = []
-            for _, row in df.iterrows():
-                row_dict = {}
-                for col in columns:
-                    # Convert all values to strings for consistent comparison
-                    value = row[col]
-                    if pd.isna(value):
-                        row_dict[col] = None
-                    else:
-                        row_dict[col] = str(value) if value != '' else None
-                rows.append(row_dict)
+            # Convert DataFrame to a compact columnar table; numeric and date
+            # columns keep their type, other cells become strings (or None)
+            table = ColumnarTable.from_frame(df)
             
             return {
-                'columns': columns,
-                'rows': rows
+                'columns': table.columns,
+                'table': table
             }
+        except JobCancelled:
+            raise
         except Exception as e:
             import traceback
             error_details = traceback.format_exc()
@@ -71,44 +420,36 @@ class FileDifferenceService:
             print(f"Error details: {error_details}")
             raise Exception(f"Error processing CSV file: {str(e)}")
     
-    def _process_excel(self, file_path):
-        """Process an Excel file and return its data"""
+    def _process_excel(self, file_path, sheet=None, usecols=None, progress=None):
+        """
+        Process a sheet (name or index, default the first) of an Excel file,
+        reading only the columns passing usecols (default all), and return its
+        data; the optional progress callback is told the rows read
+        """
         try:
             print(f"Processing Excel file: {file_path}")
             
-            # Read Excel file with explicit engine
-            df = pd.read_excel(file_path, engine='openpyxl')
+            # Read the sheet with the fastest available engine
+            with ExcelReader(file_path) as reader:
+                df = reader.read_sheet(sheet, usecols=usecols, progress=progress)
             
             # Drop unnamed columns (these are often empty columns)
             unnamed_cols = [col for col in df.columns if 'Unnamed:' in str(col)]
             if unnamed_cols:
                 df = df.drop(columns=unnamed_cols)
             
-            # Handle potential NaN values
-            df = df.fillna('')
-            
-            # Convert DataFrame to a standardized format
-            columns = df.columns.tolist()
+            # Convert DataFrame to a compact columnar table; numeric and date
+            # columns keep their type, other cells become strings (or None)
+            table = ColumnarTable.from_frame(df)
             
-            # Convert rows to list of dictionaries
-            rows = []
-            for _, row in df.iterrows():
-                row_dict = {}
-                for col in columns:
-                    # Convert all values to strings for consistent comparison
-                    value = row[col]
-                    if pd.isna(value):
-                        row_dict[col] = None
-                    else:
-                        row_dict[col] = str(value) if value != '' else None
-                rows.append(row_dict)
-            
-            print(f"Processed Excel file with {len(columns)} columns and {len(rows)} rows")
+            print(f"Processed Excel file with {len(table.columns)} columns and {len(table)} rows")
             
             return {
-                'columns': columns,
-                'rows': rows
+                'columns': table.columns,
+                'table': table
             }
+        except (SheetNotFoundError, JobCancelled):
+            raise
         except Exception as e:
             import traceback
             error_details = traceback.format_exc()
@@ -116,102 +457,45 @@ class FileDifferenceService:
             print(f"Error details: {error_details}")
             raise Exception(f"Error processing Excel file: {str(e)}")
     
-    def _process_xml(self, file_path):
-        """Process an XML file and return its data"""
+    def _process_xml(self, file_path, backend=None, progress=None):
+        """
+        Process an XML file and return its data
+        
+        The document is flattened incrementally into an XmlPathTrie ('tree'),
+        holding only the open elements while reading; path strings are built
+        when a comparison reports them. The original lines are only included
+        for files up to xml_original_lines_max_bytes.
+        
+        Args:
+            file_path (str): Path to the XML file
+            backend (str): Parser backend, 'lxml' or 'etree' (default xml_backend)
+            progress (callable): Optional progress callback, told the bytes read
+        """
         try:
-            # Read the XML file as text to preserve original structure
-            with open(file_path, 'r', encoding='utf-8') as f:
-                xml_content = f.readlines()
-            
-            # Parse with ElementTree for structured data
-            tree = ET.parse(file_path)
-            root = tree.getroot()
+            backend = backend or self.xml_backend
+            print(f"Processing XML file: {file_path} (parser: {backend})")
             
-            print(f"Processing XML file: {file_path}")
-            print(f"Root tag: {root.tag}")
+            # Paths and values in source order: attributes, then text, then children
+            with self._open_for_parsing(file_path, progress) as f:
+                tree = flatten_xml(f, backend=backend)
             
-            # Extract all nodes and their paths while preserving source order
-            all_nodes = {}  # Dictionary to store node paths and their values
-            ordered_paths = []  # List to preserve the order of paths in source file
+            print(f"Processed XML with {len(tree)} paths ({tree.node_count} nodes, "
+                  f"{len(tree.names)} distinct names):")
+            preview_count = min(len(tree), 10)
+            for path, value in zip(tree.paths(tree.value_nodes[:preview_count]), tree.values):
+                print(f"  {path}: {value}")  # Print first 10 for debugging
             
-            # Keep track of element occurrences to handle repeated elements
-            element_counts = {}
+            if len(tree) > 10:
+                print(f"  ... and {len(tree) - 10} more")
             
-            # Track parent-child relationships for proper ordering
-            path_hierarchy = {}
-            
-            def process_element(element, path="", depth=0):
-                """Process element and its children, collecting paths and values"""
-                # Build current element path
-                current_path = path + "/" + element.tag if path else element.tag
-                
-                # Handle repeated elements by adding index
-                element_key = f"{current_path}"
-                if element_key in element_counts:
-                    element_counts[element_key] += 1
-                    indexed_path = f"{current_path}[{element_counts[element_key]}]"
-                else:
-                    element_counts[element_key] = 1
-                    indexed_path = f"{current_path}[{element_counts[element_key]}]"
-                
-                # Add this path to ordered_paths if it contains a value or attribute
-                has_content = False
-                
-                # Process attributes - add these first
-                for attr_name, attr_value in element.attrib.items():
-                    attr_path = f"{indexed_path}/@{attr_name}"
-                    all_nodes[attr_path] = attr_value
-                    ordered_paths.append(attr_path)
-                    has_content = True
-                    print(f"Found attribute: {attr_path} = {attr_value}")
-                
-                # Process text content
-                if element.text and element.text.strip():
-                    text_content = element.text.strip()
-                    all_nodes[indexed_path] = text_content
-                    ordered_paths.append(indexed_path)  # Add to ordered list
-                    has_content = True
-                    print(f"Found text node: {indexed_path} = {text_content}")
-                elif not element.attrib and len(list(element)) == 0:
-                    # Element with no attributes, no text, and no children - mark as empty
-                    all_nodes[indexed_path] = ""
-                    # We still track it in ordered_paths for structure consistency
-                    # but mark it with a special property to filter in the frontend if needed
-                    ordered_paths.append(indexed_path)
-                    all_nodes[indexed_path + "_isEmpty"] = True
-                
-                # Store parent-child relationship for ordering
-                if path in path_hierarchy:
-                    path_hierarchy[path].append(indexed_path)
-                else:
-                    path_hierarchy[path] = [indexed_path]
-                
-                # Process child elements in document order
-                for child in element:
-                    process_element(child, indexed_path, depth + 1)
-            
-            # Start processing from the root
-            process_element(root)
-            
-            # Create a standardized format for comparison
-            # Use ordered_paths to keep original source file order, preserving hierarchy
-            columns = ordered_paths if ordered_paths else list(all_nodes.keys())
-            
-            # Create a single row with all paths and values
-            row = {col: all_nodes[col] for col in columns}
-            
-            print(f"Processed XML with {len(columns)} paths:")
-            for col in columns[:10]:  # Print first 10 for debugging
-                print(f"  {col}: {row[col]}")
-            
-            if len(columns) > 10:
-                print(f"  ... and {len(columns) - 10} more")
-            
-            return {
-                'columns': columns,
-                'rows': [row],  # Return as a single row containing all XML paths
-                'originalLines': xml_content  # Include original file lines for reference
-            }
+            data = {'tree': tree}
+            if os.path.getsize(file_path) <= self.xml_original_lines_max_bytes:
+                # Include original file lines for reference
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    data['originalLines'] = f.readlines()
+            return data
+        except JobCancelled:
+            raise
         except Exception as e:
             import traceback
             error_details = traceback.format_exc()
@@ -219,7 +503,8 @@ class FileDifferenceService:
             print(f"Error details: {error_details}")
             raise Exception(f"Error processing XML file: {str(e)}")
     
-    def compare_files(self, source_data, target_data, file_type):
+    def compare_files(self, source_data, target_data, file_type, key_columns=None, align_rows=False,
+                      tolerance=None, record_element=None, progress=None):
         """
         Compare two files and generate a difference report
         
@@ -227,89 +512,102 @@ class FileDifferenceService:
             source_data (dict): Source file data in standardized format
             target_data (dict): Target file data in standardized format
             file_type (str): Type of the files being compared
+            key_columns (list): Optional key columns used to match CSV/XLSX rows
+            align_rows (bool): Align CSV/XLSX rows detecting inserted / deleted rows
+            tolerance (dict): Optional 'absolute' / 'relative' tolerance for numeric CSV/XLSX cells
+            record_element (str): Optional XML record element; records are then
+                                  matched on key_columns (see compare_xml_records)
+            progress (callable): Optional progress callback, told the rows
+                                 (XML: nodes) compared
             
         Returns:
             dict: Comparison result with differences highlighted
         """
+        if file_type == 'xml' and record_element:
+            return self.compare_xml_records(source_data, target_data, record_element, key_columns,
+                                            tolerance=tolerance, progress=progress)
         if file_type == 'xml':
-            return self.compare_xml_files(source_data, target_data)
+            return self.compare_xml_files(source_data, target_data, progress=progress)
         else:
-            return self.compare_csv_xlsx_files(source_data, target_data, file_type)
+            return self.compare_csv_xlsx_files(source_data, target_data, file_type, key_columns=key_columns,
+                                               align_rows=align_rows, tolerance=tolerance, progress=progress)
     
-    def compare_csv_xlsx_files(self, source_data, target_data, file_type):
+    def compare_csv_xlsx_files(self, source_data, target_data, file_type, key_columns=None, align_rows=False,
+                               tolerance=None, progress=None):
         """
         Compare two CSV or XLSX files and generate a difference report
         
+        Rows are paired by position unless key_columns is given, in which case
+        rows are joined on those columns (see _compare_rows_by_key), or
+        align_rows is set, in which case inserted and deleted rows are
+        detected (see _compare_rows_aligned). Cells are compared by column
+        type: numbers as numbers (so 1 equals 1.0), within the optional
+        tolerance, dates as dates and other values as strings.
+        
         Args:
             source_data (dict): Source file data in standardized format
             target_data (dict): Target file data in standardized format
             file_type (str): Type of the files being compared ('csv' or 'xlsx')
+            key_columns (list): Optional key columns used to match rows
+            align_rows (bool): Align rows with a sequence diff instead of by position
+            tolerance (dict): Optional 'absolute' / 'relative' tolerance for numeric cells
+            progress (callable): Optional progress callback, told the rows compared
             
         Returns:
             dict: Comparison result with differences highlighted
         """
         try:
-            # Get all columns (union of both files' columns)
-            all_columns = list(set(source_data.get('columns', []) + target_data.get('columns', [])))
+            if key_columns:
+                return self._compare_rows_by_key(source_data, target_data, file_type, key_columns,
+                                                 tolerance=tolerance, progress=progress)
+            if align_rows:
+                return self._compare_rows_aligned(source_data, target_data, file_type, tolerance=tolerance,
+                                                  progress=progress)
+            
+            source_columns = source_data.get('columns', [])
+            target_columns = target_data.get('columns', [])
+            source_table = self.get_table(source_data)
+            target_table = self.get_table(target_data)
+            row_count = len(source_table)
+            
+            # Get all columns (union of both files' columns, source order first)
+            all_columns = diff_engine.ordered_union(source_columns, target_columns)
             
             # Prepare comparison result
             comparison_result = {
                 'fileType': file_type,
-                'headers': source_data.get('columns', []),  # Use source file column order
-                'sourceData': source_data.get('rows', []),
-                'targetData': target_data.get('rows', []),  # Include target data for comparison
+                'headers': source_columns,  # Use source file column order
+                'sourceData': source_table,
+                'targetData': target_table,  # Include target data for comparison
                 'summary': {
-                    'totalRows': len(source_data.get('rows', [])),
+                    'totalRows': row_count,
                     'matchingRows': 0,
                     'differingRows': 0
                 },
                 'differences': []  # Array to store differences
             }
             
-            # Create a map of source rows for easier lookup
-            source_rows = source_data.get('rows', [])
-            target_rows = target_data.get('rows', [])
+            # Build columnar frames; rows are paired by position and missing
+            # target rows compare as empty
+            source_frame = source_table.to_frame(all_columns)
+            target_frame = target_table.to_frame(all_columns, length=row_count)
             
-            # Compare each row in source with corresponding row in target
-            for source_idx, source_row in enumerate(source_rows):
-                row_has_differences = False
-                
-                # Get corresponding target row if it exists
-                target_row = target_rows[source_idx] if source_idx < len(target_rows) else {}
-                
-                # Compare each column
-                for col in all_columns:
-                    source_value = source_row.get(col)
-                    target_value = target_row.get(col)
-                    
-                    # Normalize values for comparison
-                    source_str = str(source_value).strip() if source_value is not None else None
-                    target_str = str(target_value).strip() if target_value is not None else None
-                    
-                    # Handle empty strings as None
-                    if source_str == "":
-                        source_str = None
-                    if target_str == "":
-                        target_str = None
-                    
-                    # Compare values
-                    if source_str != target_str:
-                        row_has_differences = True
-                        # Add to differences array
-                        comparison_result['differences'].append({
-                            'rowIndex': source_idx,
-                            'column': col,
-                            'sourceValue': source_value,
-                            'targetValue': target_value
-                        })
-                
-                # Update summary
-                if row_has_differences:
-                    comparison_result['summary']['differingRows'] += 1
-                else:
-                    comparison_result['summary']['matchingRows'] += 1
+            # Compare whole columns at a time
+            mask = self._mismatch_mask_in_blocks(source_frame, target_frame, tolerance, progress=progress)
+            
+            # Update summary
+            differing_rows = int(mask.any(axis=1).sum()) if row_count else 0
+            comparison_result['summary']['differingRows'] = differing_rows
+            comparison_result['summary']['matchingRows'] = row_count - differing_rows
+            comparison_result['summary']['columnDifferences'] = diff_engine.count_by_column(mask, all_columns)
+            
+            comparison_result['differences'] = diff_engine.collect_differences(
+                mask, source_frame, target_frame, all_columns
+            )
             
             return comparison_result
+        except JobCancelled:
+            raise
         except Exception as e:
             import traceback
             error_details = traceback.format_exc()
@@ -317,107 +615,1056 @@ class FileDifferenceService:
             print(f"Error details: {error_details}")
             raise Exception(f"Error comparing CSV/XLSX files: {str(e)}")
     
-    def compare_xml_files(self, source_data, target_data):
+    def _compare_rows_by_key(self, source_data, target_data, file_type, key_columns, tolerance=None,
+                             progress=None):
         """
-        Compare two XML files and generate a difference report
+        Compare two CSV or XLSX files by joining rows on key columns
+        
+        A hash index is built on the target keys so the join is linear in the
+        number of rows. Matched rows are compared cell by cell; unmatched rows
+        are reported as source-only / target-only and duplicated keys produce
+        warnings.
         
         Args:
             source_data (dict): Source file data in standardized format
             target_data (dict): Target file data in standardized format
+            file_type (str): Type of the files being compared ('csv' or 'xlsx')
+            key_columns (list): Columns identifying a row in both files
+            tolerance (dict): Optional 'absolute' / 'relative' tolerance for numeric cells
+            progress (callable): Optional progress callback, told the matched rows compared
             
         Returns:
-            dict: Comparison result with differences highlighted
+            dict: Comparison result with differences, unmatched rows and warnings
         """
-        try:
-            # Use the columns from source_data to maintain source file order
-            source_columns = source_data.get('columns', [])
-            # Get columns from target that aren't in source
-            target_columns = [col for col in target_data.get('columns', []) if col not in source_columns]
+        source_columns = source_data.get('columns', [])
+        target_columns = target_data.get('columns', [])
+        source_table = self.get_table(source_data)
+        target_table = self.get_table(target_data)
+        
+        missing_keys = [col for col in key_columns if col not in source_columns or col not in target_columns]
+        if missing_keys:
+            raise ValueError(f"Key columns not found in both files: {', '.join(map(str, missing_keys))}")
+        
+        all_columns = diff_engine.ordered_union(source_columns, target_columns)
+        source_frame = source_table.to_frame(all_columns)
+        target_frame = target_table.to_frame(all_columns)
+        
+        source_keys = diff_engine.key_tuples(source_frame, key_columns)
+        target_keys = diff_engine.key_tuples(target_frame, key_columns)
+        matches = diff_engine.match_rows_by_key(source_keys, target_keys)
+        
+        # Compare the matched row pairs
+        source_positions = matches['sourcePositions']
+        target_positions = matches['targetPositions']
+        matched_source = source_frame.iloc[source_positions].reset_index(drop=True)
+        matched_target = target_frame.iloc[target_positions].reset_index(drop=True)
+        mask = self._mismatch_mask_in_blocks(matched_source, matched_target, tolerance,
+                                             type_frames=(source_frame, target_frame), progress=progress)
+        changed_rows = int(mask.any(axis=1).sum()) if len(source_positions) else 0
+        
+        differences = diff_engine.collect_differences(
+            mask, matched_source, matched_target, all_columns,
+            row_labels=source_positions, target_row_labels=target_positions
+        )
+        
+        warnings = []
+        for key, (source_count, target_count) in matches['duplicateKeys'].items():
+            if len(warnings) >= self.max_warnings:
+                break
+            warnings.append(
+                f"Duplicate key {list(key)}: {source_count} row(s) in source, {target_count} row(s) in target"
+            )
+        
+        source_only = matches['sourceOnly']
+        target_only = matches['targetOnly']
+        
+        return {
+            'fileType': file_type,
+            'matchMode': 'key',
+            'keyColumns': list(key_columns),
+            'headers': source_columns,
+            'sourceData': source_table,
+            'targetData': target_table,
+            'summary': {
+                'totalRows': len(source_table),
+                'matchingRows': len(source_positions) - changed_rows,
+                'differingRows': changed_rows + len(source_only),
+                'changedRows': changed_rows,
+                'sourceOnlyRows': len(source_only),
+                'targetOnlyRows': len(target_only),
+                'duplicateKeys': len(matches['duplicateKeys']),
+                'columnDifferences': diff_engine.count_by_column(mask, all_columns)
+            },
+            'differences': differences,
+            'sourceOnly': [{'rowIndex': idx, 'key': list(source_keys[idx])} for idx in source_only],
+            'targetOnly': [{'rowIndex': idx, 'key': list(target_keys[idx])} for idx in target_only],
+            'warnings': warnings
+        }
+    
+    def _compare_rows_aligned(self, source_data, target_data, file_type, tolerance=None, progress=None):
+        """
+        Compare two CSV or XLSX files whose rows have no key, detecting
+        inserted and deleted rows
+        
+        Every row is reduced to a fingerprint and the two fingerprint
+        sequences are aligned with a sequence diff (see
+        diff_engine.align_sequences). Rows of a replaced block are paired in
+        order as modified rows and only those pairs are compared cell by
+        cell; the other rows of the block are reported as source-only /
+        target-only.
+        
+        Args:
+            source_data (dict): Source file data in standardized format
+            target_data (dict): Target file data in standardized format
+            file_type (str): Type of the files being compared ('csv' or 'xlsx')
+            tolerance (dict): Optional 'absolute' / 'relative' tolerance for numeric cells
+            progress (callable): Optional progress callback, told the modified rows compared
             
-            # Maintain source file order first, then add any target-only columns at the end
-            all_columns = source_columns + target_columns
+        Returns:
+            dict: Comparison result with differences and unmatched rows
+        """
+        source_columns = source_data.get('columns', [])
+        target_columns = target_data.get('columns', [])
+        source_table = self.get_table(source_data)
+        target_table = self.get_table(target_data)
+        
+        all_columns = diff_engine.ordered_union(source_columns, target_columns)
+        source_frame = source_table.to_frame(all_columns)
+        target_frame = target_table.to_frame(all_columns)
+        
+        opcodes = diff_engine.align_sequences(diff_engine.row_fingerprints(source_frame),
+                                              diff_engine.row_fingerprints(target_frame))
+        pairs = diff_engine.pair_aligned_rows(opcodes)
+        
+        # Compare the modified row pairs
+        source_positions = pairs['modifiedSource']
+        target_positions = pairs['modifiedTarget']
+        modified_source = source_frame.iloc[source_positions].reset_index(drop=True)
+        modified_target = target_frame.iloc[target_positions].reset_index(drop=True)
+        mask = self._mismatch_mask_in_blocks(modified_source, modified_target, tolerance,
+                                             type_frames=(source_frame, target_frame), progress=progress)
+        changed_rows = int(mask.any(axis=1).sum()) if len(source_positions) else 0
+        
+        differences = diff_engine.collect_differences(
+            mask, modified_source, modified_target, all_columns,
+            row_labels=source_positions, target_row_labels=target_positions
+        )
+        
+        source_only = pairs['sourceOnly'].tolist()
+        target_only = pairs['targetOnly'].tolist()
+        
+        return {
+            'fileType': file_type,
+            'matchMode': 'aligned',
+            'headers': source_columns,
+            'sourceData': source_table,
+            'targetData': target_table,
+            'summary': {
+                'totalRows': len(source_table),
+                'matchingRows': len(source_table) - changed_rows - len(source_only),
+                'differingRows': changed_rows + len(source_only),
+                'changedRows': changed_rows,
+                'sourceOnlyRows': len(source_only),
+                'targetOnlyRows': len(target_only),
+                'alignmentBlocks': sum(1 for opcode in opcodes if opcode[0] != 'equal'),
+                'columnDifferences': diff_engine.count_by_column(mask, all_columns)
+            },
+            'differences': differences,
+            'sourceOnly': [{'rowIndex': idx} for idx in source_only],
+            'targetOnly': [{'rowIndex': idx} for idx in target_only]
+        }
+    
+    def _mismatch_mask_in_blocks(self, source_frame, target_frame, tolerance=None, type_frames=None,
+                                 progress=None):
+        """
+        Return diff_engine.mismatch_mask of two aligned frames. With a progress
+        callback the rows are compared progress_block_rows at a time, with the
+        column types of the whole frames, and the rows compared are reported
+        after every block.
+        """
+        row_count = len(source_frame)
+        self._report(progress, stage='comparing', processed=0, total=row_count, unit='rows')
+        if progress is None or row_count <= self.progress_block_rows:
+            mask = diff_engine.mismatch_mask(source_frame, target_frame, tolerance, type_frames=type_frames)
+            self._report(progress, processed=row_count)
+            return mask
+        
+        column_types = diff_engine.column_types(*(type_frames or (source_frame, target_frame)))
+        mask = np.zeros(source_frame.shape, dtype=bool)
+        for start in range(0, row_count, self.progress_block_rows):
+            stop = min(start + self.progress_block_rows, row_count)
+            mask[start:stop] = diff_engine.mismatch_mask(source_frame.iloc[start:stop], target_frame.iloc[start:stop],
+                                                         tolerance, column_types=column_types)
+            self._report(progress, processed=stop)
+        return mask
+    
+    def _iter_csv_chunks(self, file_path, chunk_size, usecols=None):
+        """
+        Yield a CSV file as DataFrames of at most chunk_size rows, read as
+        strings, with only the columns passing usecols (default all)
+        """
+        reader = pd.read_csv(file_path, dtype=str, chunksize=chunk_size, usecols=usecols)
+        for chunk in reader:
+            # Drop unnamed columns (these are often empty columns)
+            unnamed_cols = [col for col in chunk.columns if 'Unnamed:' in str(col)]
+            if unnamed_cols:
+                chunk = chunk.drop(columns=unnamed_cols)
+            yield chunk.reset_index(drop=True)
+    
+    def _csv_column_types(self, source_path, target_path, columns, usecols=None):
+        """
+        Return the value type of every column of a streaming comparison,
+        inferred from the first type_sample_rows rows of both files
+        """
+        heads = []
+        for file_path in (source_path, target_path):
+            head = next(self._iter_csv_chunks(file_path, self.type_sample_rows, usecols=usecols), None)
+            heads.append((head if head is not None else pd.DataFrame(dtype=object)).reindex(columns=columns))
+        return diff_engine.column_types(*heads)
+    
+    def _count_data_lines(self, file_path):
+        """
+        Estimate the number of data rows of a CSV file by counting line
+        breaks (quoted line breaks make this an overestimate)
+        """
+        lines = 0
+        last_block = b''
+        with open(file_path, 'rb') as f:
+            while True:
+                block = f.read(self.copy_block_size)
+                if not block:
+                    break
+                lines += block.count(b'\n')
+                last_block = block
+        if last_block and not last_block.endswith(b'\n'):
+            lines += 1
+        return max(lines - 1, 0)
+    
+    def compare_csv_streaming(self, source_path, target_path, chunk_size=None, max_differences=None,
+                              progress=None, tolerance=None, columns=None, ignore_columns=None,
+                              memory_budget=None):
+        """
+        Compare two CSV files chunk by chunk without loading either file fully
+        
+        Source and target are read in lockstep in chunks of chunk_size rows and
+        rows are paired by position, as in compare_csv_xlsx_files. Only the
+        summary counters and at most max_differences difference entries are
+        kept, so memory stays bounded by the chunk size. Cells are read as
+        strings; the column types (see diff_engine.column_types) are decided
+        once from the first type_sample_rows rows of both files and used for
+        every chunk, so the differences do not depend on the chunk size.
+        The result carries no sourceData / targetData.
+        
+        Args:
+            source_path (str): Path to the source CSV file
+            target_path (str): Path to the target CSV file
+            chunk_size (int): Rows per chunk (defaults to default_chunk_size)
+            max_differences (int): Cap on reported differences (defaults to default_max_differences)
+            progress (callable): Optional progress callback, told the rows compared
+                                 after every chunk
+            tolerance (dict): Optional 'absolute' / 'relative' tolerance for numeric cells
+            columns (list): Optional columns to compare (default all)
+            ignore_columns (list): Optional columns left out of the comparison
+            memory_budget (int): Optional memory budget in bytes; when given without
+                                 a chunk_size the chunk size is derived from it
             
-            # Add columns to the result to ensure frontend preserves the order
-            comparison_columns = source_columns.copy()
+        Returns:
+            dict: Comparison result with summary and (possibly truncated) differences
+        """
+        try:
+            usecols = self.column_selector(columns, ignore_columns)
+            if not chunk_size and memory_budget:
+                chunk_size = self._budget_chunk_size(source_path, target_path, memory_budget, usecols=usecols)
+            chunk_size = chunk_size or self.default_chunk_size
+            if max_differences is None:
+                max_differences = self.default_max_differences
             
-            # Prepare comparison result
             comparison_result = {
-                'fileType': 'xml',
-                'columns': comparison_columns,  # Include source columns in order
+                'fileType': 'csv',
+                'streaming': True,
+                'headers': [],
                 'summary': {
-                    'totalRows': len(all_columns),
+                    'totalRows': 0,
                     'matchingRows': 0,
-                    'differingRows': 0
+                    'differingRows': 0,
+                    'chunks': 0,
+                    'columnDifferences': {}
                 },
-                'rows': []  # Array to store row comparisons
+                'differences': [],
+                'truncated': False
             }
+            summary = comparison_result['summary']
+            differences = comparison_result['differences']
+            all_columns = None
+            column_types = None
             
-            # Get source and target rows (for XML, there's typically just one row with all paths)
-            source_row = source_data.get('rows', [{}])[0] if source_data.get('rows') else {}
-            target_row = target_data.get('rows', [{}])[0] if target_data.get('rows') else {}
+            if progress is not None:
+                self._report(progress, stage='comparing', processed=0,
+                             total=self._count_data_lines(source_path), unit='rows')
             
-            # Compare each path
-            row_comparison = {
-                'hasDifferences': False,
-                'cells': {}
-            }
+            source_chunks = self._iter_csv_chunks(source_path, chunk_size, usecols=usecols)
+            target_chunks = self._iter_csv_chunks(target_path, chunk_size, usecols=usecols)
             
-            for col in all_columns:
-                source_value = source_row.get(col)
-                target_value = target_row.get(col)
+            for source_chunk, target_chunk in itertools.zip_longest(source_chunks, target_chunks):
+                # Extra target rows are ignored, as in the in-memory comparison
+                if source_chunk is None:
+                    break
+                if target_chunk is None:
+                    target_chunk = pd.DataFrame(columns=source_chunk.columns, dtype=object)
                 
-                # Normalize values for comparison
-                source_str = str(source_value).strip() if source_value is not None else None
-                target_str = str(target_value).strip() if target_value is not None else None
+                if all_columns is None:
+                    all_columns = diff_engine.ordered_union(
+                        source_chunk.columns.tolist(), target_chunk.columns.tolist()
+                    )
+                    comparison_result['headers'] = source_chunk.columns.tolist()
+                    column_types = self._csv_column_types(source_path, target_path, all_columns, usecols=usecols)
                 
-                # Handle empty strings as None
-                if source_str == "":
-                    source_str = None
-                if target_str == "":
-                    target_str = None
+                # Missing target rows compare as empty
+                source_frame = source_chunk.reindex(columns=all_columns)
+                target_frame = target_chunk.reindex(index=source_frame.index, columns=all_columns)
                 
-                # Determine status
-                if source_str is None and target_str is None:
-                    status = 'match'  # Both are null/empty
-                elif source_str is None:
-                    status = 'target_only'  # Only in target
-                    row_comparison['hasDifferences'] = True
-                elif target_str is None:
-                    status = 'source_only'  # Only in source
-                    row_comparison['hasDifferences'] = True
-                elif source_str == target_str:
-                    status = 'match'  # Values match
-                else:
-                    status = 'different'  # Values differ
-                    row_comparison['hasDifferences'] = True
+                mask = diff_engine.mismatch_mask(source_frame, target_frame, tolerance, column_types=column_types)
+                differing_rows = int(mask.any(axis=1).sum()) if len(source_frame) else 0
                 
-                # Check if this is an empty node
-                is_empty = False
-                if col + "_isEmpty" in source_row:
-                    is_empty = source_row[col + "_isEmpty"]
+                remaining = max_differences - len(differences)
+                if differing_rows and int(mask.sum()) > remaining:
+                    comparison_result['truncated'] = True
+                if differing_rows and remaining > 0:
+                    row_offset = summary['totalRows']
+                    differences.extend(diff_engine.collect_differences(
+                        mask, source_frame, target_frame, all_columns,
+                        row_labels=np.arange(row_offset, row_offset + len(source_frame)),
+                        limit=remaining
+                    ))
                 
-                # Add to cells
-                row_comparison['cells'][col] = {
-                    'sourceValue': source_value,
-                    'targetValue': target_value,
-                    'status': status,
-                    'isEmpty': is_empty
-                }
+                summary['totalRows'] += len(source_frame)
+                summary['differingRows'] += differing_rows
+                summary['matchingRows'] += len(source_frame) - differing_rows
+                summary['chunks'] += 1
+                diff_engine.count_by_column(mask, all_columns, summary['columnDifferences'])
+                self._report(progress, processed=summary['totalRows'])
+            
+            return comparison_result
+        except JobCancelled:
+            raise
+        except Exception as e:
+            import traceback
+            error_details = traceback.format_exc()
+            print(f"Error comparing CSV files in streaming mode: {str(e)}")
+            print(f"Error details: {error_details}")
+            raise Exception(f"Error comparing CSV files in streaming mode: {str(e)}")
+    
+    def compare_csv_sorted(self, source_path, target_path, key_columns, memory_budget=None,
+                           max_differences=None, progress=None, tolerance=None, columns=None,
+                           ignore_columns=None):
+        """
+        Compare two CSV files by key with an external sort-merge join
+        
+        Each file is read in chunks sized to the memory budget; every chunk
+        is sorted by key and written to a temporary run file. The runs of
+        both files are then merged back in key order and joined in a single
+        streaming pass, so memory stays within memory_budget however large
+        the files are. Rows sharing a duplicated key are paired in order of
+        occurrence, as in _compare_rows_by_key. Cells are read as strings and
+        compared by column type, decided once from the first
+        type_sample_rows rows of both files as in compare_csv_streaming, so
+        the differences match those of the in-memory comparison.
+        Differences are reported in key order and at most max_differences
+        differences (and source-only / target-only rows) are kept.
+        
+        Args:
+            source_path (str): Path to the source CSV file
+            target_path (str): Path to the target CSV file
+            key_columns (list): Columns identifying a row in both files
+            memory_budget (int): Approximate memory budget in bytes (defaults to sort_memory_budget)
+            max_differences (int): Cap on reported entries (defaults to default_max_differences)
+            progress (callable): Optional progress callback
+            tolerance (dict): Optional 'absolute' / 'relative' tolerance for numeric cells
+            columns (list): Optional columns to compare (default all); the key
+                            columns are always read
+            ignore_columns (list): Optional columns left out of the comparison
+            
+        Returns:
+            dict: Comparison result with summary, differences and unmatched rows
+            
+        Raises:
+            ComparisonRequestError: When the key columns are missing from a file
+        """
+        memory_budget = memory_budget or self.sort_memory_budget
+        if max_differences is None:
+            max_differences = self.default_max_differences
+        
+        usecols = self.column_selector(columns and list(columns) + list(key_columns), ignore_columns)
+        source_columns = self._csv_header(source_path, usecols=usecols)
+        target_columns = self._csv_header(target_path, usecols=usecols)
+        missing_keys = [col for col in key_columns if col not in source_columns or col not in target_columns]
+        if missing_keys:
+            raise ComparisonRequestError(f"Key columns not found in both files: {', '.join(missing_keys)}")
+        all_columns = diff_engine.ordered_union(source_columns, target_columns)
+        
+        # Size runs so that the records of one sorted chunk take a third of
+        # the budget (the parsed chunk, parser buffers and allocator overhead
+        # take roughly twice as much again), and read blocks so that the runs
+        # merged at once on both sides fit as well
+        record_bytes = max(self._estimate_record_bytes(source_path, all_columns, key_columns, usecols=usecols),
+                           self._estimate_record_bytes(target_path, all_columns, key_columns, usecols=usecols))
+        run_rows = max(1000, int(memory_budget // (3 * record_bytes)))
+        block_rows = max(100, run_rows // (2 * sort_merge.MERGE_FAN_IN))
+        column_types = self._csv_column_types(source_path, target_path, all_columns, usecols=usecols)
+        
+        try:
+            run_root = os.path.join(self.upload_folder, 'sort_runs')
+            os.makedirs(run_root, exist_ok=True)
+            with tempfile.TemporaryDirectory(dir=run_root) as run_folder:
+                source_runs, source_rows = self._write_sorted_runs(
+                    source_path, 'source', all_columns, key_columns, run_folder, run_rows, block_rows, progress,
+                    usecols=usecols)
+                target_runs, target_rows = self._write_sorted_runs(
+                    target_path, 'target', all_columns, key_columns, run_folder, run_rows, block_rows, progress,
+                    usecols=usecols)
+                print(f"Sorted {source_rows} source rows into {len(source_runs)} runs and "
+                      f"{target_rows} target rows into {len(target_runs)} runs of up to {run_rows} rows")
                 
-                # Update summary
-                if status == 'match':
-                    comparison_result['summary']['matchingRows'] += 1
-                else:
-                    comparison_result['summary']['differingRows'] += 1
+                self._report(progress, stage='merging', processed=0, total=source_rows, unit='rows')
+                source_records = sort_merge.merge_runs(source_runs, run_folder, 'source', block_rows)
+                target_records = sort_merge.merge_runs(target_runs, run_folder, 'target', block_rows)
+                comparison_result = self._join_sorted_records(
+                    source_records, target_records, all_columns, max_differences, progress, tolerance,
+                    column_types=column_types, block_rows=block_rows)
+        except (JobCancelled, ComparisonRequestError):
+            raise
+        except Exception as e:
+            import traceback
+            error_details = traceback.format_exc()
+            print(f"Error comparing CSV files with external sort: {str(e)}")
+            print(f"Error details: {error_details}")
+            raise Exception(f"Error comparing CSV files with external sort: {str(e)}")
+        
+        comparison_result.update({
+            'keyColumns': list(key_columns),
+            'headers': source_columns
+        })
+        comparison_result['summary'].update({
+            'totalRows': source_rows,
+            'runs': {'source': len(source_runs), 'target': len(target_runs)}
+        })
+        return comparison_result
+    
+    def _csv_header(self, file_path, usecols=None):
+        """Return the columns of a CSV file passing usecols (default all), without unnamed columns"""
+        columns = pd.read_csv(file_path, nrows=0, usecols=usecols).columns
+        return [col for col in columns if 'Unnamed:' not in str(col)]
+    
+    def _estimate_record_bytes(self, file_path, columns, key_columns, sample_rows=1000, usecols=None):
+        """Estimate the memory taken by one sort record of a CSV file from its first rows"""
+        sample = next(self._iter_csv_chunks(file_path, sample_rows, usecols=usecols), None)
+        if sample is None or not len(sample):
+            return 1024
+        string_bytes = sample.memory_usage(index=False, deep=True).sum() / len(sample)
+        # Record, key and value tuples plus the row index
+        overhead = 3 * 56 + 8 * (len(columns) + len(key_columns)) + 32
+        return int(string_bytes + overhead)
+    
+    def _budget_chunk_size(self, source_path, target_path, memory_budget, usecols=None):
+        """
+        Return the rows per chunk that keep a streaming comparison within
+        memory_budget: a source and a target chunk are held at once, each with
+        its normalized copy
+        """
+        row_bytes = max(self._estimate_record_bytes(source_path, [], [], usecols=usecols),
+                        self._estimate_record_bytes(target_path, [], [], usecols=usecols))
+        chunk_size = max(memory_budget // (4 * row_bytes), 1000)
+        print(f"Streaming in chunks of {chunk_size} rows (~{row_bytes} bytes per row)")
+        return chunk_size
+    
+    def _write_sorted_runs(self, file_path, prefix, columns, key_columns, run_folder, run_rows, block_rows,
+                           progress=None, usecols=None):
+        """Read a CSV file in chunks of run_rows rows, writing each chunk sorted by key to a run file"""
+        if progress is not None:
+            self._report(progress, stage=f"sorting {prefix}", processed=0,
+                         total=self._count_data_lines(file_path), unit='rows')
+        run_paths = []
+        row_count = 0
+        for chunk in self._iter_csv_chunks(file_path, run_rows, usecols=usecols):
+            records = sort_merge.chunk_records(chunk, columns, key_columns, row_count)
+            records.sort()
+            path = os.path.join(run_folder, f"{prefix}_{len(run_paths)}.run")
+            sort_merge.write_run(records, path, block_rows)
+            # Release this run before the next chunk is read
+            del records
+            run_paths.append(path)
+            row_count += len(chunk)
+            self._report(progress, processed=row_count)
+        return run_paths, row_count
+    
+    def _join_sorted_records(self, source_records, target_records, columns, max_differences, progress=None,
+                             tolerance=None, column_types=None, block_rows=10000):
+        """
+        Merge-join sorted source and target records into a key-based comparison
+        result. Matched rows whose normalized values differ are compared by
+        column type (see _compare_joined_rows) block_rows rows at a time.
+        """
+        summary = {
+            'totalRows': 0,
+            'matchingRows': 0,
+            'differingRows': 0,
+            'changedRows': 0,
+            'sourceOnlyRows': 0,
+            'targetOnlyRows': 0,
+            'duplicateKeys': 0,
+            'columnDifferences': {}
+        }
+        differences = []
+        source_only = []
+        target_only = []
+        warnings = []
+        truncated = False
+        source_rows_seen = 0
+        # Matched rows waiting for the typed comparison: (source index,
+        # target index, source values, target values)
+        pending = []
+        
+        for key, source_group, target_group in sort_merge.join_by_key(source_records, target_records):
+            if len(source_group) > 1 or len(target_group) > 1:
+                summary['duplicateKeys'] += 1
+                if len(warnings) < self.max_warnings:
+                    warnings.append(f"Duplicate key {list(key)}: {len(source_group)} row(s) in source, "
+                                    f"{len(target_group)} row(s) in target")
+            
+            # Duplicated keys pair their rows in order of occurrence
+            for (_, source_index, source_values), (_, target_index, target_values) in zip(source_group, target_group):
+                if source_values == target_values:
+                    summary['matchingRows'] += 1
+                    continue
+                pending.append((source_index, target_index, source_values, target_values))
+                if len(pending) >= block_rows:
+                    truncated |= self._compare_joined_rows(pending, columns, column_types, tolerance, summary,
+                                                           differences, max_differences)
+                    pending = []
+            
+            for side, group, unmatched, counter in (
+                    ('source', source_group, source_only, 'sourceOnlyRows'),
+                    ('target', target_group, target_only, 'targetOnlyRows')):
+                surplus = group[len(target_group if side == 'source' else source_group):]
+                summary[counter] += len(surplus)
+                for _, row_index, _ in surplus:
+                    if len(unmatched) >= max_differences:
+                        truncated = True
+                        break
+                    unmatched.append({'rowIndex': row_index, 'key': list(key)})
+            
+            source_rows_seen += len(source_group)
+            if source_rows_seen % 100000 < len(source_group):
+                self._report(progress, processed=source_rows_seen)
+        
+        truncated |= self._compare_joined_rows(pending, columns, column_types, tolerance, summary,
+                                               differences, max_differences)
+        summary['differingRows'] = summary['changedRows'] + summary['sourceOnlyRows']
+        self._report(progress, processed=source_rows_seen)
+        return {
+            'fileType': 'csv',
+            'matchMode': 'key',
+            'externalSort': True,
+            'summary': summary,
+            'differences': differences,
+            'sourceOnly': source_only,
+            'targetOnly': target_only,
+            'warnings': warnings,
+            'truncated': truncated
+        }
+    
+    def _compare_joined_rows(self, pending, columns, column_types, tolerance, summary, differences,
+                             max_differences):
+        """
+        Compare a block of joined row pairs by column type, as
+        diff_engine.mismatch_mask does for in-memory comparisons, adding to the
+        summary counters and appending up to max_differences differences
+        
+        Returns:
+            bool: True when differences had to be left out
+        """
+        if not pending:
+            return False
+        source_frame = pd.DataFrame([entry[2] for entry in pending], dtype=object)
+        target_frame = pd.DataFrame([entry[3] for entry in pending], dtype=object)
+        mask = diff_engine.mismatch_mask(source_frame, target_frame, tolerance, column_types=column_types)
+        changed_rows = int(mask.any(axis=1).sum())
+        summary['changedRows'] += changed_rows
+        summary['matchingRows'] += len(pending) - changed_rows
+        diff_engine.count_by_column(mask, columns, summary['columnDifferences'])
+        
+        row_positions, col_positions = np.nonzero(mask)
+        for row, position in zip(row_positions.tolist(), col_positions.tolist()):
+            if len(differences) >= max_differences:
+                return True
+            source_index, target_index, source_values, target_values = pending[row]
+            differences.append({
+                'rowIndex': source_index,
+                'column': columns[position],
+                'sourceValue': source_values[position] or None,
+                'targetValue': target_values[position] or None,
+                'targetRowIndex': target_index
+            })
+        return False
+    
+    def compare_pair(self, source_path, target_path, file_type, key_columns=None,
+                     source_hash=None, target_hash=None, options=None, align_rows=False, tolerance=None):
+        """
+        Parse and compare two files of the same type; byte-identical files
+        (equal content hashes) are reported without parsing (see identical_result)
+        
+        Args:
+            source_path (str): Path to the source file
+            target_path (str): Path to the target file
+            file_type (str): Type of both files ('csv', 'xlsx' or 'xml')
+            key_columns (list): Optional key columns used to match CSV/XLSX rows
+            source_hash (str): Optional content hash of the source file (parse cache)
+            target_hash (str): Optional content hash of the target file (parse cache)
+            options (dict): Optional parser options for both files
+            align_rows (bool): Align CSV/XLSX rows detecting inserted / deleted rows
+            tolerance (dict): Optional 'absolute' / 'relative' tolerance for numeric CSV/XLSX cells
+            
+        Returns:
+            dict: Comparison result with its status ('match' or 'different'),
+                  or only status 'error' and the error message
+        """
+        try:
+            if source_hash is not None and source_hash == target_hash:
+                # Byte-identical files need neither parsing nor comparison
+                comparison_result = self.identical_result(source_path, file_type, content_hash=source_hash,
+                                                          options=options)
+                missing_keys = [col for col in key_columns or [] if col not in comparison_result.get('headers', [])]
+                if missing_keys and file_type != 'xml':
+                    raise ValueError(f"Key columns not found in both files: {', '.join(missing_keys)}")
+                return comparison_result
+            
+            source_data = self.process_file(source_path, file_type, content_hash=source_hash, options=options)
+            target_data = self.process_file(target_path, file_type, content_hash=target_hash, options=options)
+            
+            if key_columns and file_type != 'xml':
+                missing_keys = [col for col in key_columns
+                                if col not in source_data['columns'] or col not in target_data['columns']]
+                if missing_keys:
+                    raise ValueError(f"Key columns not found in both files: {', '.join(missing_keys)}")
+            
+            comparison_result = self.compare_files(source_data, target_data, file_type, key_columns=key_columns,
+                                                   align_rows=align_rows, tolerance=tolerance)
+            comparison_result['status'] = self._comparison_status(comparison_result)
+            return comparison_result
+        except Exception as e:
+            print(f"Error comparing {source_path} and {target_path}: {str(e)}")
+            return {'fileType': file_type, 'status': 'error', 'error': str(e)}
+    
+    def identical_result(self, file_path, file_type, content_hash=None, options=None):
+        """
+        Build the result of comparing a file with a byte-identical copy
+        without parsing or comparing anything
+        
+        Row and column counts are exact when the file is in the parse cache
+        and otherwise read cheaply: CSV line breaks are counted and XLSX
+        counts come from the sheet dimension (XML files get no counts).
+        
+        Args:
+            file_path (str): Path to either of the identical files
+            file_type (str): Type of the file ('csv', 'xlsx' or 'xml')
+            content_hash (str): Optional SHA-256 hex digest of the file content
+            options (dict): Optional parser options, as for process_file
+            
+        Returns:
+            dict: Comparison result flagged 'identical', with status 'match'
+        """
+        options = self._parser_options(file_type, options)
+        data = None
+        if content_hash is not None:
+            data = self.parse_cache.get(self.parse_cache.make_key(content_hash, file_type, options))
+        
+        columns, row_count = None, None
+        if data is not None:
+            if file_type == 'xml':
+                columns = data['tree'].paths()
+            else:
+                columns = data.get('columns', [])
+                row_count = len(self.get_table(data))
+        elif file_type == 'csv':
+            usecols = self.column_selector(options.get('columns'), options.get('ignore_columns'))
+            columns = self._csv_header(file_path, usecols=usecols)
+            row_count = self._count_data_lines(file_path)
+        elif file_type == 'xlsx':
+            usecols = self.column_selector(options.get('columns'), options.get('ignore_columns'))
+            # openpyxl reads the dimension without decoding the sheet
+            with ExcelReader(file_path, engine='openpyxl') as reader:
+                columns, row_count = reader.sheet_shape(options.get('sheet'), usecols=usecols)
+        
+        summary = {'sizeBytes': os.path.getsize(file_path)}
+        if file_type == 'xml' and columns is not None:
+            # XML results count paths as rows
+            summary.update(totalRows=len(columns), matchingRows=len(columns), differingRows=0)
+        elif row_count is not None:
+            summary.update(totalRows=row_count, matchingRows=row_count, differingRows=0, totalColumns=len(columns))
+        
+        comparison_result = {
+            'fileType': file_type,
+            'identical': True,
+            'status': 'match',
+            'summary': summary,
+            'differences': []
+        }
+        if file_type == 'xml':
+            comparison_result.update(columns=columns or [], rows=[])
+        else:
+            comparison_result['headers'] = columns or []
+        return comparison_result
+    
+    def _comparison_status(self, comparison_result):
+        """Return 'different' when a comparison found any difference and 'match' otherwise"""
+        summary = comparison_result['summary']
+        if (summary.get('differingRows', 0) > 0
+                or summary.get('sourceOnlyRows', 0) > 0
+                or summary.get('targetOnlyRows', 0) > 0):
+            return 'different'
+        source_table = comparison_result.get('sourceData')
+        target_table = comparison_result.get('targetData')
+        if (isinstance(source_table, ColumnarTable) and isinstance(target_table, ColumnarTable)
+                and len(source_table) != len(target_table)):
+            # Positional comparison does not report extra target rows
+            return 'different'
+        return 'match'
+    
+    def compare_sheet(self, source_path, target_path, sheet_name, key_columns=None,
+                      source_hash=None, target_hash=None, align_rows=False, tolerance=None, columns=None,
+                      ignore_columns=None):
+        """
+        Compare one sheet present in two workbooks (see compare_pair)
+        """
+        options = {'sheet': sheet_name, 'columns': columns, 'ignore_columns': ignore_columns}
+        sheet_result = self.compare_pair(source_path, target_path, 'xlsx', key_columns=key_columns,
+                                         source_hash=source_hash, target_hash=target_hash,
+                                         options=options, align_rows=align_rows, tolerance=tolerance)
+        sheet_result['sheet'] = sheet_name
+        return sheet_result
+    
+    def _group_summary(self, entries, unit):
+        """
+        Aggregate the per-sheet / per-file results of a workbook or batch
+        comparison: the number of entries of each status (e.g. matchingSheets)
+        and the total row counts
+        """
+        summary = {f'total{unit}': len(entries)}
+        status_counters = {'match': f'matching{unit}', 'different': f'differing{unit}',
+                           'source_only': f'sourceOnly{unit}', 'target_only': f'targetOnly{unit}',
+                           'error': f'error{unit}'}
+        for counter in status_counters.values():
+            summary[counter] = 0
+        for key in ('totalRows', 'matchingRows', 'differingRows'):
+            summary[key] = 0
+        
+        for entry in entries:
+            summary[status_counters[entry['status']]] += 1
+            for key in ('totalRows', 'matchingRows', 'differingRows'):
+                summary[key] += entry.get('summary', {}).get(key, 0)
+        return summary
+    
+    def compare_workbooks(self, source_path, target_path, key_columns=None, sheets=None,
+                          source_hash=None, target_hash=None, progress=None, align_rows=False, tolerance=None,
+                          columns=None, ignore_columns=None):
+        """
+        Compare every sheet of two workbooks, pairing sheets by name
+        
+        Sheet pairs are compared in parallel in a pool of worker processes;
+        sheets present in only one workbook are flagged as 'source_only' or
+        'target_only'.
+        
+        Args:
+            source_path (str): Path to the source workbook
+            target_path (str): Path to the target workbook
+            key_columns (list): Optional key columns used to match rows of every sheet
+            sheets (list): Optional names of the sheets to compare (default all)
+            source_hash (str): Optional content hash of the source workbook (parse cache)
+            target_hash (str): Optional content hash of the target workbook (parse cache)
+            progress (callable): Optional progress callback, told the sheets compared
+            align_rows (bool): Align the rows of every sheet detecting inserted / deleted rows
+            tolerance (dict): Optional 'absolute' / 'relative' tolerance for numeric cells
+            columns (list): Optional columns to read and compare (default all)
+            ignore_columns (list): Optional columns left out of the comparison
+            
+        Returns:
+            dict: Per-sheet comparison results and an aggregate summary
+        """
+        with ExcelReader(source_path) as reader:
+            source_sheets = reader.sheet_names
+        with ExcelReader(target_path) as reader:
+            target_sheets = reader.sheet_names
+        
+        sheet_names = diff_engine.ordered_union(source_sheets, target_sheets)
+        if sheets:
+            unknown = [name for name in sheets if name not in sheet_names]
+            if unknown:
+                raise SheetNotFoundError(f"Sheets not found in either workbook: {', '.join(unknown)}")
+            sheet_names = [name for name in sheet_names if name in sheets]
+        paired = [name for name in sheet_names if name in source_sheets and name in target_sheets]
+        workbook_bytes = os.path.getsize(source_path) + os.path.getsize(target_path)
+        
+        sheet_results = self._run_comparisons('compare_sheet', {
+            name: (source_path, target_path, name, key_columns, source_hash, target_hash, align_rows, tolerance,
+                   columns, ignore_columns)
+            for name in paired
+        }, progress=progress, unit='sheets', total_bytes=workbook_bytes)
+        
+        results = []
+        for name in sheet_names:
+            if name in sheet_results:
+                results.append(sheet_results[name])
+            else:
+                status = 'source_only' if name in source_sheets else 'target_only'
+                results.append({'sheet': name, 'status': status})
+        
+        return {
+            'fileType': 'xlsx',
+            'matchMode': 'workbook',
+            'summary': self._group_summary(results, 'Sheets'),
+            'sheets': results
+        }
+    
+    def compare_batch_file(self, name, source_path, target_path, key_columns=None,
+                           source_hash=None, target_hash=None, tolerance=None, columns=None, ignore_columns=None):
+        """
+        Compare one file pair of a batch (see compare_pair); the row data is
+        dropped so that the results of large batches stay small
+        """
+        file_type = self.get_file_type(name)
+        # Column selection applies to CSV/XLSX files only
+        options = {'columns': columns, 'ignore_columns': ignore_columns} if file_type != 'xml' else None
+        file_result = self.compare_pair(source_path, target_path, file_type,
+                                        key_columns=key_columns, source_hash=source_hash,
+                                        target_hash=target_hash, options=options, tolerance=tolerance)
+        file_result.pop('sourceData', None)
+        file_result.pop('targetData', None)
+        file_result['file'] = name
+        return file_result
+    
+    def compare_batch(self, source_files, target_files, key_columns=None, progress=None, tolerance=None,
+                      columns=None, ignore_columns=None):
+        """
+        Compare many file pairs, pairing source and target files by name
+        
+        Pairs are compared in parallel in a pool of worker processes; files
+        present on only one side are flagged as 'source_only' or 'target_only'.
+        
+        Args:
+            source_files (dict): File name -> (path, content hash) of the source files
+            target_files (dict): File name -> (path, content hash) of the target files
+            key_columns (list): Optional key columns used to match CSV/XLSX rows
+            progress (callable): Optional progress callback, told the pairs compared
+            tolerance (dict): Optional 'absolute' / 'relative' tolerance for numeric CSV/XLSX cells
+            columns (list): Optional CSV/XLSX columns to read and compare (default all)
+            ignore_columns (list): Optional CSV/XLSX columns left out of the comparison
+            
+        Returns:
+            dict: Per-file comparison results and an aggregate summary
+        """
+        names = diff_engine.ordered_union(sorted(source_files), sorted(target_files))
+        paired = [name for name in names if name in source_files and name in target_files]
+        paired_bytes = sum(os.path.getsize(source_files[name][0]) + os.path.getsize(target_files[name][0])
+                           for name in paired)
+        file_results = self._run_comparisons('compare_batch_file', {
+            name: (name, source_files[name][0], target_files[name][0], key_columns,
+                   source_files[name][1], target_files[name][1], tolerance, columns, ignore_columns)
+            for name in paired
+        }, progress=progress, unit='files', total_bytes=paired_bytes)
+        
+        results = []
+        for name in names:
+            if name in file_results:
+                results.append(file_results[name])
+            else:
+                status = 'source_only' if name in source_files else 'target_only'
+                results.append({'file': name, 'fileType': self.get_file_type(name), 'status': status})
+        
+        return {
+            'fileType': 'batch',
+            'matchMode': 'batch',
+            'summary': self._group_summary(results, 'Files'),
+            'pairs': results
+        }
+    
+    def _run_comparisons(self, method_name, jobs, progress=None, unit=None, total_bytes=None):
+        """
+        Call a comparison method once per job, in the worker pool when there
+        is more than one job, more than one worker and at least
+        concurrent_parse_min_bytes of input, and in this process otherwise
+        
+        Args:
+            method_name (str): Name of the FileDifferenceService method to call
+            jobs (dict): Job name -> tuple of method arguments
+            progress (callable): Optional progress callback, told the jobs finished
+            unit (str): Progress unit of a job (e.g. 'sheets')
+            total_bytes (int): Optional combined size of the compared files
             
-            # Add row comparison to result
-            comparison_result['rows'].append(row_comparison)
+        Returns:
+            dict: Job name -> method result
+        """
+        workers = min(self.max_workers, len(jobs))
+        if total_bytes is not None and total_bytes < self.concurrent_parse_min_bytes:
+            workers = 1
+        print(f"Running {len(jobs)} comparisons with {max(workers, 1)} worker processes")
+        self._report(progress, stage='comparing', processed=0, total=len(jobs), unit=unit)
+        results = {}
+        if workers <= 1:
+            for name, args in jobs.items():
+                results[name] = getattr(self, method_name)(*args)
+                self._report(progress, processed=len(results))
+            return results
+        
+        futures = {self._submit_to_workers(method_name, *args): name for name, args in jobs.items()}
+        try:
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                self._report(progress, processed=len(results))
+        except JobCancelled:
+            # Drop the comparisons that have not started yet
+            for future in futures:
+                future.cancel()
+            raise
+        return {name: results[name] for name in jobs}
+    
+    def compare_xml_records(self, source_data, target_data, record_element, key_paths, tolerance=None,
+                            progress=None):
+        """
+        Compare two XML files record by record
+        
+        The outermost elements named record_element are turned into the rows
+        of a table whose columns are the paths relative to the record (e.g.
+        @id or amount[1]), and the two tables are joined on the key paths as
+        in _compare_rows_by_key. Inserting or removing a record therefore
+        only reports that record instead of shifting every following path.
+        Paths outside the records are compared by path and listed in
+        documentDifferences. Path strings are only built for reported entries.
+        
+        Args:
+            source_data (dict): Source file data in standardized format
+            target_data (dict): Target file data in standardized format
+            record_element (str): Tag of the repeating record element (namespace optional)
+            key_paths (list): Key child elements / attributes relative to the
+                              record, e.g. ['@id'] or ['header/number']
+            tolerance (dict): Optional 'absolute' / 'relative' tolerance for numeric fields
+            progress (callable): Optional progress callback, told the matched records compared
+            
+        Returns:
+            dict: Comparison result with matchMode 'key' and recordElement
+            
+        Raises:
+            ComparisonRequestError: When no record or key path is found
+        """
+        source_tree = source_data['tree']
+        target_tree = target_data['tree']
+        source_nodes, source_fields, source_outside = source_tree.records(record_element)
+        target_nodes, target_fields, target_outside = target_tree.records(record_element)
+        if not source_nodes and not target_nodes:
+            raise ComparisonRequestError(f"No '{record_element}' records found in either file")
+        
+        source_columns = list(dict.fromkeys(path for fields in source_fields for path in fields))
+        target_columns = list(dict.fromkeys(path for fields in target_fields for path in fields))
+        key_columns = []
+        for key in key_paths:
+            source_key = resolve_relative_path(key, source_columns)
+            target_key = resolve_relative_path(key, target_columns)
+            if source_key is None or source_key != target_key:
+                raise ComparisonRequestError(f"Record key not found in both files: {key}")
+            key_columns.append(source_key)
+        
+        comparison_result = self._compare_rows_by_key(
+            {'columns': source_columns, 'table': ColumnarTable.from_rows(source_columns, source_fields)},
+            {'columns': target_columns, 'table': ColumnarTable.from_rows(target_columns, target_fields)},
+            'xml', key_columns, tolerance=tolerance, progress=progress
+        )
+        comparison_result['recordElement'] = record_element
+        
+        # Locate the reported records and fields in the documents (source
+        # lines of the record elements are None unless parsed with lxml)
+        def record_paths(tree, nodes, entries, index_key, line_key):
+            record_nodes = [nodes[entry[index_key]] for entry in entries]
+            paths = tree.paths(record_nodes)
+            for entry, path, node in zip(entries, paths, record_nodes):
+                column = entry.get('column', '.')
+                entry['path'] = path if column == '.' else f"{path}/{column}"
+                entry[line_key] = tree.line(node)
+        record_paths(source_tree, source_nodes, comparison_result['differences'], 'rowIndex', 'sourceLine')
+        for difference in comparison_result['differences']:
+            difference['targetLine'] = target_tree.line(target_nodes[difference['targetRowIndex']])
+        record_paths(source_tree, source_nodes, comparison_result['sourceOnly'], 'rowIndex', 'sourceLine')
+        record_paths(target_tree, target_nodes, comparison_result['targetOnly'], 'rowIndex', 'targetLine')
+        
+        # Paths outside the records are compared by path
+        source_document = dict(zip(source_tree.paths([source_tree.value_nodes[position] for position in source_outside]),
+                                   (source_tree.values[position] for position in source_outside)))
+        target_document = dict(zip(target_tree.paths([target_tree.value_nodes[position] for position in target_outside]),
+                                   (target_tree.values[position] for position in target_outside)))
+        document_differences = []
+        for path in diff_engine.ordered_union(list(source_document), list(target_document)):
+            source_value = source_document.get(path)
+            target_value = target_document.get(path)
+            source_str = source_value.strip() or None if source_value is not None else None
+            target_str = target_value.strip() or None if target_value is not None else None
+            if source_str == target_str:
+                continue
+            status = ('target_only' if source_str is None else 'source_only' if target_str is None
+                      else 'different')
+            document_differences.append({'column': path, 'sourceValue': source_value,
+                                         'targetValue': target_value, 'status': status})
+        comparison_result['documentDifferences'] = document_differences
+        comparison_result['summary'].update(
+            totalRecords=len(source_nodes),
+            targetRecords=len(target_nodes),
+            documentPaths=len(source_outside),
+            differingDocumentPaths=len(document_differences)
+        )
+        return comparison_result
+    
+    def compare_xml_files(self, source_data, target_data, progress=None):
+        """
+        Compare two XML files and generate a difference report
+        
+        Paths are matched on the flattened path tries of both files with a
+        hashed tree diff (see xml_diff.match_tries): subtrees whose content
+        hashes are equal are matched as a whole and their paths need no value
+        comparison. The result's 'rows' is a compact XmlPathComparison (one
+        status code per path); its path strings ('columns' of a full
+        response) and cells are only built when the result is serialized or
+        paged, so the comparison runs in linear time.
+        
+        Args:
+            source_data (dict): Source file data in standardized format
+            target_data (dict): Target file data in standardized format
+            progress (callable): Optional progress callback, told the source nodes matched
+            
+        Returns:
+            dict: Comparison result with differences highlighted
+        """
+        try:
+            self._report(progress, stage='comparing', processed=0, total=source_data['tree'].node_count,
+                         unit='nodes')
+            comparison, skipped_paths = xml_diff.compare_paths(source_data['tree'], target_data['tree'],
+                                                               progress=progress)
+            counts = comparison.status_counts()
+            
+            comparison_result = {
+                'fileType': 'xml',
+                'summary': {
+                    'totalRows': len(comparison),
+                    'matchingRows': counts['match'],
+                    'differingRows': len(comparison) - counts['match'],
+                    'fingerprintSkippedPaths': skipped_paths
+                },
+                'rows': comparison
+            }
             
             # Include original source file structure information
             if 'originalLines' in source_data:
                 comparison_result['originalSourceLines'] = source_data['originalLines']
             
             return comparison_result
+        except JobCancelled:
+            raise
         except Exception as e:
             import traceback
             error_details = traceback.format_exc()
@@ -425,9 +1672,54 @@ class FileDifferenceService:
             print(f"Error details: {error_details}")
             raise Exception(f"Error comparing XML files: {str(e)}")
     
+    def read_preview(self, stream, file_type, sheet=None):
+        """
+        Read the first preview_row_count rows of a CSV / XLSX file, or the
+        first preview_path_count paths of an XML file, without parsing the
+        rest of it
+        
+        Args:
+            stream: Readable (and, for XLSX, seekable) file object
+            file_type (str): Type of the file ('csv', 'xlsx' or 'xml')
+            sheet: Optional XLSX sheet name or index (default the first)
+            
+        Returns:
+            dict: Preview data in the standardized format
+        """
+        if file_type == 'csv':
+            df = pd.read_csv(stream, nrows=self.preview_row_count)
+            return self._table_data(df)
+        elif file_type == 'xlsx':
+            # openpyxl's read-only mode streams rows, so only the head is read
+            with ExcelReader(stream, engine='openpyxl') as reader:
+                return self._table_data(reader.read_sheet(sheet, nrows=self.preview_row_count))
+        elif file_type == 'xml':
+            columns = []
+            row = {}
+            for path, value, _ in itertools.islice(iter_xml_paths(stream), self.preview_path_count):
+                columns.append(path)
+                row[path] = value
+            return {
+                'columns': columns,
+                'rows': [row]
+            }
+        else:
+            raise ValueError(f"Unsupported file type: {file_type}")
+    
+    def _table_data(self, df):
+        """Drop unnamed columns from a parsed DataFrame and wrap it as table data"""
+        unnamed_cols = [col for col in df.columns if 'Unnamed:' in str(col)]
+        if unnamed_cols:
+            df = df.drop(columns=unnamed_cols)
+        table = ColumnarTable.from_frame(df)
+        return {
+            'columns': table.columns,
+            'table': table
+        }
+    
     def preview_file(self, request):
         """
-        Process a single file and return a preview of its data
+        Return a preview of a single uploaded file, reading only its beginning
         """
         try:
             # Check if file is present in the request
@@ -447,23 +1739,16 @@ class FileDifferenceService:
             # Get file type
             file_type = self.get_file_type(file.filename)
             
-            # Save file
-            filename = secure_filename(file.filename)
-            file_path = os.path.join(self.upload_folder, filename)
-            file.save(file_path)
-            
-            print(f"File saved to {file_path}, processing for preview...")
+            print(f"Reading preview of {file.filename}...")
             
-            # Process file based on its type
+            # Read only the beginning of the file, straight from the upload
             try:
-                preview_data = self.process_file(file_path, file_type)
-                
-                # For preview, limit to first 10 rows
-                if 'rows' in preview_data and len(preview_data['rows']) > 10:
-                    preview_data['rows'] = preview_data['rows'][:10]
-                
+                preview_data = self.read_preview(file.stream, file_type, sheet=request.form.get('sheet') or None)
+                preview_data = self.to_json_ready(preview_data)
                 print(f"Preview data generated successfully with {len(preview_data.get('rows', []))} rows")
                 return jsonify(preview_data)
+            except SheetNotFoundError as e:
+                return jsonify({'error': str(e)}), 400
             except Exception as e:
                 import traceback
                 error_details = traceback.format_exc()
@@ -486,53 +1771,722 @@ class FileDifferenceService:
         Process the uploaded files and compare them
         """
         try:
-            # Check if both files are present in the request
-            if 'sourceFile' not in request.files or 'targetFile' not in request.files:
-                return jsonify({'error': 'Both source and target files are required'}), 400
+            params, error_response = self._prepare_comparison(request)
+            if error_response is not None:
+                return error_response
             
-            source_file = request.files['sourceFile']
-            target_file = request.files['targetFile']
+            try:
+                comparison_result = self.run_comparison(params)
+            except (ComparisonRequestError, SheetNotFoundError) as e:
+                return jsonify({'error': str(e)}), 400
             
-            # Check if filenames are empty
-            if source_file.filename == '' or target_file.filename == '':
-                return jsonify({'error': 'No selected file'}), 400
+            return jsonify(self._store_result(comparison_result, params['paginate']))
+        except Exception as e:
+            import traceback
+            error_details = traceback.format_exc()
+            return jsonify({'error': str(e), 'details': error_details}), 500
+    
+    def _prepare_comparison(self, request):
+        """
+        Validate an upload request, save both files and read the comparison
+        options from the form
+        
+        Returns:
+            tuple: (comparison parameters for run_comparison, None), or
+                   (None, error response) when the request is invalid
+        """
+        # Check if both files are present in the request
+        if 'sourceFile' not in request.files or 'targetFile' not in request.files:
+            return None, (jsonify({'error': 'Both source and target files are required'}), 400)
+        
+        source_file = request.files['sourceFile']
+        target_file = request.files['targetFile']
+        
+        # Check if filenames are empty
+        if source_file.filename == '' or target_file.filename == '':
+            return None, (jsonify({'error': 'No selected file'}), 400)
+        
+        # Check if files are allowed types
+        if not (self.allowed_file(source_file.filename) and self.allowed_file(target_file.filename)):
+            return None, (jsonify({'error': 'File type not supported'}), 400)
+        
+        # Check if files are of the same type
+        source_type = self.get_file_type(source_file.filename)
+        target_type = self.get_file_type(target_file.filename)
+        
+        if source_type != target_type:
+            return None, (jsonify({'error': 'Files are of different types. Please upload files of the same format.'}), 400)
+        
+        # Optional key columns switch CSV/XLSX comparison to key-based row matching
+        key_columns = self.parse_column_list(request.form.get('keyColumns'))
+        
+        params = {
+            'mode': 'files',
+            'file_type': source_type,
+            'key_columns': key_columns,
+            # In paginated mode only the result id and summary are returned;
+            # details are fetched through the results endpoints
+            'paginate': request.form.get('paginate', '').lower() == 'true',
+            # Row alignment detects inserted / deleted CSV/XLSX rows in files without a key
+            'align_rows': request.form.get('alignRows', '').lower() == 'true',
+            # XLSX sheets are chosen with sourceSheet / targetSheet (or sheet
+            # for both), by name or index
+            'source_options': {'sheet': request.form.get('sourceSheet') or request.form.get('sheet') or None},
+            'target_options': {'sheet': request.form.get('targetSheet') or request.form.get('sheet') or None}
+        }
+        
+        if params['align_rows'] and key_columns:
+            return None, (jsonify({'error': 'alignRows cannot be combined with keyColumns'}), 400)
+        
+        # XML records (repeated elements) can be matched on keyColumns relative to the record
+        params['record_element'] = request.form.get('recordElement') or None
+        if params['record_element'] and source_type != 'xml':
+            return None, (jsonify({'error': 'recordElement is only supported for XML files'}), 400)
+        if params['record_element'] and not key_columns:
+            return None, (jsonify({'error': 'recordElement requires keyColumns'}), 400)
+        
+        # Optional tolerance for numeric cells (absTolerance / relTolerance)
+        try:
+            params['tolerance'] = self.parse_tolerance(request.form)
+        except ValueError as e:
+            return None, (jsonify({'error': str(e)}), 400)
+        
+        # Optional columns / ignoreColumns lists, pushed down into the CSV/XLSX parsers
+        try:
+            columns, ignore_columns = self.parse_column_selection(request.form, key_columns)
+        except ValueError as e:
+            return None, (jsonify({'error': str(e)}), 400)
+        if (columns or ignore_columns) and source_type == 'xml':
+            return None, (jsonify({'error': 'Column selection is only supported for CSV/XLSX files'}), 400)
+        params.update(columns=columns, ignore_columns=ignore_columns)
+        for options in (params['source_options'], params['target_options']):
+            options.update(columns=columns, ignore_columns=ignore_columns)
+        
+        # Summary-only mode keeps counters and the first maxDifferences example
+        # differences; CSV files are then compared in one streaming pass (an
+        # external sort-merge when rows are matched by key)
+        params['summary_only'] = request.form.get('summaryOnly', '').lower() == 'true'
+        if params['summary_only'] and source_type == 'xml':
+            return None, (jsonify({'error': 'Summary-only comparison is only supported for CSV/XLSX files'}), 400)
+        default_max_differences = (self.summary_example_count if params['summary_only']
+                                   else self.default_max_differences)
+        summary_csv = params['summary_only'] and source_type == 'csv' and not params['align_rows']
+        
+        # Streaming mode compares large CSV files chunk by chunk
+        if request.form.get('streaming', '').lower() == 'true' or (summary_csv and not key_columns):
+            if source_type != 'csv':
+                return None, (jsonify({'error': 'Streaming comparison is only supported for CSV files'}), 400)
+            if key_columns:
+                return None, (jsonify({'error': 'Streaming comparison does not support key columns'}), 400)
+            if params['align_rows']:
+                return None, (jsonify({'error': 'Streaming comparison does not support row alignment'}), 400)
+            try:
+                chunk_size = int(request.form.get('chunkSize') or self.default_chunk_size)
+                max_differences = int(request.form.get('maxDifferences') or default_max_differences)
+            except ValueError:
+                return None, (jsonify({'error': 'chunkSize and maxDifferences must be integers'}), 400)
+            if chunk_size <= 0 or max_differences < 0:
+                return None, (jsonify({'error': 'chunkSize must be positive and maxDifferences non-negative'}), 400)
+            params.update(mode='streaming', chunk_size=chunk_size, max_differences=max_differences)
+            if params['summary_only'] and not request.form.get('chunkSize'):
+                # Chunks are sized from the memory budget instead of a row count
+                params.update(chunk_size=None, memory_budget=self.sort_memory_budget)
+        
+        # External sort mode joins large CSV files on key columns within a memory budget
+        elif request.form.get('externalSort', '').lower() == 'true' or summary_csv:
+            if source_type != 'csv':
+                return None, (jsonify({'error': 'External sort comparison is only supported for CSV files'}), 400)
+            if not key_columns:
+                return None, (jsonify({'error': 'External sort comparison requires keyColumns'}), 400)
+            try:
+                memory_budget = int(request.form.get('memoryBudget') or self.sort_memory_budget // (1024 * 1024))
+                max_differences = int(request.form.get('maxDifferences') or default_max_differences)
+            except ValueError:
+                return None, (jsonify({'error': 'memoryBudget and maxDifferences must be integers'}), 400)
+            if memory_budget <= 0 or max_differences < 0:
+                return None, (jsonify({'error': 'memoryBudget must be positive and maxDifferences non-negative'}), 400)
+            params.update(mode='sorted', memory_budget=memory_budget * 1024 * 1024,
+                          max_differences=max_differences)
+        
+        # Workbook mode compares all (or the listed) sheets of two XLSX files
+        elif request.form.get('workbook', '').lower() == 'true':
+            if source_type != 'xlsx':
+                return None, (jsonify({'error': 'Workbook comparison is only supported for XLSX files'}), 400)
+            params.update(mode='workbook', sheets=self.parse_column_list(request.form.get('sheets')))
+        
+        # In-memory summary-only comparisons are reduced afterwards
+        if params['summary_only'] and 'max_differences' not in params:
+            try:
+                params['max_differences'] = int(request.form.get('maxDifferences') or default_max_differences)
+            except ValueError:
+                return None, (jsonify({'error': 'maxDifferences must be an integer'}), 400)
+            if params['max_differences'] < 0:
+                return None, (jsonify({'error': 'maxDifferences must be non-negative'}), 400)
+        
+        # Save files
+        source_filename = secure_filename(source_file.filename)
+        target_filename = secure_filename(target_file.filename)
+        if target_filename == source_filename:
+            # Keep both uploads on disk so each path holds its own content
+            target_filename = f"target_{target_filename}"
+        
+        params['source_path'] = os.path.join(self.upload_folder, source_filename)
+        params['target_path'] = os.path.join(self.upload_folder, target_filename)
+        params['source_hash'] = self.save_upload(source_file, params['source_path'])
+        params['target_hash'] = self.save_upload(target_file, params['target_path'])
+        return params, None
+    
+    def run_comparison(self, params, progress=None):
+        """
+        Run a comparison prepared by _prepare_comparison
+        
+        Args:
+            params (dict): Comparison parameters
+            progress (callable): Optional progress callback, called with
+                                 stage / processed / total / unit keywords
             
-            # Check if files are allowed types
-            if not (self.allowed_file(source_file.filename) and self.allowed_file(target_file.filename)):
-                return jsonify({'error': 'File type not supported'}), 400
+        Returns:
+            dict: Comparison result
+            
+        Raises:
+            ComparisonRequestError: When the key columns are missing from a file
+            SheetNotFoundError: When a requested sheet does not exist
+        """
+        comparison_result = self._run_comparison(params, progress)
+        if params.get('summary_only'):
+            return self.summarize_result(comparison_result, params['max_differences'])
+        return comparison_result
+    
+    def _run_comparison(self, params, progress=None):
+        """Dispatch a prepared comparison to the comparison method of its mode"""
+        # Byte-identical uploads need neither parsing nor comparison
+        if (params['mode'] != 'workbook' and params['source_hash'] == params['target_hash']
+                and params['source_options'] == params['target_options']):
+            self._report(progress, stage='identical')
+            comparison_result = self.identical_result(params['source_path'], params['file_type'],
+                                                      content_hash=params['source_hash'],
+                                                      options=params['source_options'])
+            missing_keys = [col for col in params['key_columns'] if col not in comparison_result.get('headers', [])]
+            if missing_keys and params['file_type'] != 'xml':
+                raise ComparisonRequestError(f"Key columns not found in both files: {', '.join(missing_keys)}")
+            return comparison_result
+        
+        if params['mode'] == 'streaming':
+            return self.compare_csv_streaming(params['source_path'], params['target_path'],
+                                              params['chunk_size'], params['max_differences'],
+                                              progress=progress, tolerance=params['tolerance'],
+                                              columns=params['columns'], ignore_columns=params['ignore_columns'],
+                                              memory_budget=params.get('memory_budget'))
+        if params['mode'] == 'sorted':
+            return self.compare_csv_sorted(params['source_path'], params['target_path'], params['key_columns'],
+                                           memory_budget=params['memory_budget'],
+                                           max_differences=params['max_differences'], progress=progress,
+                                           tolerance=params['tolerance'], columns=params['columns'],
+                                           ignore_columns=params['ignore_columns'])
+        if params['mode'] == 'workbook':
+            return self.compare_workbooks(params['source_path'], params['target_path'],
+                                          key_columns=params['key_columns'], sheets=params['sheets'],
+                                          source_hash=params['source_hash'], target_hash=params['target_hash'],
+                                          progress=progress, align_rows=params['align_rows'],
+                                          tolerance=params['tolerance'], columns=params['columns'],
+                                          ignore_columns=params['ignore_columns'])
+        
+        # Process files based on their type
+        file_type = params['file_type']
+        key_columns = params['key_columns']
+        source_data, target_data = self.process_pair(params['source_path'], params['target_path'], file_type,
+                                                     source_hash=params['source_hash'],
+                                                     target_hash=params['target_hash'],
+                                                     source_options=params['source_options'],
+                                                     target_options=params['target_options'],
+                                                     progress=progress)
+        
+        if key_columns and file_type != 'xml':
+            missing_keys = [col for col in key_columns
+                            if col not in source_data['columns'] or col not in target_data['columns']]
+            if missing_keys:
+                raise ComparisonRequestError(f"Key columns not found in both files: {', '.join(missing_keys)}")
+        
+        # Compare the files
+        return self.compare_files(source_data, target_data, file_type=file_type,
+                                  key_columns=key_columns, align_rows=params['align_rows'],
+                                  tolerance=params['tolerance'], record_element=params.get('record_element'),
+                                  progress=progress)
+    
+    def summarize_result(self, comparison_result, max_examples):
+        """
+        Reduce a comparison result to its summary: the row data is dropped
+        and at most max_examples differences and one-sided rows are kept.
+        Workbook results are reduced sheet by sheet.
+        
+        Args:
+            comparison_result (dict): Result of a CSV/XLSX or workbook comparison
+            max_examples (int): Number of example differences to keep
+            
+        Returns:
+            dict: The reduced result, flagged with summaryOnly
+        """
+        for sheet_result in comparison_result.get('sheets', []):
+            self.summarize_result(sheet_result, max_examples)
+        comparison_result.pop('sourceData', None)
+        comparison_result.pop('targetData', None)
+        for field in ('differences', 'sourceOnly', 'targetOnly'):
+            examples = comparison_result.get(field)
+            if examples is not None and len(examples) > max_examples:
+                comparison_result[field] = examples[:max_examples]
+                comparison_result['truncated'] = True
+        comparison_result['summaryOnly'] = True
+        return comparison_result
+    
+    def _report(self, progress, **kwargs):
+        """Pass progress to an optional progress callback"""
+        if progress is not None:
+            progress(**kwargs)
+    
+    def submit_job(self, request):
+        """
+        Queue a comparison of two uploaded files (same form fields as
+        upload_files) and return its job id right away
+        """
+        try:
+            params, error_response = self._prepare_comparison(request)
+            if error_response is not None:
+                return error_response
+            
+            job = self.job_queue.submit(self._run_job, params)
+            print(f"Queued comparison job {job.id}")
+            return jsonify(self._job_status(job)), 202
+        except Exception as e:
+            import traceback
+            error_details = traceback.format_exc()
+            return jsonify({'error': str(e), 'details': error_details}), 500
+    
+    def _run_job(self, job, params):
+        """Run a queued comparison and return the id of its stored result"""
+        comparison_result = self.run_comparison(params, progress=job.update)
+        return self.result_store.put(comparison_result, self._result_size(comparison_result))
+    
+    def _job_status(self, job):
+        """Return the status of a job, with the result id and summary once it completed"""
+        status = job.to_dict()
+        if job.status == 'completed':
+            status['resultId'] = job.result
+            comparison_result = self.result_store.get(job.result)
+            if comparison_result is not None:
+                status['summary'] = comparison_result['summary']
+        return status
+    
+    def get_job(self, job_id):
+        """
+        Return the status and progress of a comparison job
+        """
+        job = self.job_queue.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(self._job_status(job))
+    
+    def cancel_job(self, job_id):
+        """
+        Cancel a queued or running comparison job
+        """
+        job = self.job_queue.cancel(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(self._job_status(job))
+    
+    def get_job_result(self, job_id):
+        """
+        Return the full comparison result of a completed job
+        """
+        job = self.job_queue.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        if job.status != 'completed':
+            return jsonify({'error': f"Job is {job.status}", 'job': self._job_status(job)}), 409
+        comparison_result = self.result_store.get(job.result)
+        if comparison_result is None:
+            return jsonify({'error': 'Result not found or expired'}), 404
+        comparison_result['resultId'] = job.result
+        return jsonify(self.to_json_ready(comparison_result))
+    
+    def batch_compare(self, request):
+        """
+        Compare many file pairs uploaded as ZIP archives, pairing files by name:
+        either one archive with source/ and target/ folders, or a source and
+        a target archive
+        """
+        try:
+            if 'archive' in request.files:
+                archives = {None: request.files['archive']}
+            elif 'sourceArchive' in request.files and 'targetArchive' in request.files:
+                archives = {'source': request.files['sourceArchive'], 'target': request.files['targetArchive']}
+            else:
+                return jsonify({'error': 'Either archive or both sourceArchive and targetArchive are required'}), 400
+            
+            key_columns = self.parse_column_list(request.form.get('keyColumns'))
+            paginate = request.form.get('paginate', '').lower() == 'true'
+            try:
+                tolerance = self.parse_tolerance(request.form)
+                columns, ignore_columns = self.parse_column_selection(request.form, key_columns)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            # Extract into a folder of its own, removed once the batch is compared
+            batch_folder = os.path.join(self.upload_folder, f"batch_{uuid.uuid4().hex}")
+            try:
+                files = {}
+                skipped = []
+                for side, archive in archives.items():
+                    folder = batch_folder if side is None else os.path.join(batch_folder, side)
+                    try:
+                        extracted, skipped_members = self._extract_archive(archive.stream, folder)
+                    except zipfile.BadZipFile:
+                        return jsonify({'error': f"{archive.filename} is not a valid ZIP archive"}), 400
+                    skipped.extend(skipped_members)
+                    # Zipping a folder (rather than its content) wraps every
+                    # file in it; a single archive keeps its source/ and target/
+                    extracted = self._strip_wrapping_folder(extracted, ('source', 'target') if side is None else ())
+                    files.update(extracted if side is None else
+                                 {f"{side}/{name}": entry for name, entry in extracted.items()})
+                
+                source_files = {name[len('source/'):]: entry for name, entry in files.items()
+                                if name.startswith('source/')}
+                target_files = {name[len('target/'):]: entry for name, entry in files.items()
+                                if name.startswith('target/')}
+                skipped.extend(name for name in files if not name.startswith(('source/', 'target/')))
+                if not source_files and not target_files:
+                    return jsonify({'error': 'No supported source or target files found in the upload'}), 400
+                
+                print(f"Comparing batch of {len(source_files)} source and {len(target_files)} target files")
+                comparison_result = self.compare_batch(source_files, target_files, key_columns=key_columns,
+                                                       tolerance=tolerance, columns=columns,
+                                                       ignore_columns=ignore_columns)
+            finally:
+                shutil.rmtree(batch_folder, ignore_errors=True)
+            
+            comparison_result['skippedFiles'] = skipped
+            return jsonify(self._store_result(comparison_result, paginate))
+        except Exception as e:
+            import traceback
+            error_details = traceback.format_exc()
+            return jsonify({'error': str(e), 'details': error_details}), 500
+    
+    def _extract_archive(self, archive, folder):
+        """
+        Extract the supported files of a ZIP archive, with sanitized paths
+        
+        Args:
+            archive: Binary, seekable file object of the archive
+            folder (str): Destination folder
+            
+        Returns:
+            tuple: (dict of relative file name -> (path, content hash), list of
+                    skipped member names)
+        """
+        files = {}
+        skipped = []
+        with zipfile.ZipFile(archive) as zip_file:
+            for member in zip_file.infolist():
+                if member.is_dir():
+                    continue
+                parts = member.filename.replace('\\', '/').split('/')
+                if any(part.startswith('.') and part not in ('.', '..') or part == '__MACOSX' for part in parts):
+                    # Hidden files and macOS resource forks
+                    continue
+                parts = [secure_filename(part) for part in parts]
+                name = '/'.join(part for part in parts if part)
+                if not name or not self.allowed_file(name):
+                    skipped.append(member.filename)
+                    continue
+                
+                file_path = os.path.join(folder, *name.split('/'))
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                with zip_file.open(member) as stream:
+                    files[name] = (file_path, self._copy_stream(stream, file_path))
+        return files, skipped
+    
+    def _strip_wrapping_folder(self, files, keep=()):
+        """
+        Drop the top-level folder of extracted archive files when every file
+        lies below the same one, unless that folder's name is in keep
+        
+        Args:
+            files (dict): Relative file name -> (path, content hash)
+            keep (tuple): Folder names that are not stripped
             
-            # Check if files are of the same type
-            source_type = self.get_file_type(source_file.filename)
-            target_type = self.get_file_type(target_file.filename)
+        Returns:
+            dict: The files keyed by their name inside the wrapping folder
+        """
+        folders = {name.split('/', 1)[0] if '/' in name else None for name in files}
+        if len(folders) != 1 or None in folders or folders & set(keep):
+            return files
+        prefix_length = len(folders.pop()) + 1
+        return {name[prefix_length:]: entry for name, entry in files.items()}
+    
+    def _store_result(self, comparison_result, paginate):
+        """
+        Build the response of a comparison: the full result, or only its
+        summary and resultId when paginate is set. Only paginated results are
+        kept in the result store; full results are not held after responding.
+        """
+        if not paginate:
+            return self.to_json_ready(comparison_result)
+        comparison_result['resultId'] = self.result_store.put(comparison_result,
+                                                              self._result_size(comparison_result))
+        return self._result_overview(comparison_result)
+    
+    def _result_size(self, comparison_result):
+        """
+        Approximate the bytes held by a comparison result: its tables and XML
+        path comparisons plus result_entry_bytes per listed entry
+        """
+        size = 0
+        for key, value in comparison_result.items():
+            if isinstance(value, (ColumnarTable, xml_diff.XmlPathComparison)):
+                size += value.memory_usage()
+            elif key in ('sheets', 'pairs'):
+                size += sum(self._result_size(entry) for entry in value)
+            elif isinstance(value, list):
+                size += len(value) * self.result_entry_bytes
+        return size
+    
+    def _result_overview(self, comparison_result):
+        """Return a result without its row data and difference lists, plus the number of differences"""
+        overview = {key: value for key, value in comparison_result.items() if key not in self.detail_keys}
+        group = self.group_keys.get(comparison_result.get('matchMode'))
+        if group:
+            entries = [self._result_overview(entry) for entry in comparison_result[group[0]]]
+            overview[group[0]] = entries
+            overview['differenceCount'] = sum(entry['differenceCount'] for entry in entries)
+            return overview
+        
+        if isinstance(comparison_result.get('rows'), xml_diff.XmlPathComparison):
+            overview['differenceCount'] = comparison_result['rows'].difference_count()
+        else:
+            overview['differenceCount'] = len(self._result_differences(comparison_result))
+        return overview
+    
+    def _result_differences(self, comparison_result):
+        """
+        Return the differences of a stored result as a flat list. For XML this
+        lists the paths whose status is not 'match' with their source and
+        target value; for a workbook / batch comparison every difference
+        carries its sheet / file name.
+        """
+        group = self.group_keys.get(comparison_result.get('matchMode'))
+        if group:
+            list_key, name_key = group
+            return [dict(diff, **{name_key: entry[name_key]})
+                    for entry in comparison_result[list_key]
+                    for diff in self._result_differences(entry)]
+        if not self._is_xml_path_result(comparison_result):
+            return comparison_result.get('differences', [])
+        rows = comparison_result.get('rows')
+        # Identical XML files carry no path comparison
+        return rows.entries(rows.difference_indexes()) if isinstance(rows, xml_diff.XmlPathComparison) else []
+    
+    def _is_xml_path_result(self, comparison_result):
+        """Return True for an XML result listing every path (not matched by record)"""
+        return comparison_result.get('fileType') == 'xml' and comparison_result.get('matchMode') != 'key'
+    
+    def _parse_page(self, request):
+        """Read offset / limit query parameters, raising ValueError when invalid"""
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', self.default_page_size))
+        if offset < 0 or limit <= 0:
+            raise ValueError('offset must be non-negative and limit positive')
+        return offset, min(limit, self.max_page_size)
+    
+    def get_result(self, result_id):
+        """
+        Return the summary of a stored comparison result
+        """
+        comparison_result = self.result_store.get(result_id)
+        if comparison_result is None:
+            return jsonify({'error': 'Result not found or expired'}), 404
+        return jsonify(self._result_overview(comparison_result))
+    
+    def get_result_differences(self, result_id, request):
+        """
+        Return a page of differences of a stored comparison result, optionally
+        filtered by column (path for XML), by sheet / file for workbook and
+        batch comparisons and by status (XML paths)
+        """
+        try:
+            comparison_result = self.result_store.get(result_id)
+            if comparison_result is None:
+                return jsonify({'error': 'Result not found or expired'}), 404
             
-            if source_type != target_type:
-                return jsonify({'error': 'Files are of different types. Please upload files of the same format.'}), 400
+            try:
+                offset, limit = self._parse_page(request)
+            except ValueError as e:
+                return jsonify({'error': f"Invalid paging parameters: {str(e)}"}), 400
             
-            # Save files
-            source_filename = secure_filename(source_file.filename)
-            target_filename = secure_filename(target_file.filename)
+            column = request.args.get('column')
+            status = request.args.get('status')
+            rows = comparison_result.get('rows')
+            if (isinstance(rows, xml_diff.XmlPathComparison)
+                    and not request.args.get('sheet') and not request.args.get('file')):
+                # Filter the compact path statuses and only build the cells of the page
+                indexes = rows.select(path=column, status=status)
+                return jsonify({
+                    'resultId': result_id,
+                    'offset': offset,
+                    'limit': limit,
+                    'total': len(indexes),
+                    'differences': rows.entries(indexes[offset:offset + limit])
+                })
             
-            source_path = os.path.join(self.upload_folder, source_filename)
-            target_path = os.path.join(self.upload_folder, target_filename)
+            differences = self._result_differences(comparison_result)
+            for name_key in ('sheet', 'file'):
+                name = request.args.get(name_key)
+                if name:
+                    differences = [diff for diff in differences if diff.get(name_key) == name]
+            if column:
+                differences = [diff for diff in differences if str(diff.get('column')) == column]
+            if status:
+                differences = [diff for diff in differences if diff.get('status') == status]
             
-            source_file.save(source_path)
-            target_file.save(target_path)
+            return jsonify({
+                'resultId': result_id,
+                'offset': offset,
+                'limit': limit,
+                'total': len(differences),
+                'differences': differences[offset:offset + limit]
+            })
+        except Exception as e:
+            import traceback
+            error_details = traceback.format_exc()
+            return jsonify({'error': str(e), 'details': error_details}), 500
+    
+    def get_result_rows(self, result_id, request):
+        """
+        Return a window of source or target rows of a stored CSV/XLSX result,
+        each with its comparison status, optionally filtered by status. For a
+        workbook comparison the sheet query parameter selects the sheet.
+        """
+        try:
+            comparison_result = self.result_store.get(result_id)
+            if comparison_result is None:
+                return jsonify({'error': 'Result not found or expired'}), 404
+            
+            if comparison_result.get('matchMode') == 'workbook':
+                sheet = request.args.get('sheet')
+                sheet_results = [entry for entry in comparison_result['sheets'] if entry['sheet'] == sheet]
+                if not sheet_results:
+                    return jsonify({'error': 'A sheet of the workbook comparison is required'}), 400
+                comparison_result = sheet_results[0]
             
-            # Process files based on their type
-            source_data = self.process_file(source_path, source_type)
-            target_data = self.process_file(target_path, target_type)
+            side = request.args.get('side', 'source')
+            if side not in ('source', 'target'):
+                return jsonify({'error': "side must be 'source' or 'target'"}), 400
+            table = comparison_result.get('sourceData' if side == 'source' else 'targetData')
+            if not isinstance(table, ColumnarTable):
+                return jsonify({'error': 'Row data is not available for this result'}), 400
+            
+            try:
+                offset, limit = self._parse_page(request)
+            except ValueError as e:
+                return jsonify({'error': f"Invalid paging parameters: {str(e)}"}), 400
             
-            # Compare the files
-            comparison_result = self.compare_files(source_data, target_data, file_type=source_type)
+            statuses = self._row_statuses(comparison_result, side, len(table))
+            status = request.args.get('status')
+            positions = np.flatnonzero(statuses == status) if status else np.arange(len(table))
+            page_positions = positions[offset:offset + limit]
             
-            return jsonify(comparison_result)
+            rows = table.take(page_positions).to_rows()
+            return jsonify({
+                'resultId': result_id,
+                'side': side,
+                'offset': offset,
+                'limit': limit,
+                'total': len(positions),
+                'rows': [
+                    {'rowIndex': position, 'status': row_status, 'values': row}
+                    for position, row_status, row in zip(
+                        page_positions.tolist(), statuses[page_positions].tolist(), rows
+                    )
+                ]
+            })
         except Exception as e:
             import traceback
             error_details = traceback.format_exc()
             return jsonify({'error': str(e), 'details': error_details}), 500
     
+    def _row_statuses(self, comparison_result, side, row_count):
+        """
+        Return the status of every source or target row of a CSV/XLSX result:
+        'match', 'different', 'source_only' or 'target_only'
+        """
+        statuses = np.full(row_count, 'match', dtype=object)
+        index_key = 'rowIndex' if side == 'source' else 'targetRowIndex'
+        positional = comparison_result.get('matchMode') not in ('key', 'aligned')
+        
+        for diff in comparison_result.get('differences', []):
+            row_index = diff.get('rowIndex') if positional else diff.get(index_key)
+            if row_index is not None and row_index < row_count:
+                statuses[row_index] = 'different'
+        
+        if positional and side == 'target':
+            # Target rows past the end of the source are not compared
+            statuses[comparison_result['summary']['totalRows']:] = 'target_only'
+        
+        unmatched = comparison_result.get('sourceOnly' if side == 'source' else 'targetOnly', [])
+        for entry in unmatched:
+            statuses[entry['rowIndex']] = 'source_only' if side == 'source' else 'target_only'
+        return statuses
+    
     def health_check(self):
         """
         Simple health check endpoint
         """
-        return jsonify({'status': 'ok'})
+        return jsonify({'status': 'ok', 'parseCache': self.parse_cache.stats()})
+
+
+# Service used by comparison worker processes, created by _init_worker
+_worker_service = None
+
+
+def _init_worker(upload_folder, cache_folder):
+    """
+    Create the FileDifferenceService of a comparison worker process; it
+    parses and compares in the worker itself rather than starting a pool
+    """
+    global _worker_service
+    _worker_service = FileDifferenceService(upload_folder, cache_folder)
+    _worker_service.max_workers = 1
+
+
+def _run_in_worker(method_name, *args):
+    """Call a FileDifferenceService method in a worker process"""
+    return getattr(_worker_service, method_name)(*args)
+
+
+class _ProgressReader(io.RawIOBase):
+    """
+    Binary file wrapper passing the number of bytes read so far to a
+    callback every report_bytes bytes, so parsers reading from it report
+    their progress (and a cancelled job stops while its files are parsed)
+    """
+    
+    def __init__(self, raw, report_bytes, callback):
+        self._raw = raw
+        self._report_bytes = report_bytes
+        self._callback = callback
+        self._count = 0
+        self._next_report = report_bytes
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        count = self._raw.readinto(buffer)
+        self._count += count or 0
+        if self._count >= self._next_report:
+            self._next_report = self._count + self._report_bytes
+            self._callback(self._count)
+        return count
+    
+    def close(self):
+        self._raw.close()
+        super().close()
@@ -0,0 +1,158 @@
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job when its cancellation was requested"""
+
+
+class Job:
+    """
+    A queued comparison with its status and progress. Running work reports
+    progress through update(), which is also where a requested cancellation
+    takes effect.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = 'queued'  # queued, running, completed, failed or cancelled
+        self.stage = None
+        self.processed = 0
+        self.total = None
+        self.unit = 'rows'
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self._cancel_requested = threading.Event()
+
+    def update(self, stage=None, processed=None, total=None, unit=None):
+        """
+        Record progress of the running job
+
+        Raises:
+            JobCancelled: When the job has been asked to stop
+        """
+        if stage is not None:
+            self.stage = stage
+        if processed is not None:
+            self.processed = processed
+        if total is not None:
+            self.total = total
+        if unit is not None:
+            self.unit = unit
+        if self._cancel_requested.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_requested.is_set()
+
+    def request_cancel(self):
+        self._cancel_requested.set()
+
+    @property
+    def percent(self):
+        if self.status == 'completed':
+            return 100.0
+        if not self.total:
+            return None
+        return round(min(100.0, 100.0 * self.processed / self.total), 1)
+
+    def to_dict(self):
+        return {
+            'jobId': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'processed': self.processed,
+            'total': self.total,
+            'unit': self.unit,
+            'percent': self.percent,
+            'cancelRequested': self.cancel_requested,
+            'error': self.error,
+            'createdAt': self.created_at,
+            'startedAt': self.started_at,
+            'finishedAt': self.finished_at
+        }
+
+
+class JobQueue:
+    """
+    In-process job queue: submitted functions run on a pool of worker
+    threads while their Job records can be polled and cancelled. Finished
+    jobs are kept until more than max_jobs jobs are held.
+    """
+
+    def __init__(self, max_workers=2, max_jobs=200):
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='comparison-job')
+        self._jobs = OrderedDict()  # job id -> Job
+        self._lock = threading.Lock()
+
+    def submit(self, function, *args):
+        """
+        Queue function(job, *args) and return its Job; the return value of
+        the function becomes job.result
+        """
+        job = Job()
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        job.future = self._executor.submit(self._run, job, function, args)
+        return job
+
+    def get(self, job_id):
+        """Return a job, or None if it is unknown"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        Cancel a job: a queued job never starts, a running one stops at its
+        next progress update. Returns the job, or None if it is unknown.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if job.status in ('queued', 'running'):
+            job.request_cancel()
+            if job.future is not None and job.future.cancel():
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+        return job
+
+    def _run(self, job, function, args):
+        if job.cancel_requested:
+            job.status = 'cancelled'
+            job.finished_at = time.time()
+            return
+        job.status = 'running'
+        job.started_at = time.time()
+        try:
+            job.result = function(job, *args)
+            job.status = 'completed'
+        except JobCancelled:
+            job.status = 'cancelled'
+        except Exception as e:
+            print(f"Job {job.id} failed: {str(e)}")
+            print(f"Error details: {traceback.format_exc()}")
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self):
+        """Drop the oldest finished jobs beyond max_jobs (caller holds the lock)"""
+        excess = len(self._jobs) - self.max_jobs
+        if excess <= 0:
+            return
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if job.status in ('completed', 'failed', 'cancelled')]
+        for job_id in finished[:excess]:
+            del self._jobs[job_id]
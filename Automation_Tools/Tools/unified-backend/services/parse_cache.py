@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import pickle
+import stat
+import threading
+
+
+# Version of the parsed representation; bumping it invalidates older entries
+CACHE_FORMAT = 4
+
+
+class ParseCache:
+    """
+    Disk cache of parsed files keyed by the SHA-256 of the file content plus
+    the parser options, so re-uploading identical content skips parsing.
+    Entries are pickled; once the cache grows past max_bytes the least
+    recently used entries (by modification time, refreshed on every hit)
+    are removed.
+
+    Loading a pickle runs code chosen by whoever wrote it, so the cache
+    folder must be private: it is created with mode 0700, and a folder
+    owned by another user (e.g. planted under a shared temp folder) is
+    refused.
+    """
+
+    def __init__(self, cache_folder, max_bytes=1024 * 1024 * 1024):
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_folder, mode=0o700, exist_ok=True)
+        self._check_folder()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _check_folder(self):
+        """
+        Make sure only the current user can write cache entries: the folder
+        must be a directory (not a symlink) owned by this user, and is made
+        private to it. Windows temp folders are per user and have no uids.
+
+        Raises:
+            PermissionError: When the folder is a symlink or owned by another user
+        """
+        if not hasattr(os, 'getuid'):
+            return
+        info = os.lstat(self.cache_folder)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+            raise PermissionError(f"Parse cache folder {self.cache_folder} is not a directory owned by the "
+                                  f"current user; refusing to load cache entries from it")
+        if stat.S_IMODE(info.st_mode) != 0o700:
+            os.chmod(self.cache_folder, 0o700)
+
+    def make_key(self, content_hash, file_type, options=None):
+        """Combine the content hash, file type and parser options into a cache key"""
+        description = json.dumps(
+            {'content': content_hash, 'type': file_type, 'options': options or {}, 'format': CACHE_FORMAT},
+            sort_keys=True, default=str
+        )
+        return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_folder, f"{key}.pkl")
+
+    def contains(self, key):
+        """Return True when an entry is stored under a key"""
+        return os.path.exists(self._entry_path(key))
+    
+    def get(self, key):
+        """Return the cached parsed data for a key, or None on a miss"""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+            os.utime(path)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            with self._lock:
+                self._misses += 1
+            return None
+        with self._lock:
+            self._hits += 1
+        return data
+
+    def put(self, key, data):
+        """Store parsed data under a key and enforce the size cap"""
+        path = self._entry_path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Could not write parse cache entry: {str(e)}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self._evict()
+
+    def _entries(self):
+        """Return (modification time, size, path) for every cache entry"""
+        entries = []
+        for name in os.listdir(self.cache_folder):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.cache_folder, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+    def stats(self):
+        """Return hit / miss counters and the current cache size"""
+        entries = self._entries()
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries),
+                'maxBytes': self.max_bytes
+            }
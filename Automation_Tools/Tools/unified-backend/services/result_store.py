@@ -0,0 +1,61 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class ResultStore:
+    """
+    In-process store for comparison results so clients can page through them
+    instead of receiving everything in one response. Entries expire ttl_seconds
+    after their last access, and the least recently used entries are evicted
+    once more than max_entries are held or their approximate sizes add up to
+    more than max_bytes (the newest entry is always kept).
+    """
+
+    def __init__(self, ttl_seconds=1800, max_entries=50, max_bytes=1024 * 1024 * 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # result id -> (last access time, result, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, result, size=0):
+        """Store a result with its approximate size in bytes and return its id"""
+        result_id = uuid.uuid4().hex
+        with self._lock:
+            self._evict_expired()
+            self._entries[result_id] = (time.time(), result, size)
+            self._bytes += size
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries
+                                              or self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+        return result_id
+
+    def get(self, result_id):
+        """Return a stored result, or None if it is unknown or has expired"""
+        with self._lock:
+            self._evict_expired()
+            entry = self._entries.get(result_id)
+            if entry is None:
+                return None
+            self._entries[result_id] = (time.time(), entry[1], entry[2])
+            self._entries.move_to_end(result_id)
+            return entry[1]
+
+    def __len__(self):
+        with self._lock:
+            self._evict_expired()
+            return len(self._entries)
+
+    def _evict_expired(self):
+        """Drop entries not accessed within the TTL (caller holds the lock)"""
+        cutoff = time.time() - self.ttl_seconds
+        while self._entries:
+            result_id, (last_access, _, size) = next(iter(self._entries.items()))
+            if last_access >= cutoff:
+                break
+            del self._entries[result_id]
+            self._bytes -= size
@@ -0,0 +1,122 @@
+import heapq
+import itertools
+import os
+import pickle
+from operator import itemgetter
+
+
+# Maximum number of runs merged at once per side; more runs are first merged
+# into longer runs so the read buffers of both sides stay within the budget
+MERGE_FAN_IN = 16
+
+
+def _text_column(series):
+    """
+    Normalize a column read as strings like diff_engine.normalize_values:
+    stripped strings with missing cells as ''. Columns of large files are
+    mostly distinct values, so they are stripped directly instead of being
+    factorized first.
+    """
+    return [value.strip() for value in series.fillna('').tolist()]
+
+
+def chunk_records(chunk, columns, key_columns, row_offset):
+    """
+    Convert a chunk of a CSV file into sort records
+
+    Every record is (key tuple, row index, value tuple) with normalized
+    values aligned to columns; columns missing from the chunk are empty.
+
+    Args:
+        chunk (DataFrame): Rows of the file, read as strings
+        columns (list): Columns of the comparison
+        key_columns (list): Columns identifying a row
+        row_offset (int): Row index of the first row of the chunk
+
+    Returns:
+        list: One record per row
+    """
+    empty = [''] * len(chunk)
+    values = {col: _text_column(chunk[col]) if col in chunk.columns else empty for col in columns}
+    keys = zip(*[values[col] for col in key_columns])
+    rows = zip(*[values[col] for col in columns])
+    return list(zip(keys, range(row_offset, row_offset + len(chunk)), rows))
+
+
+def write_run(records, path, block_rows):
+    """Write records to a run file as pickled blocks of at most block_rows records"""
+    with open(path, 'wb') as f:
+        block = []
+        for record in records:
+            block.append(record)
+            if len(block) >= block_rows:
+                pickle.dump(block, f, protocol=pickle.HIGHEST_PROTOCOL)
+                block = []
+        if block:
+            pickle.dump(block, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def iter_run(path):
+    """Yield the records of a run file, holding one block in memory at a time"""
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            yield from block
+
+
+def merge_runs(run_paths, run_folder, prefix, block_rows, fan_in=MERGE_FAN_IN):
+    """
+    Merge sorted run files into one sorted record stream
+
+    While there are more than fan_in runs, groups of fan_in runs are merged
+    into longer run files first, so that at most fan_in runs are read at
+    the same time.
+
+    Returns:
+        iterator: Records in (key, row index) order
+    """
+    runs = list(run_paths)
+    generation = 0
+    while len(runs) > fan_in:
+        merged_runs = []
+        for start in range(0, len(runs), fan_in):
+            group = runs[start:start + fan_in]
+            if len(group) == 1:
+                merged_runs.extend(group)
+                continue
+            path = os.path.join(run_folder, f"{prefix}_merge{generation}_{start}.run")
+            write_run(heapq.merge(*[iter_run(run) for run in group]), path, block_rows)
+            for run in group:
+                os.remove(run)
+            merged_runs.append(path)
+        runs = merged_runs
+        generation += 1
+    return heapq.merge(*[iter_run(run) for run in runs])
+
+
+def join_by_key(source_records, target_records):
+    """
+    Merge-join two record streams sorted by key
+
+    Yields:
+        tuple: (key, source records, target records) for every key present
+               on either side, in key order; the side without the key gets []
+    """
+    source_groups = itertools.groupby(source_records, key=itemgetter(0))
+    target_groups = itertools.groupby(target_records, key=itemgetter(0))
+    source = next(source_groups, None)
+    target = next(target_groups, None)
+    while source is not None or target is not None:
+        if target is None or (source is not None and source[0] < target[0]):
+            yield source[0], list(source[1]), []
+            source = next(source_groups, None)
+        elif source is None or target[0] < source[0]:
+            yield target[0], [], list(target[1])
+            target = next(target_groups, None)
+        else:
+            yield source[0], list(source[1]), list(target[1])
+            source = next(source_groups, None)
+            target = next(target_groups, None)
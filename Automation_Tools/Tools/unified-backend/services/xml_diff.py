@@ -0,0 +1,338 @@
+import itertools
+import sys
+
+import numpy as np
+import pandas as pd
+from pandas.util import hash_array
+
+from services.diff_engine import EMPTY_HASH, FINGERPRINT_PRIME
+
+
+def _expand_ranges(starts, counts):
+    """Concatenate the ranges [start, start + count) into one index array"""
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    # Offset of every element within its range, added to the range start
+    range_offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + (np.arange(total) - range_offsets)
+
+
+class TrieIndex:
+    """
+    Vectorized view of an XmlPathTrie for tree diffs: the children of every
+    node, the nodes of every depth level and per node a hash of its path
+    segment, a canonical hash of its subtree and the subtree size
+
+    Subtree hashes cover the segments and the normalized values (stripped,
+    with empty values like missing ones) below a node. Children are summed,
+    so attribute order does not change a hash while the sibling index of
+    every element does. Node ids follow document order, so the subtree of
+    node n is the id range [n, n + size).
+    """
+
+    def __init__(self, trie):
+        self.trie = trie
+        node_count = trie.node_count
+        self.parents = np.frombuffer(trie.parents, dtype=np.intc).astype(np.int64)
+        indexes = np.frombuffer(trie.indexes, dtype=np.intc).astype(np.uint64)
+        name_ids = np.frombuffer(trie.name_ids, dtype=np.intc)
+
+        # Children of node p are child_order[child_starts[p]:child_starts[p] + child_counts[p]]
+        self.child_order = np.argsort(self.parents, kind='stable')
+        sorted_parents = self.parents[self.child_order]
+        self.child_starts = np.searchsorted(sorted_parents, np.arange(node_count), side='left')
+        self.child_counts = np.searchsorted(sorted_parents, np.arange(node_count), side='right') - self.child_starts
+
+        self.levels = []
+        frontier = np.flatnonzero(self.parents < 0)
+        while len(frontier):
+            self.levels.append(frontier)
+            frontier = self.children(frontier)[0]
+
+        name_hashes = hash_array(np.array(trie.names, dtype=object))
+        self.segment_hashes = hash_array((name_hashes[name_ids] * FINGERPRINT_PRIME) ^ indexes)
+
+        value_hashes = np.full(node_count, EMPTY_HASH, dtype=np.uint64)
+        if len(trie):
+            value_nodes = np.frombuffer(trie.value_nodes, dtype=np.intc)
+            # Values are mostly distinct, so they are hashed without factorizing first
+            values = np.array([value.strip() for value in trie.values], dtype=object)
+            value_hashes[value_nodes] = hash_array(values, categorize=False)
+
+        # Fold every level into its parents, deepest first
+        self.subtree_hashes = value_hashes
+        self.sizes = np.ones(node_count, dtype=np.int64)
+        for level in reversed(self.levels[1:]):
+            parents = self.parents[level]
+            contributions = hash_array((self.subtree_hashes[level] * FINGERPRINT_PRIME) ^ self.segment_hashes[level])
+            np.add.at(self.subtree_hashes, parents, contributions)
+            np.add.at(self.sizes, parents, self.sizes[level])
+
+    def children(self, nodes):
+        """
+        Return the children of several nodes and, for every child, the
+        position of its parent in nodes
+        """
+        counts = self.child_counts[nodes]
+        children = self.child_order[_expand_ranges(self.child_starts[nodes], counts)]
+        return children, np.repeat(np.arange(len(nodes)), counts)
+
+
+def match_tries(source, target, progress=None):
+    """
+    Map the nodes of a source XmlPathTrie to the nodes of a target trie with
+    the same path, descending only into subtrees whose hashes differ
+
+    Matched subtrees with equal hashes and the same shape are mapped in one
+    step by their offsets; the children of other matched nodes are joined
+    on their segment, one depth level at a time.
+
+    Args:
+        source (XmlPathTrie): Source document
+        target (XmlPathTrie): Target document
+        progress (callable): Optional callback, called once per depth level as
+                             progress(processed=...) with the number of source
+                             nodes outside the subtrees still to be matched
+
+    Returns:
+        tuple: (target node of every source node or -1, boolean array
+                flagging source nodes inside subtrees equal to the target's)
+    """
+    source_index = TrieIndex(source)
+    target_index = TrieIndex(target)
+    matches = np.full(source.node_count, -1, dtype=np.int64)
+    equal = np.zeros(source.node_count, dtype=bool)
+
+    # The roots match when their tags do
+    source_nodes = source_index.levels[0]
+    target_nodes = target_index.levels[0]
+    same_root = source_index.segment_hashes[source_nodes[:1]] == target_index.segment_hashes[target_nodes[:1]]
+    source_nodes, target_nodes = source_nodes[:1][same_root], target_nodes[:1][same_root]
+
+    while len(source_nodes):
+        matches[source_nodes] = target_nodes
+        sizes = source_index.sizes[source_nodes]
+        if progress is not None:
+            progress(processed=source.node_count - int(sizes.sum()))
+        candidates = ((source_index.subtree_hashes[source_nodes] == target_index.subtree_hashes[target_nodes])
+                      & (sizes == target_index.sizes[target_nodes]))
+
+        # Equal subtrees are mapped node by node when their node ranges line
+        # up: same segments with parents at the same offsets
+        if candidates.any():
+            pair_sizes = sizes[candidates]
+            source_starts = source_nodes[candidates]
+            target_starts = target_nodes[candidates]
+            source_range = _expand_ranges(source_starts, pair_sizes)
+            target_range = _expand_ranges(target_starts, pair_sizes)
+            aligned = source_index.segment_hashes[source_range] == target_index.segment_hashes[target_range]
+            range_firsts = np.cumsum(pair_sizes) - pair_sizes
+            source_parent_offsets = source_index.parents[source_range] - np.repeat(source_starts, pair_sizes)
+            target_parent_offsets = target_index.parents[target_range] - np.repeat(target_starts, pair_sizes)
+            aligned &= source_parent_offsets == target_parent_offsets
+            # The subtree roots' parents lie outside the ranges
+            aligned[range_firsts] = True
+            pair_aligned = np.logical_and.reduceat(aligned, range_firsts)
+            element_aligned = np.repeat(pair_aligned, pair_sizes)
+            matches[source_range[element_aligned]] = target_range[element_aligned]
+            equal[source_range[element_aligned]] = True
+            # Unaligned pairs are descended into like differing ones
+            candidates[np.flatnonzero(candidates)[~pair_aligned]] = False
+
+        # Descend into the other pairs, joining children on their segment
+        descend = ~candidates
+        parent_targets = target_nodes[descend]
+        source_children, source_owners = source_index.children(source_nodes[descend])
+        target_children, target_owners = target_index.children(parent_targets)
+        joined = pd.merge(
+            pd.DataFrame({'parent': parent_targets[source_owners],
+                          'segment': source_index.segment_hashes[source_children].view(np.int64),
+                          'source': source_children}),
+            pd.DataFrame({'parent': parent_targets[target_owners],
+                          'segment': target_index.segment_hashes[target_children].view(np.int64),
+                          'target': target_children}),
+            on=['parent', 'segment']
+        )
+        source_nodes = joined['source'].to_numpy(dtype=np.int64)
+        target_nodes = joined['target'].to_numpy(dtype=np.int64)
+
+    return matches, equal
+
+
+def _normalized_values(values, positions):
+    """Return the stripped values at positions as an object array"""
+    return np.array([values[position].strip() for position in positions.tolist()], dtype=object)
+
+
+# Per-path status codes of an XmlPathComparison
+STATUSES = ('match', 'different', 'source_only', 'target_only')
+MATCH, DIFFERENT, SOURCE_ONLY, TARGET_ONLY = range(len(STATUSES))
+
+
+class XmlPathComparison:
+    """
+    Compact result of a path-by-path XML comparison: every source path in
+    document order followed by the target-only paths, each with its value
+    position in the source / target trie (-1 when absent) and a status code
+    (an index into STATUSES)
+
+    Path strings and cell dictionaries ({'sourceValue', 'targetValue',
+    'status', ...}) are only built for the paths a response returns, by
+    paths / cell / entries / to_rows, from the node ids of the tries.
+    """
+
+    def __init__(self, source, target, source_positions, target_positions, statuses):
+        self.source = source
+        self.target = target
+        self.source_positions = source_positions
+        self.target_positions = target_positions
+        self.statuses = statuses
+
+    def __len__(self):
+        return len(self.statuses)
+
+    def paths(self, indexes=None):
+        """Build the path strings of the given path indexes (default all)"""
+        indexes = np.arange(len(self)) if indexes is None else np.asarray(indexes, dtype=np.int64)
+        source_positions = self.source_positions[indexes]
+        from_source = source_positions >= 0
+        target_positions = self.target_positions[indexes[~from_source]]
+        paths = np.empty(len(indexes), dtype=object)
+        paths[from_source] = self.source.paths(
+            np.frombuffer(self.source.value_nodes, dtype=np.intc)[source_positions[from_source]].tolist())
+        paths[~from_source] = self.target.paths(
+            np.frombuffer(self.target.value_nodes, dtype=np.intc)[target_positions].tolist())
+        return paths.tolist()
+
+    def status_counts(self):
+        """Return the number of paths per status"""
+        counts = np.bincount(self.statuses, minlength=len(STATUSES))
+        return dict(zip(STATUSES, counts.tolist()))
+
+    def difference_count(self):
+        """Return the number of paths whose status is not 'match'"""
+        return int(np.count_nonzero(self.statuses != MATCH))
+
+    def difference_indexes(self):
+        """Return the indexes of the paths whose status is not 'match'"""
+        return np.flatnonzero(self.statuses != MATCH)
+
+    def select(self, path=None, status=None):
+        """
+        Return the indexes of the paths with the given path and / or status;
+        the path is looked up in the tries rather than compared to every path
+        """
+        selected = np.ones(len(self), dtype=bool)
+        if status is not None:
+            selected &= self.statuses == (STATUSES.index(status) if status in STATUSES else -1)
+        if path is not None:
+            at_path = np.zeros(len(self), dtype=bool)
+            source_node = self.source.find_node(path)
+            if source_node >= 0:
+                at_path[:len(self.source)] = np.frombuffer(self.source.value_nodes, dtype=np.intc) == source_node
+            target_node = self.target.find_node(path)
+            if target_node >= 0:
+                target_only = np.flatnonzero(self.source_positions < 0)
+                target_nodes = np.frombuffer(self.target.value_nodes, dtype=np.intc)
+                at_path[target_only] = target_nodes[self.target_positions[target_only]] == target_node
+            selected &= at_path
+        return np.flatnonzero(selected)
+
+    def cell(self, index):
+        """Build the cell of one path: values, status, empty flag and source lines"""
+        source_position = int(self.source_positions[index])
+        target_position = int(self.target_positions[index])
+        source, target = self.source, self.target
+        return {
+            'sourceValue': source.values[source_position] if source_position >= 0 else None,
+            'targetValue': target.values[target_position] if target_position >= 0 else None,
+            'status': STATUSES[self.statuses[index]],
+            # Element without attributes, text or children (on the side holding the path)
+            'isEmpty': bool(source.empty[source_position] if source_position >= 0 else target.empty[target_position]),
+            'sourceLine': source.line(source.value_nodes[source_position]) if source_position >= 0 else None,
+            'targetLine': target.line(target.value_nodes[target_position]) if target_position >= 0 else None
+        }
+
+    def entries(self, indexes=None):
+        """Return the cells of the given path indexes (default all) with their 'column' path"""
+        indexes = np.arange(len(self)) if indexes is None else np.asarray(indexes, dtype=np.int64)
+        return [dict(self.cell(index), column=path) for index, path in zip(indexes.tolist(), self.paths(indexes))]
+
+    def memory_usage(self):
+        """Approximate number of bytes held by the statuses, the tries and their values"""
+        arrays = self.source_positions.nbytes + self.target_positions.nbytes + self.statuses.nbytes
+        # Parent, name, index and line of every trie node
+        arrays += 16 * (self.source.node_count + self.target.node_count)
+        strings = itertools.chain(self.source.values, self.target.values)
+        return arrays + sum(sys.getsizeof(value) for value in strings)
+
+    def to_rows(self, paths=None):
+        """
+        Return the comparison in the serialized form: one row with a cell per
+        path (paths, when given, are the already built path strings)
+        """
+        if paths is None:
+            paths = self.paths()
+        cells = {path: self.cell(index) for index, path in enumerate(paths)}
+        return [{'hasDifferences': self.difference_count() > 0, 'cells': cells}]
+
+
+def compare_paths(source, target, progress=None):
+    """
+    Compare two flattened XML documents path by path in linear time
+
+    Paths are matched with match_tries; paths inside equal subtrees match
+    without comparing values. Other values are compared stripped, with empty
+    values like missing ones. Source paths keep document order and the
+    target-only paths follow in target order.
+
+    Args:
+        source (XmlPathTrie): Source document
+        target (XmlPathTrie): Target document
+        progress (callable): Optional callback told the source nodes matched
+                             (see match_tries)
+
+    Returns:
+        tuple: (XmlPathComparison, number of paths matched as equal subtrees)
+    """
+    target_nodes, equal_nodes = match_tries(source, target, progress=progress)
+    source_value_nodes = np.frombuffer(source.value_nodes, dtype=np.intc)
+    node_positions = np.full(target.node_count + 1, -1, dtype=np.int64)
+    node_positions[np.frombuffer(target.value_nodes, dtype=np.intc)] = np.arange(len(target))
+    # Unmatched source nodes (-1) pick the trailing -1 entry
+    matched_positions = node_positions[target_nodes[source_value_nodes]]
+    source_equal = equal_nodes[source_value_nodes]
+
+    # Target paths no source path was matched with, in target order
+    target_matched = np.zeros(len(target), dtype=bool)
+    target_matched[matched_positions[matched_positions >= 0]] = True
+    target_only = np.flatnonzero(~target_matched)
+
+    # Only values outside equal subtrees are compared
+    statuses = np.full(len(source) + len(target_only), MATCH, dtype=np.uint8)
+    compared = np.flatnonzero(~source_equal)
+    compared_targets = matched_positions[compared]
+    source_values = _normalized_values(source.values, compared)
+    target_values = np.full(len(compared), '', dtype=object)
+    has_target = compared_targets >= 0
+    target_values[has_target] = _normalized_values(target.values, compared_targets[has_target])
+    source_empty = source_values == ''
+    target_empty = target_values == ''
+    statuses[compared] = np.select(
+        [source_empty & target_empty, source_empty, target_empty, source_values == target_values],
+        [MATCH, TARGET_ONLY, SOURCE_ONLY, MATCH],
+        DIFFERENT
+    )
+    target_only_empty = _normalized_values(target.values, target_only) == ''
+    statuses[len(source):] = np.where(target_only_empty, MATCH, TARGET_ONLY)
+
+    comparison = XmlPathComparison(
+        source, target,
+        np.concatenate([np.arange(len(source)), np.full(len(target_only), -1)]),
+        np.concatenate([matched_positions, target_only]),
+        statuses
+    )
+    if progress is not None:
+        progress(processed=source.node_count)
+    return comparison, int(source_equal.sum())
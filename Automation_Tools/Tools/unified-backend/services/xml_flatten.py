@@ -0,0 +1,330 @@
+import re
+import xml.etree.ElementTree as ET
+from array import array
+
+import numpy as np
+
+# lxml is an optional parser that also reports source line numbers;
+# xml.etree.ElementTree is used when it is not installed
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+# Namespace prefix of a tag in ElementTree's {uri}tag form
+_NAMESPACE = re.compile(r'\{[^}]*\}')
+
+# Index suffix of an element's path segment, e.g. [2] in item[2]
+_SEGMENT_INDEX = re.compile(r'\[(\d+)\]')
+
+
+class XmlPathTrie:
+    """
+    Compact flattened XML document: an interned trie of path segments plus
+    the values of the flattened paths
+
+    Every element and attribute is a node with an integer id, stored as its
+    parent node, the id of its interned segment name (tag or '@attribute')
+    and its 1-based index among the parent's children with the same tag (0
+    for attributes). The flattened paths are kept as node ids with their
+    values in document order, so path strings such as root[1]/item[2]/@id
+    are only built by path / paths when needed. Nodes also keep the source
+    line of their element when the parser reports one (lxml), 0 otherwise.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.names = []
+        self._name_ids = {}
+        self.parents = array('i')
+        self.name_ids = array('i')
+        self.indexes = array('i')
+        self.lines = array('i')
+        # Nodes of the flattened paths in document order, with their values
+        # and a 1 for elements without attributes, text or children
+        self.value_nodes = array('i')
+        self.values = []
+        self.empty = bytearray()
+
+    def __len__(self):
+        """Return the number of flattened paths"""
+        return len(self.value_nodes)
+
+    @property
+    def node_count(self):
+        return len(self.parents)
+
+    def add_node(self, parent, name, index, line=0):
+        """Add a node below parent (-1 for the root) and return its id"""
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = self._name_ids[name] = len(self.names)
+            self.names.append(name)
+        self.parents.append(parent)
+        self.name_ids.append(name_id)
+        self.indexes.append(index)
+        self.lines.append(line)
+        return len(self.parents) - 1
+
+    def add_value(self, node, value, is_empty=False):
+        """Record the value of a flattened path"""
+        self.value_nodes.append(node)
+        self.values.append(value)
+        self.empty.append(1 if is_empty else 0)
+
+    def line(self, node):
+        """Return the source line of a node's element, or None when unknown"""
+        return self.lines[node] or None
+
+    def segment(self, node):
+        """Return the path segment of a node, e.g. item[2] or @id"""
+        name = self.names[self.name_ids[node]]
+        index = self.indexes[node]
+        return f"{name}[{index}]" if index else name
+
+    def path(self, node):
+        """Build the path string of one node"""
+        segments = []
+        while node >= 0:
+            segments.append(self.segment(node))
+            node = self.parents[node]
+        return '/'.join(reversed(segments))
+
+    def paths(self, nodes=None):
+        """
+        Build the path strings of several nodes (default the flattened paths,
+        in document order), building every ancestor's path once
+        """
+        if nodes is None:
+            nodes = self.value_nodes
+        # Path of every element seen as an ancestor; -1 stands for no parent
+        prefixes = {-1: None}
+        result = []
+        for node in nodes:
+            pending = []
+            parent = self.parents[node]
+            while parent not in prefixes:
+                pending.append(parent)
+                parent = self.parents[parent]
+            for ancestor in reversed(pending):
+                prefix = prefixes[self.parents[ancestor]]
+                segment = self.segment(ancestor)
+                prefixes[ancestor] = segment if prefix is None else f"{prefix}/{segment}"
+            prefix = prefixes[self.parents[node]]
+            segment = self.segment(node)
+            result.append(segment if prefix is None else f"{prefix}/{segment}")
+        return result
+
+    def find_node(self, path):
+        """
+        Return the node whose path string is path, or -1 when the document
+        has none. The path is matched segment by segment from the root
+        without building any path string.
+        """
+        parents = np.frombuffer(self.parents, dtype=np.intc)
+        name_ids = np.frombuffer(self.name_ids, dtype=np.intc)
+        indexes = np.frombuffer(self.indexes, dtype=np.intc)
+        return self._find_below(-1, path, parents, name_ids, indexes)
+
+    def _find_below(self, parent, path, parents, name_ids, indexes):
+        """Return the node at path relative to parent (-1 for the root), or -1"""
+        children = np.flatnonzero(parents == parent)
+        child_name_ids = name_ids[children]
+        child_indexes = indexes[children]
+        # Names may contain '/' (namespaces), so the path is not split but
+        # matched against every interned name it starts with
+        for name_id, name in enumerate(self.names):
+            if not path.startswith(name):
+                continue
+            rest = path[len(name):]
+            index = 0
+            if not name.startswith('@'):
+                match = _SEGMENT_INDEX.match(rest)
+                if match is None:
+                    continue
+                index = int(match.group(1))
+                rest = rest[match.end():]
+            if rest and not rest.startswith('/'):
+                continue
+            for child in children[(child_name_ids == name_id) & (child_indexes == index)].tolist():
+                node = child if not rest else self._find_below(child, rest[1:], parents, name_ids, indexes)
+                if node >= 0:
+                    return node
+        return -1
+
+    def records(self, record_name):
+        """
+        Group the flattened paths by record: the outermost elements whose tag
+        is record_name (with or without its namespace)
+
+        Fields are keyed by their path relative to the record (e.g. @id or
+        amount[1]/@currency; '.' for the record's own text). Relative paths
+        repeat from record to record, so each distinct one is stored once.
+
+        Returns:
+            tuple: (record nodes, list of {relative path: value} per record,
+                    positions of the flattened paths outside any record)
+        """
+        record_name_ids = {name_id for name_id, name in enumerate(self.names)
+                           if name == record_name or name.endswith('}' + record_name)}
+        # Record containing every node (-1 outside records) and the relative
+        # path of every node below a record
+        record_of = array('i', [-1]) * self.node_count
+        relative_paths = {}
+        # Relative path by (parent's relative path, name id, index), so each
+        # distinct path is formatted once
+        interned = {}
+        record_nodes = []
+        record_positions = {}
+        for node in range(self.node_count):
+            parent = self.parents[node]
+            record = record_of[parent] if parent >= 0 else -1
+            if record < 0:
+                if self.name_ids[node] in record_name_ids:
+                    record_of[node] = node
+                    record_positions[node] = len(record_nodes)
+                    record_nodes.append(node)
+                continue
+            record_of[node] = record
+            key = (relative_paths.get(parent), self.name_ids[node], self.indexes[node])
+            path = interned.get(key)
+            if path is None:
+                path = interned[key] = self.segment(node) if key[0] is None else f"{key[0]}/{self.segment(node)}"
+            relative_paths[node] = path
+
+        fields = [{} for _ in record_nodes]
+        outside = []
+        for position, node in enumerate(self.value_nodes):
+            record = record_of[node]
+            if record < 0:
+                outside.append(position)
+            else:
+                fields[record_positions[record]][relative_paths.get(node, '.')] = self.values[position]
+        return record_nodes, fields, outside
+
+
+def default_backend():
+    """Return the XML parser backend to use by default: lxml when installed"""
+    return 'lxml' if lxml_etree is not None else 'etree'
+
+
+def _iterparse(source, backend):
+    """Return start / end events of a document parsed with the given backend"""
+    if backend == 'lxml':
+        if lxml_etree is None:
+            raise ValueError("The lxml backend requires the lxml package")
+        # Comments and processing instructions are dropped (as ElementTree
+        # does) so they do not split element text; like ElementTree, only
+        # internal entities are expanded (older lxml versions expand none)
+        resolve_entities = 'internal' if lxml_etree.LXML_VERSION >= (5,) else False
+        return lxml_etree.iterparse(source, events=('start', 'end'), remove_comments=True, remove_pis=True,
+                                    resolve_entities=resolve_entities, huge_tree=True)
+    if backend == 'etree':
+        return ET.iterparse(source, events=('start', 'end'))
+    raise ValueError(f"Unsupported XML backend: {backend}")
+
+
+def _iter_xml_nodes(source, trie, backend):
+    """
+    Flatten an XML document into trie, yielding (node, value, is_empty) for
+    every flattened path in document order: attributes, then text, then
+    children. Nodes get the source line of their element when the backend
+    reports it (lxml; ElementTree does not). Elements are cleared and
+    detached once handled, so memory is bounded by the depth of the tree
+    (besides the trie itself).
+    """
+    # One entry per open element: [element, node, text handled, has children,
+    # occurrences of child tags, has attributes]
+    # Element properties are read once each: lxml builds them on every access
+    stack = []
+
+    for event, element in _iterparse(source, backend):
+        if event == 'start':
+            parent_node = -1
+            counts = {}
+            if stack:
+                parent = stack[-1]
+                parent_node = parent[1]
+                counts = parent[4]
+                # The parent's text precedes its first child
+                if not parent[2]:
+                    parent[2] = True
+                    text = parent[0].text
+                    if text and text.strip():
+                        yield parent[1], text.strip(), False
+                parent[3] = True
+
+            # Handle repeated elements by adding index
+            count = counts.get(element.tag, 0) + 1
+            counts[element.tag] = count
+            line = getattr(element, 'sourceline', None) or 0
+            node = trie.add_node(parent_node, element.tag, count, line)
+
+            attributes = element.items()
+            for attr_name, attr_value in attributes:
+                yield trie.add_node(node, f"@{attr_name}", 0, line), attr_value, False
+
+            stack.append([element, node, False, False, {}, bool(attributes)])
+        else:
+            _, node, text_handled, has_children, _, has_attributes = stack.pop()
+            if not text_handled:
+                text = element.text
+                if text and text.strip():
+                    yield node, text.strip(), False
+                elif not has_attributes and not has_children:
+                    # Element with no attributes, no text, and no children
+                    yield node, "", True
+
+            element.clear()
+            if stack:
+                stack[-1][0].remove(element)
+
+
+def flatten_xml(source, backend=None):
+    """
+    Flatten an XML document (path or binary file object) into an XmlPathTrie
+
+    Args:
+        source: Path or binary file object of the document
+        backend (str): 'lxml' or 'etree' (defaults to default_backend())
+
+    Returns:
+        XmlPathTrie: The document's flattened paths, values and source lines
+    """
+    backend = backend or default_backend()
+    trie = XmlPathTrie(backend)
+    for node, value, is_empty in _iter_xml_nodes(source, trie, backend):
+        trie.add_value(node, value, is_empty)
+    return trie
+
+
+def iter_xml_paths(source, backend=None):
+    """
+    Incrementally flatten an XML document into (path, value, is_empty) tuples
+
+    Paths use the indexed form of XmlPathTrie (e.g. root[1]/item[2]/@id) and
+    are produced in document order: attributes, then text, then children.
+    Stopping the iteration early stops parsing.
+    """
+    backend = backend or default_backend()
+    trie = XmlPathTrie(backend)
+    for node, value, is_empty in _iter_xml_nodes(source, trie, backend):
+        yield trie.path(node), value, is_empty
+
+
+def resolve_relative_path(spec, paths):
+    """
+    Return the path among paths (relative to a record) designated by spec:
+    either the path itself or the path with namespaces left out and element
+    segments without an index taken as their first occurrence (so id and
+    header/number designate id[1] and header[1]/number[1])
+    """
+    if spec in paths:
+        return spec
+    segments = [segment if segment.startswith('@') or segment.endswith(']') or segment == '.'
+                else f"{segment}[1]" for segment in spec.strip().strip('/').split('/')]
+    wanted = '/'.join(segments)
+    for path in paths:
+        if _NAMESPACE.sub('', path) == wanted:
+            return path
+    return None
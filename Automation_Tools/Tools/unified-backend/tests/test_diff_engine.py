@@ -0,0 +1,79 @@
+import os
+import random
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import diff_engine  # noqa: E402
+
+
+def test_text_dates_compare_as_dates():
+    source = pd.DataFrame({'date': ['2020-01-01', '2020-02-01', None], 'name': ['a', 'b', 'c']})
+    target = pd.DataFrame({'date': ['2020-01-01 00:00:00', '2020-02-02 00:00:00', None], 'name': ['a', 'b', 'c']})
+
+    mask = diff_engine.mismatch_mask(source, target)
+
+    assert mask[:, 0].tolist() == [False, True, False]
+    assert not mask[:, 1].any()
+
+
+def test_partly_dated_columns_compare_as_text():
+    source = pd.DataFrame({'value': ['2020-01-01', 'n/a']})
+    target = pd.DataFrame({'value': ['2020-01-01 00:00:00', 'n/a']})
+
+    assert diff_engine.mismatch_mask(source, target)[:, 0].tolist() == [True, False]
+
+
+def test_month_names_compare_as_text():
+    source = pd.DataFrame({'month': ['MAR', 'May', 'Dec']})
+    target = pd.DataFrame({'month': ['Mar', 'June', 'Dec']})
+
+    assert diff_engine.mismatch_mask(source, target)[:, 0].tolist() == [True, True, False]
+
+
+def test_fractions_and_times_compare_as_text():
+    source = pd.DataFrame({'ratio': ['1/2', '3/4'], 'time': ['12:30', 'today'], 'quarter': ['2020Q1', '2020Q2']})
+    target = pd.DataFrame({'ratio': ['01/02', '3/4'], 'time': ['12:30:00', 'now'], 'quarter': ['2020-01-01', '2020Q2']})
+
+    mask = diff_engine.mismatch_mask(source, target)
+
+    assert mask.tolist() == [[True, True, True], [False, True, False]]
+
+
+def lcs_length(a, b):
+    lengths = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i, x in enumerate(a):
+        for j, y in enumerate(b):
+            lengths[i + 1][j + 1] = lengths[i][j] + 1 if x == y else max(lengths[i][j + 1], lengths[i + 1][j])
+    return lengths[-1][-1]
+
+
+def check_opcodes(opcodes, a, b):
+    """Check that opcodes cover both sequences in order and return their number of edits"""
+    i = j = edits = 0
+    for tag, i1, i2, j1, j2 in opcodes:
+        assert (i1, j1) == (i, j)
+        if tag == 'equal':
+            assert a[i1:i2] == b[j1:j2]
+        else:
+            edits += (i2 - i1) + (j2 - j1)
+        i, j = i2, j2
+    assert (i, j) == (len(a), len(b))
+    return edits
+
+
+def test_alignment_is_minimal():
+    rng = random.Random(0)
+    for _ in range(300):
+        a = [rng.randrange(4) for _ in range(rng.randrange(30))]
+        b = [rng.randrange(4) for _ in range(rng.randrange(30))]
+        edits = check_opcodes(diff_engine.align_sequences(np.array(a, dtype=np.uint64),
+                                                          np.array(b, dtype=np.uint64)), a, b)
+        assert edits == len(a) + len(b) - 2 * lcs_length(a, b)
+
+        # Beyond max_edits the fallback alignment is still a valid one
+        check_opcodes(diff_engine.align_sequences(np.array(a, dtype=np.uint64),
+                                                  np.array(b, dtype=np.uint64), max_edits=2), a, b)
@@ -0,0 +1,192 @@
+import contextlib
+import io
+import os
+import sys
+import zipfile
+
+import pytest
+from flask import Flask, request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.file_difference import FileDifferenceService  # noqa: E402
+from services.job_queue import JobCancelled  # noqa: E402
+
+
+def write_csv(path, rows):
+    with open(path, 'w') as f:
+        f.write('id,value\n' + ''.join(f"{row_id},{value}\n" for row_id, value in rows))
+
+
+def test_streaming_differences_do_not_depend_on_chunk_size(tmp_path):
+    # One text cell makes the value column text, so 250 and 250.0 differ
+    source_rows = [(i, 'x' if i == 1500 else i) for i in range(3000)]
+    target_rows = [(i, 'x' if i == 1500 else f"{i}.0" if i % 250 == 0 else i) for i in range(3000)]
+    source_path, target_path = str(tmp_path / 'source.csv'), str(tmp_path / 'target.csv')
+    write_csv(source_path, source_rows)
+    write_csv(target_path, target_rows)
+    service = FileDifferenceService(str(tmp_path / 'uploads'), str(tmp_path / 'cache'))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        in_memory = service.compare_files(service.process_file(source_path, 'csv'),
+                                          service.process_file(target_path, 'csv'), 'csv')
+        counts = {chunk_size: len(service.compare_csv_streaming(source_path, target_path,
+                                                                 chunk_size=chunk_size)['differences'])
+                  for chunk_size in (100, 1000, 5000)}
+
+    assert len(in_memory['differences']) == 11
+    assert set(counts.values()) == {11}
+
+
+def test_integer_keys_match_float_keys(tmp_path):
+    # The blank key cell makes the target's id column float
+    source_path, target_path = str(tmp_path / 'source.csv'), str(tmp_path / 'target.csv')
+    write_csv(source_path, [(1, 'a'), (2, 'b'), (3, 'c')])
+    write_csv(target_path, [(1, 'a'), (2, 'b'), ('', 'x'), (3, 'd')])
+    service = FileDifferenceService(str(tmp_path / 'uploads'), str(tmp_path / 'cache'))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = service.compare_files(service.process_file(source_path, 'csv'),
+                                       service.process_file(target_path, 'csv'), 'csv', key_columns=['id'])
+
+    assert result['summary']['matchingRows'] == 2
+    assert result['summary']['sourceOnlyRows'] == 0
+    assert result['targetOnly'] == [{'rowIndex': 2, 'key': ['']}]
+    assert [(diff['rowIndex'], diff['targetRowIndex']) for diff in result['differences']] == [(2, 3)]
+
+
+def test_sorted_join_compares_by_column_type(tmp_path):
+    source_path, target_path = str(tmp_path / 'source.csv'), str(tmp_path / 'target.csv')
+    write_csv(source_path, [(i, '2020-01-01') for i in range(50)])
+    write_csv(target_path, [(i, '2020-01-01 00:00:00' if i != 7 else '2020-01-02') for i in range(50)])
+    service = FileDifferenceService(str(tmp_path / 'uploads'), str(tmp_path / 'cache'))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        in_memory = service.compare_files(service.process_file(source_path, 'csv'),
+                                          service.process_file(target_path, 'csv'), 'csv', key_columns=['id'])
+        sorted_join = service.compare_csv_sorted(source_path, target_path, ['id'])
+
+    assert in_memory['summary']['matchingRows'] == sorted_join['summary']['matchingRows'] == 49
+    assert [diff['column'] for diff in sorted_join['differences']] == ['value']
+
+
+def test_in_memory_comparison_reports_progress_and_stops_when_cancelled(tmp_path):
+    source_path, target_path = str(tmp_path / 'source.csv'), str(tmp_path / 'target.csv')
+    write_csv(source_path, [(i, i) for i in range(250)])
+    write_csv(target_path, [(i, i + 1) for i in range(250)])
+    service = FileDifferenceService(str(tmp_path / 'uploads'), str(tmp_path / 'cache'))
+    service.copy_block_size = 512
+    service.progress_block_rows = 100
+    reports = []
+
+    def progress(stage=None, processed=None, total=None, unit=None):
+        if stage is not None:
+            reports.append([stage, unit, total])
+        if processed is not None:
+            reports[-1].append(processed)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        source_data, target_data = service.process_pair(source_path, target_path, 'csv', progress=progress)
+        result = service.compare_files(source_data, target_data, 'csv', progress=progress)
+
+    source_size = os.path.getsize(source_path)
+    assert reports[0] == ['parsing source', 'bytes', source_size, 0, source_size]
+    assert reports[2] == ['comparing', 'rows', 250, 0, 100, 200, 250]
+    assert len(result['differences']) == 250
+
+    def cancel_after_first_block(stage=None, processed=None, total=None, unit=None):
+        if processed:
+            raise JobCancelled('cancelled')
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        with pytest.raises(JobCancelled):
+            service.process_file(source_path, 'csv', progress=cancel_after_first_block)
+        with pytest.raises(JobCancelled):
+            service.compare_files(source_data, target_data, 'csv', key_columns=['id'],
+                                  progress=cancel_after_first_block)
+
+
+def test_batches_share_one_worker_pool_and_small_ones_run_serially(tmp_path):
+    files = {'source': {}, 'target': {}}
+    for side in files:
+        for name in ('a.csv', 'b.csv'):
+            path = str(tmp_path / f"{side}_{name}")
+            write_csv(path, [(i, i if side == 'source' or i != 3 else 'x') for i in range(20)])
+            files[side][name] = (path, None)
+    service = FileDifferenceService(str(tmp_path / 'uploads'), str(tmp_path / 'cache'))
+    service.max_workers = 2
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            serial = service.compare_batch(files['source'], files['target'])
+            assert service._worker_executor is None
+
+            service.concurrent_parse_min_bytes = 0
+            first = service.compare_batch(files['source'], files['target'])
+            pool = service._worker_executor
+            second = service.compare_batch(files['source'], files['target'])
+            assert service._worker_executor is pool
+    finally:
+        service.shutdown_workers()
+
+    assert pool is not None and service._worker_executor is None
+    assert serial['summary'] == first['summary'] == second['summary']
+    assert [pair['summary']['differingRows'] for pair in second['pairs']] == [1, 1]
+
+
+def test_xml_paths_are_only_built_for_responses(tmp_path):
+    source_path, target_path = str(tmp_path / 'source.xml'), str(tmp_path / 'target.xml')
+    with open(source_path, 'w') as f:
+        f.write('<r><a>1</a><b>2</b><c>3</c></r>')
+    with open(target_path, 'w') as f:
+        f.write('<r><a>1</a><b>4</b><c>3</c></r>')
+    service = FileDifferenceService(str(tmp_path / 'uploads'), str(tmp_path / 'cache'))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = service.compare_files(service.process_file(source_path, 'xml'),
+                                       service.process_file(target_path, 'xml'), 'xml')
+    batch = {'matchMode': 'batch', 'pairs': [dict(result, file='a.xml')]}
+
+    assert 'columns' not in result
+    assert service.to_json_ready(result)['columns'] == ['r[1]/a[1]', 'r[1]/b[1]', 'r[1]/c[1]']
+    assert [(diff['file'], diff['column']) for diff in service._result_differences(batch)] == [('a.xml', 'r[1]/b[1]')]
+
+
+def test_batch_archive_wrapped_in_a_folder(tmp_path):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zip_file:
+        zip_file.writestr('batch/source/a.csv', 'id,value\n1,x\n')
+        zip_file.writestr('batch/target/a.csv', 'id,value\n1,y\n')
+    archive.seek(0)
+    service = FileDifferenceService(str(tmp_path / 'uploads'), str(tmp_path / 'cache'))
+
+    with Flask(__name__).test_request_context(method='POST', data={'archive': (archive, 'batch.zip')},
+                                              content_type='multipart/form-data'):
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = service.batch_compare(request).get_json()
+
+    assert [(pair['file'], pair['status']) for pair in result['pairs']] == [('a.csv', 'different')]
+    assert service._strip_wrapping_folder({'source/a.csv': 1, 'source/b.csv': 2}, ('source', 'target')) == {
+        'source/a.csv': 1, 'source/b.csv': 2}
+    assert service._strip_wrapping_folder({'x/a.csv': 1, 'b.csv': 2}) == {'x/a.csv': 1, 'b.csv': 2}
+
+
+def test_archive_members_are_extracted_inside_the_folder(tmp_path):
+    names = ['../evil.csv', '/abs/x.csv', 'a/../../b.csv', 'c\\..\\..\\d.csv', 'ok/e.csv', '.hidden.csv', 'notes.txt']
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zip_file:
+        for name in names:
+            zip_file.writestr(zipfile.ZipInfo(name), 'id\n1\n')
+        assert zip_file.namelist() == names
+    archive.seek(0)
+    service = FileDifferenceService(str(tmp_path / 'uploads'), str(tmp_path / 'cache'))
+    folder = tmp_path / 'batch'
+
+    files, skipped = service._extract_archive(archive, str(folder))
+
+    assert sorted(files) == ['a/b.csv', 'abs/x.csv', 'c/d.csv', 'evil.csv', 'ok/e.csv']
+    assert skipped == ['notes.txt']
+    written = sorted(str(path.relative_to(tmp_path)) for path in tmp_path.rglob('*') if path.is_file())
+    assert written == sorted(os.path.join('batch', *name.split('/')) for name in files)
+    for path, _ in files.values():
+        assert os.path.realpath(path).startswith(os.path.realpath(str(folder)) + os.sep)
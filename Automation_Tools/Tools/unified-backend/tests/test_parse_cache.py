@@ -0,0 +1,43 @@
+import os
+import stat
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.parse_cache import ParseCache  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'getuid'), reason='POSIX ownership checks')
+
+
+def test_cache_folder_is_private(tmp_path):
+    created = tmp_path / 'created'
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    shared.chmod(0o777)
+
+    ParseCache(str(created))
+    ParseCache(str(shared))
+
+    assert stat.S_IMODE(created.stat().st_mode) == 0o700
+    assert stat.S_IMODE(shared.stat().st_mode) == 0o700
+
+
+def test_cache_folder_of_another_user_is_refused(tmp_path, monkeypatch):
+    folder = tmp_path / 'cache'
+    folder.mkdir()
+    monkeypatch.setattr(os, 'getuid', lambda: folder.stat().st_uid + 1)
+
+    with pytest.raises(PermissionError):
+        ParseCache(str(folder))
+
+
+def test_symlinked_cache_folder_is_refused(tmp_path):
+    folder = tmp_path / 'cache'
+    folder.mkdir()
+    link = tmp_path / 'link'
+    link.symlink_to(folder, target_is_directory=True)
+
+    with pytest.raises(PermissionError):
+        ParseCache(str(link))
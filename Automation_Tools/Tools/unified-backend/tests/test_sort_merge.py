@@ -0,0 +1,66 @@
+import contextlib
+import io
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import sort_merge  # noqa: E402
+from services.file_difference import FileDifferenceService  # noqa: E402
+
+
+def test_merge_runs_merges_in_several_generations(tmp_path):
+    rng = random.Random(0)
+    records = [((str(rng.randrange(50)),), row, (str(row),)) for row in range(500)]
+    run_paths = []
+    for start in range(0, len(records), 70):
+        path = str(tmp_path / f"run{start}.run")
+        sort_merge.write_run(sorted(records[start:start + 70]), path, block_rows=8)
+        run_paths.append(path)
+
+    merged = list(sort_merge.merge_runs(run_paths, str(tmp_path), 'source', block_rows=8, fan_in=2))
+
+    assert len(run_paths) == 8
+    assert merged == sorted(records)
+
+
+def test_join_by_key_groups_duplicate_keys():
+    source = [(('a',), 0, ()), (('b',), 1, ()), (('b',), 2, ()), (('d',), 3, ())]
+    target = [(('b',), 0, ()), (('c',), 1, ()), (('d',), 2, ()), (('d',), 3, ())]
+
+    joined = [(key, [record[1] for record in source_group], [record[1] for record in target_group])
+              for key, source_group, target_group in sort_merge.join_by_key(iter(source), iter(target))]
+
+    assert joined == [(('a',), [0], []), (('b',), [1, 2], [0]), (('c',), [], [1]), (('d',), [3], [2, 3])]
+
+
+def test_sorted_join_matches_in_memory_key_comparison(tmp_path):
+    rng = random.Random(1)
+    paths = []
+    for side in ('source', 'target'):
+        path = str(tmp_path / f"{side}.csv")
+        with open(path, 'w') as f:
+            f.write('id,amount,name\n')
+            for _ in range(2500):
+                # Keys repeat, and amounts are written as integers or floats
+                f.write(f"{rng.randrange(2000)},{rng.choice(['1', '1.0', '2', '2.5'])},{rng.choice('abc')}\n")
+        paths.append(path)
+    service = FileDifferenceService(str(tmp_path / 'uploads'), str(tmp_path / 'cache'))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        in_memory = service.compare_files(service.process_file(paths[0], 'csv'), service.process_file(paths[1], 'csv'),
+                                          'csv', key_columns=['id'])
+        # A tiny memory budget splits each file into several sorted runs
+        sorted_join = service.compare_csv_sorted(paths[0], paths[1], ['id'], memory_budget=1)
+
+    def differences(result):
+        return sorted((diff['rowIndex'], diff['targetRowIndex'], diff['column']) for diff in result['differences'])
+
+    assert sorted_join['summary'].pop('runs') == {'source': 3, 'target': 3}
+    assert in_memory['summary']['duplicateKeys'] > 0
+    assert sorted_join['summary'] == in_memory['summary']
+    assert differences(sorted_join) == differences(in_memory)
+    for side in ('sourceOnly', 'targetOnly'):
+        assert sorted(entry['rowIndex'] for entry in sorted_join[side]) == sorted(
+            entry['rowIndex'] for entry in in_memory[side])
@@ -0,0 +1,87 @@
+import io
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import xml_diff  # noqa: E402
+from services.xml_flatten import flatten_xml, iter_xml_paths  # noqa: E402
+
+
+def flatten(text):
+    return flatten_xml(io.BytesIO(text.encode('utf-8')), backend='etree')
+
+
+def random_element(rng, depth=0):
+    attributes = {name: rng.choice(['1', ' 1', '2', '']) for name in rng.sample('xyz', rng.randint(0, 2))}
+    children = [random_element(rng, depth + 1) for _ in range(rng.randint(0, 3))] if depth < 4 else []
+    return [rng.choice('abcd'), attributes, rng.choice(['', 't', ' t ', 'u']), children]
+
+
+def mutated(rng, element):
+    """Copy an element tree with values changed, attributes reordered and children moved, added or removed"""
+    tag, attributes, text, children = element
+    if rng.random() < 0.1:
+        attributes = dict(reversed(list(attributes.items())))
+    if rng.random() < 0.05:
+        text = rng.choice(['', 't', 'v'])
+    children = [mutated(rng, child) for child in children]
+    if rng.random() < 0.1 and len(children) > 1:
+        children[0], children[1] = children[1], children[0]
+    if rng.random() < 0.05:
+        children.insert(0, random_element(rng, 3))
+    if rng.random() < 0.05 and children:
+        children.pop()
+    return [tag, attributes, text, children]
+
+
+def render(element):
+    tag, attributes, text, children = element
+    attribute_text = ''.join(f' {name}="{value}"' for name, value in attributes.items())
+    return f"<{tag}{attribute_text}>{text}{''.join(render(child) for child in children)}</{tag}>"
+
+
+def plain_path_statuses(source_text, target_text):
+    """Compare two documents path by path with dictionaries, as a reference for compare_paths"""
+    def values(text):
+        return {path: value.strip() for path, value, _ in iter_xml_paths(io.BytesIO(text.encode('utf-8')), 'etree')}
+    source, target = values(source_text), values(target_text)
+    statuses = []
+    for path, source_value in source.items():
+        target_value = target.get(path, '')
+        status = ('match' if source_value == target_value else 'target_only' if not source_value
+                  else 'source_only' if not target_value else 'different')
+        statuses.append((path, status))
+    statuses.extend((path, 'target_only' if value else 'match') for path, value in target.items() if path not in source)
+    return statuses
+
+
+def test_paths_are_looked_up_without_rendering_every_path():
+    source = flatten('<r xmlns:n="http://x/y"><a id="1">x</a><a>y</a><n:b>z</n:b></r>')
+    target = flatten('<r xmlns:n="http://x/y"><a id="1">x</a><a>w</a><n:b>z</n:b><c/></r>')
+    comparison, _ = xml_diff.compare_paths(source, target)
+    paths = comparison.paths()
+
+    assert paths == ['r[1]/a[1]/@id', 'r[1]/a[1]', 'r[1]/a[2]', 'r[1]/{http://x/y}b[1]', 'r[1]/c[1]']
+    for index, path in enumerate(paths):
+        assert comparison.select(path=path).tolist() == [index]
+    assert comparison.select(path='r[1]/a[2]', status='different').tolist() == [2]
+    assert comparison.select(path='r[1]/a[3]').tolist() == []
+    assert comparison.select(path='r[1]/a').tolist() == []
+    assert [entry['column'] for entry in comparison.entries([4, 0])] == ['r[1]/c[1]', 'r[1]/a[1]/@id']
+
+
+def test_hashed_matching_agrees_with_plain_path_comparison():
+    rng = random.Random(0)
+    skipped = 0
+    for _ in range(100):
+        document = ['r', {}, '', [random_element(rng, 1) for _ in range(rng.randint(1, 4))]]
+        source_text, target_text = render(document), render(mutated(rng, document))
+        comparison, skipped_paths = xml_diff.compare_paths(flatten(source_text), flatten(target_text))
+        skipped += skipped_paths
+
+        statuses = [xml_diff.STATUSES[status] for status in comparison.statuses.tolist()]
+        assert list(zip(comparison.paths(), statuses)) == plain_path_statuses(source_text, target_text)
+    # Most paths lie in unchanged subtrees, matched without comparing values
+    assert skipped > 0